@@ -1,34 +1,59 @@
 from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional
-import json
 import os
-from pymongo import MongoClient
-from collections import defaultdict, Counter
+
+try:
+    from .event_log import EventLog, EVENT_LOG_DIR
+    from .database import db as rollup_db
+    from . import rollups
+except ImportError:
+    from event_log import EventLog, EVENT_LOG_DIR
+    from database import db as rollup_db
+    import rollups
 
 # MongoDB connection for analytics - Made optional
 analytics_collection = None
 events_collection = None
 client = None
 
-# Only try to connect if MongoDB is explicitly configured
+# Only try to connect if MongoDB is explicitly configured; pymongo is only
+# imported in that case
 mongodb_uri = os.getenv("MONGODB_URI")
 if mongodb_uri:
-try:
+    try:
+        from pymongo import MongoClient
         client = MongoClient(mongodb_uri, serverSelectionTimeoutMS=2000)
         # Test connection
         client.admin.command('ping')
-    db = client["whf_chatbot"]
-    analytics_collection = db["analytics"]
-    events_collection = db["events"]
-    print("✅ Connected to MongoDB for analytics")
-except Exception as e:
-    print(f"❌ MongoDB analytics connection failed: {e}")
-    analytics_collection = None
-    events_collection = None
-    client = None
+        db = client["whf_chatbot"]
+        analytics_collection = db["analytics"]
+        events_collection = db["events"]
+        print("✅ Connected to MongoDB for analytics")
+    except Exception as e:
+        print(f"❌ MongoDB analytics connection failed: {e}")
+        analytics_collection = None
+        events_collection = None
+        client = None
 else:
     print("ℹ️ MongoDB not configured - using file-based analytics")
 
+def record_rollup(event_type: str, user_id: str = None, data: Dict[str, Any] = None):
+    """Fold an event into the hourly/daily rollup tables in documents.db"""
+    data = data or {}
+    conn = rollup_db._connect()
+    try:
+        rollups.record_event(
+            conn.cursor(), event_type, user_id, datetime.utcnow(),
+            success=bool(data.get("has_context", False)),
+            response_time=data.get("response_time", 0),
+            dimension=data.get("file_type", "unknown") if event_type == rollups.FILE_UPLOAD else ""
+        )
+        conn.commit()
+    except Exception as e:
+        print(f"Error updating analytics rollups: {e}")
+    finally:
+        conn.close()
+
 class AnalyticsManager:
     def __init__(self):
         self.analytics_collection = analytics_collection
@@ -49,6 +74,7 @@ class AnalyticsManager:
         
         try:
             result = self.events_collection.insert_one(event)
+            record_rollup(event_type, user_id, data)
             return str(result.inserted_id)
         except Exception as e:
             print(f"Error logging event: {e}")
@@ -81,98 +107,8 @@ class AnalyticsManager:
         if self.events_collection is None:
             return self._get_mock_stats()
         
-        try:
-            start_date = datetime.utcnow() - timedelta(days=days)
-            
-            # Pipeline for comprehensive stats
-            pipeline = [
-                {"$match": {"timestamp": {"$gte": start_date}}},
-                {
-                    "$group": {
-                        "_id": {
-                            "event_type": "$event_type",
-                            "date": {"$dateToString": {"format": "%Y-%m-%d", "date": "$timestamp"}}
-                        },
-                        "count": {"$sum": 1},
-                        "users": {"$addToSet": "$user_id"}
-                    }
-                },
-                {"$sort": {"_id.date": 1}}
-            ]
-            
-            results = list(self.events_collection.aggregate(pipeline))
-            
-            # Process results
-            stats = {
-                "total_events": 0,
-                "unique_users": set(),
-                "file_uploads": 0,
-                "queries": 0,
-                "logins": 0,
-                "daily_stats": defaultdict(lambda: {
-                    "file_uploads": 0,
-                    "queries": 0,
-                    "logins": 0,
-                    "users": set()
-                }),
-                "file_types": Counter(),
-                "query_success_rate": 0,
-                "avg_response_time": 0
-            }
-            
-            for result in results:
-                event_type = result["_id"]["event_type"]
-                date = result["_id"]["date"]
-                count = result["count"]
-                users = result["users"]
-                
-                stats["total_events"] += count
-                stats["unique_users"].update(users)
-                stats["daily_stats"][date]["users"].update(users)
-                
-                if event_type == "file_upload":
-                    stats["file_uploads"] += count
-                    stats["daily_stats"][date]["file_uploads"] += count
-                elif event_type == "query":
-                    stats["queries"] += count
-                    stats["daily_stats"][date]["queries"] += count
-                elif event_type == "login":
-                    stats["logins"] += count
-                    stats["daily_stats"][date]["logins"] += count
-            
-            # Convert sets to counts
-            stats["unique_users"] = len(stats["unique_users"])
-            for date in stats["daily_stats"]:
-                stats["daily_stats"][date]["users"] = len(stats["daily_stats"][date]["users"])
-            
-            # Get file type distribution
-            file_events = self.events_collection.find({
-                "event_type": "file_upload",
-                "timestamp": {"$gte": start_date}
-            })
-            
-            for event in file_events:
-                file_type = event.get("data", {}).get("file_type", "unknown")
-                stats["file_types"][file_type] += 1
-            
-            # Calculate query success rate
-            query_events = list(self.events_collection.find({
-                "event_type": "query",
-                "timestamp": {"$gte": start_date}
-            }))
-            
-            if query_events:
-                successful_queries = sum(1 for event in query_events if event.get("data", {}).get("has_context", False))
-                stats["query_success_rate"] = (successful_queries / len(query_events)) * 100
-                
-                response_times = [event.get("data", {}).get("response_time", 0) for event in query_events]
-                stats["avg_response_time"] = sum(response_times) / len(response_times)
-            
-            return stats
-            
-        except Exception as e:
-            print(f"Error getting dashboard stats: {e}")
-            return self._get_mock_stats()
+        # Precomputed by record_rollup as events arrive; O(days), not O(events)
+        return rollup_db.get_dashboard_stats(days)
     
     def get_user_activity(self, user_id: str, days: int = 30):
         """Get activity statistics for a specific user"""
@@ -248,39 +184,40 @@ analytics_manager = AnalyticsManager()
 
 # File-based analytics fallback
 class FileBasedAnalytics:
-    def __init__(self, file_path: str = "analytics.json"):
-        self.file_path = file_path
-        self.ensure_file_exists()
+    """Analytics events in an append-only JSONL log (see event_log.py)"""
     
-    def ensure_file_exists(self):
-        if not os.path.exists(self.file_path):
-            with open(self.file_path, 'w') as f:
-                json.dump([], f)
+    def __init__(self, file_path: str = "analytics.json", log_dir: str = os.path.join(EVENT_LOG_DIR, "analytics")):
+        self.file_path = file_path
+        self.log = EventLog(log_dir)
+        # Events written by older versions to the single JSON file
+        self.log.import_legacy_json(file_path)
     
     def log_event(self, event_type: str, user_id: str = None, data: Dict[str, Any] = None):
         try:
-            with open(self.file_path, 'r') as f:
-                events = json.load(f)
-            
-            event = {
-                "id": str(len(events) + 1),
+            now = datetime.utcnow().isoformat()
+            event_id = self.log.append({
                 "event_type": event_type,
                 "user_id": user_id,
                 "data": data or {},
-                "timestamp": datetime.utcnow().isoformat(),
-                "created_at": datetime.utcnow().isoformat()
-            }
-            
-            events.append(event)
-            
-            with open(self.file_path, 'w') as f:
-                json.dump(events, f, indent=2)
-            
-            return event["id"]
+                "timestamp": now,
+                "created_at": now
+            })
+            record_rollup(event_type, user_id, data)
+            return event_id
         except Exception as e:
             print(f"Error logging event to file: {e}")
             return None
     
+    def get_dashboard_stats(self, days: int = 30):
+        """Dashboard statistics from the rollup tables"""
+        return rollup_db.get_dashboard_stats(days)
+    
+    def get_events(self, user_id: str = None, days: int = 30, event_type: str = None):
+        """Events of the last `days` days, oldest first"""
+        start_day = (datetime.utcnow() - timedelta(days=days)).strftime("%Y-%m-%d")
+        predicate = (lambda event: event.get("event_type") == event_type) if event_type else None
+        return self.log.query(user_id=user_id, start_day=start_day, predicate=predicate)
+    
     def log_file_upload(self, user_id: str, file_name: str, file_type: str, file_size: int):
         return self.log_event("file_upload", user_id, {
             "file_name": file_name,
@@ -0,0 +1,492 @@
+# backend/ann_index.py
+#
+# Approximate nearest-neighbour index (IVF) over chunk embeddings for
+# semantic search on large corpora.
+#
+# Vectors are L2-normalised, so cosine similarity is a dot product. Once
+# ANN_MIN_TRAIN vectors are indexed, spherical k-means splits them into
+# about 4*sqrt(N) inverted lists. A query scores the centroids, scans only
+# the nprobe closest lists and ranks those candidates exactly. nprobe
+# (ANN_NPROBE) is the recall/latency knob: more lists scanned means slower
+# queries that are closer to exact search. Below the threshold there is a
+# single list and every query is exact.
+#
+# On disk the index is a manifest naming immutable pieces:
+#   seg-<id>/          vectors (float32), chunk_ids, chunk_owner, chunk_file
+#                      and the segment's rows grouped by list (list_indptr,
+#                      list_members)
+#   centroids-<id>.npy k-means centroids
+#   tomb-<id>.npy      tombstones: positions of deleted rows
+# An upload writes one new segment and a delete only writes a new tombstone
+# array. Everything live is merged back into one segment (retraining the
+# centroids if the index has doubled since k-means last ran) once
+# tombstones pass ANN_COMPACT_RATIO or there are more than ANN_MAX_SEGMENTS
+# segments. As with the sparse index, the CURRENT pointer is swapped
+# atomically, writers hold a SQLite write lock, a cache_versions counter
+# tells other workers to reload, and arrays are memory-mapped on load.
+
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+from typing import List, Optional
+
+from .shared_state import connect, bump_version, get_version
+from .sparse_index import chunk_table_signature, fetch_chunk_rows, fetch_chunk_contents
+from .llm_provider import get_llm_provider
+from .embedding_pipeline import EmbeddingPipeline, strip_chunk_header
+from .logs import get_logger, log
+
+try:
+    import numpy as np
+    numpy_available = True
+except ImportError:
+    np = None
+    numpy_available = False
+
+ANN_INDEX_DIR = os.getenv("ANN_INDEX_DIR", os.path.join("data", "ann_index"))
+# Inverted lists scanned per query
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "8"))
+# Vector count at which k-means first runs; smaller indexes search exactly
+ANN_MIN_TRAIN = int(os.getenv("ANN_MIN_TRAIN", "1024"))
+ANN_MAX_SEGMENTS = int(os.getenv("ANN_MAX_SEGMENTS", "8"))
+ANN_COMPACT_RATIO = float(os.getenv("ANN_COMPACT_RATIO", "0.2"))
+# Hits below this cosine similarity are not returned
+ANN_MIN_SIMILARITY = float(os.getenv("ANN_MIN_SIMILARITY", "0.2"))
+
+KMEANS_ITERATIONS = 10
+# k-means trains on at most this many points per list
+KMEANS_SAMPLE_PER_LIST = 256
+
+# cache_versions counter bumped on every save
+ANN_INDEX_VERSION = "ann_index"
+
+logger = get_logger("ann_index")
+
+def normalize(vectors):
+    """float32 copy of vectors scaled to unit length"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+def choose_nlist(count: int) -> int:
+    """Number of inverted lists for count vectors (at least ~39 points per list)"""
+    return max(1, min(int(4 * np.sqrt(count)), count // 39))
+
+def nearest_centroid(vectors, centroids, block: int = 8192):
+    """Index of the closest centroid for every vector"""
+    assign = np.zeros(len(vectors), dtype=np.int32)
+    if len(centroids) == 0:
+        return assign
+    for start in range(0, len(vectors), block):
+        assign[start:start + block] = np.argmax(np.asarray(vectors[start:start + block]) @ centroids.T, axis=1)
+    return assign
+
+def train_centroids(vectors, nlist: int, iterations: int = KMEANS_ITERATIONS, seed: int = 0):
+    """Spherical k-means on a sample of vectors"""
+    rng = np.random.default_rng(seed)
+    sample = vectors
+    if len(vectors) > nlist * KMEANS_SAMPLE_PER_LIST:
+        sample = vectors[np.sort(rng.choice(len(vectors), nlist * KMEANS_SAMPLE_PER_LIST, replace=False))]
+    sample = np.asarray(sample, dtype=np.float32)
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+
+    for _ in range(iterations):
+        assign = nearest_centroid(sample, centroids)
+        counts = np.bincount(assign, minlength=nlist)
+        filled = np.flatnonzero(counts)
+        # Sum each list's members with one reduceat over the sorted sample
+        starts = (np.cumsum(counts) - counts)[filled]
+        sums = np.add.reduceat(sample[np.argsort(assign, kind="stable")], starts, axis=0)
+        centroids[filled] = normalize(sums)
+        # Empty lists restart from random points
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            centroids[empty] = sample[rng.choice(len(sample), len(empty), replace=False)]
+    return centroids
+
+class Segment:
+    """One immutable batch of vectors with its rows grouped by inverted list"""
+
+    ARRAYS = ("vectors", "chunk_ids", "chunk_owner", "chunk_file", "list_indptr", "list_members")
+
+    def __init__(self, name: str, **arrays):
+        self.name = name
+        for array_name in self.ARRAYS:
+            setattr(self, array_name, arrays[array_name])
+
+    def __len__(self):
+        return len(self.chunk_ids)
+
+    @classmethod
+    def create(cls, vectors, chunk_ids, chunk_owner, chunk_file, centroids):
+        nlist = max(1, len(centroids))
+        assign = nearest_centroid(vectors, centroids)
+        list_indptr = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assign, minlength=nlist), out=list_indptr[1:])
+        return cls(
+            f"seg-{uuid.uuid4().hex}",
+            vectors=np.asarray(vectors, dtype=np.float32),
+            chunk_ids=np.asarray(chunk_ids, dtype=np.int64),
+            chunk_owner=np.asarray(chunk_owner, dtype=np.int32),
+            chunk_file=np.asarray(chunk_file, dtype=np.int32),
+            list_indptr=list_indptr,
+            list_members=np.argsort(assign, kind="stable").astype(np.int32),
+        )
+
+    def save(self, index_dir: str):
+        segment_dir = os.path.join(index_dir, self.name)
+        os.makedirs(segment_dir)
+        for array_name in self.ARRAYS:
+            np.save(os.path.join(segment_dir, f"{array_name}.npy"), np.asarray(getattr(self, array_name)))
+
+    @classmethod
+    def load(cls, index_dir: str, name: str):
+        segment_dir = os.path.join(index_dir, name)
+        return cls(name, **{
+            array_name: np.load(os.path.join(segment_dir, f"{array_name}.npy"), mmap_mode="r")
+            for array_name in cls.ARRAYS
+        })
+
+    def candidates(self, lists):
+        """Row positions in the given lists, or None for every row"""
+        if lists is None:
+            return None
+        starts = np.asarray(self.list_indptr[lists])
+        ends = np.asarray(self.list_indptr[lists + 1])
+        return np.concatenate([np.asarray(self.list_members[start:end]) for start, end in zip(starts, ends)])
+
+class ANNIndex:
+    def __init__(self, db_path: str = "documents.db", index_dir: str = ANN_INDEX_DIR, provider=None):
+        self.db_path = db_path
+        self.index_dir = index_dir
+        self._provider = provider
+        self.pipeline = EmbeddingPipeline(db_path, provider)
+        self.loaded = False
+        self.version = None
+        self._reset()
+
+    def _reset(self):
+        """Start from an empty index"""
+        self.segments: List[Segment] = []
+        self.centroids = np.zeros((0, 0), dtype=np.float32)
+        self.centroids_file = None
+        # Sorted global row positions (segment offset + row) of deleted rows
+        self.tombstones = np.zeros(0, dtype=np.int64)
+        # Code tables for the per-chunk columns, shared by all segments
+        self.owners: List[Optional[str]] = []
+        self.files: List[tuple] = []
+        self.signature = None
+        self.model = None
+        self.trained_size = 0
+
+    @property
+    def provider(self):
+        return self._provider or get_llm_provider()
+
+    @property
+    def num_chunks(self) -> int:
+        return sum(len(segment) for segment in self.segments)
+
+    @property
+    def num_live(self) -> int:
+        return self.num_chunks - len(self.tombstones)
+
+    def fetch_chunks(self, chunk_ids: List[int]):
+        """Load chunk content for the given rowids, keyed by rowid"""
+        return fetch_chunk_contents(self.db_path, chunk_ids)
+
+    def embed(self, chunks: List[str], use_cache: bool = True):
+        """Unit-length embeddings of chunk contents (metadata header stripped)"""
+        return normalize(self.pipeline.embed([strip_chunk_header(chunk) for chunk in chunks], use_cache))
+
+    # ------------------------------------------------------------------
+    # Building
+    # ------------------------------------------------------------------
+
+    def _code(self, table: list, lookup: dict, value) -> int:
+        if value not in lookup:
+            lookup[value] = len(table)
+            table.append(value)
+        return lookup[value]
+
+    def _tombstone(self, file_codes):
+        """Mark every live row of the given files deleted"""
+        if not file_codes or not self.segments:
+            return
+        positions, offset = [], 0
+        for segment in self.segments:
+            rows = np.flatnonzero(np.isin(np.asarray(segment.chunk_file), file_codes))
+            positions.append(rows.astype(np.int64) + offset)
+            offset += len(segment)
+        self.tombstones = np.union1d(self.tombstones, np.concatenate(positions)).astype(np.int64)
+
+    def _append(self, rows, vectors):
+        """Write (chunk id, filename, file_type, user_id) rows as a new segment"""
+        os.makedirs(self.index_dir, exist_ok=True)
+        if self.model is None:
+            self.model = self.provider.embedding_model
+        owner_lookup = {owner: i for i, owner in enumerate(self.owners)}
+        file_lookup = {entry: i for i, entry in enumerate(self.files)}
+        owners = [self._code(self.owners, owner_lookup, row[3]) for row in rows]
+        files = [self._code(self.files, file_lookup, (row[1], row[2])) for row in rows]
+        segment = Segment.create(vectors, [row[0] for row in rows], owners, files, self.centroids)
+        segment.save(self.index_dir)
+        self.segments.append(segment)
+        self._maybe_compact()
+
+    def _maybe_compact(self):
+        retrain = self.num_live >= ANN_MIN_TRAIN and (len(self.centroids) == 0 or self.num_live > 2 * self.trained_size)
+        if (retrain or len(self.segments) > ANN_MAX_SEGMENTS
+                or len(self.tombstones) > ANN_COMPACT_RATIO * max(1, self.num_chunks)):
+            self._compact(retrain)
+
+    def _compact(self, retrain: bool):
+        """Merge the live rows of every segment into one, retraining if asked"""
+        live = np.ones(self.num_chunks, dtype=bool)
+        live[self.tombstones] = False
+        columns = {
+            name: np.concatenate([np.asarray(getattr(segment, name)) for segment in self.segments])[live]
+            for name in ("vectors", "chunk_ids", "chunk_owner", "chunk_file")
+        }
+        if retrain and len(columns["vectors"]):
+            start = time.perf_counter()
+            nlist = choose_nlist(len(columns["vectors"]))
+            self.centroids = train_centroids(columns["vectors"], nlist)
+            self.trained_size = len(columns["vectors"])
+            self.centroids_file = f"centroids-{uuid.uuid4().hex}.npy"
+            np.save(os.path.join(self.index_dir, self.centroids_file), self.centroids)
+            log(logger, logging.INFO, "Trained ANN centroids", lists=nlist, vectors=self.trained_size,
+                seconds=round(time.perf_counter() - start, 2))
+        segment = Segment.create(columns["vectors"], columns["chunk_ids"], columns["chunk_owner"],
+                                 columns["chunk_file"], self.centroids)
+        segment.save(self.index_dir)
+        self.segments = [segment]
+        self.tombstones = np.zeros(0, dtype=np.int64)
+
+    def insert(self, rows, vectors):
+        """Add (chunk id, filename, file_type, user_id) rows with their
+        embeddings; earlier rows for the same filenames are tombstoned"""
+        if not rows:
+            return
+        vectors = normalize(vectors)
+        with self._exclusive():
+            # Re-uploads replace the previous version of the same filename
+            filenames = {row[1] for row in rows}
+            self._tombstone([i for i, (name, _) in enumerate(self.files) if name in filenames])
+            self._append(rows, vectors)
+            self.signature = chunk_table_signature(self.db_path)
+            self.save()
+
+    def build_from_database(self):
+        """Embed and index every chunk in the database"""
+        rows = fetch_chunk_rows(self.db_path)
+        vectors = self.embed([row[1] for row in rows]) if rows else None
+        with self._exclusive():
+            self._reset()
+            self.model = self.provider.embedding_model
+            if rows:
+                self._append([(row[0], row[2], row[3], row[4]) for row in rows], vectors)
+            self.signature = chunk_table_signature(self.db_path)
+            self.loaded = True
+            self.save()
+        log(logger, logging.INFO, "Built ANN index", chunks=self.num_chunks, lists=len(self.centroids),
+            model=self.model)
+
+    def add_document(self, document_id: int):
+        """Embed and index the chunks of a freshly stored document"""
+        self.ensure_loaded()
+        rows = fetch_chunk_rows(self.db_path, document_id)
+        if not rows:
+            return
+        # Embedding happens before taking the write lock
+        vectors = self.embed([row[1] for row in rows])
+        self.insert([(row[0], row[2], row[3], row[4]) for row in rows], vectors)
+
+    def remove_document(self, filename: str):
+        """Tombstone every chunk that belongs to filename"""
+        self.ensure_loaded()
+        with self._exclusive():
+            self._tombstone([i for i, (name, _) in enumerate(self.files) if name == filename])
+            self._maybe_compact()
+            self.signature = chunk_table_signature(self.db_path)
+            self.save()
+
+    def clear(self):
+        """Forget every indexed chunk"""
+        with self._exclusive():
+            self._reset()
+            self.model = self.provider.embedding_model
+            self.signature = chunk_table_signature(self.db_path)
+            self.loaded = True
+            self.save()
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    STALE_SEGMENT_SECONDS = 300
+
+    @contextmanager
+    def _exclusive(self):
+        """Serialize index writers across processes with a SQLite write lock"""
+        conn = connect(self.db_path)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            # Another worker may have saved since we last loaded
+            if get_version(self.db_path, ANN_INDEX_VERSION) != self.version:
+                self.loaded = False
+                if not self.load():
+                    self._reset()
+            yield
+            bump_version(conn, ANN_INDEX_VERSION)
+            conn.commit()
+            self.version = get_version(self.db_path, ANN_INDEX_VERSION)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def save(self):
+        """Write the tombstones and a manifest, then swap CURRENT to it"""
+        os.makedirs(self.index_dir, exist_ok=True)
+        tombstones_file = f"tomb-{uuid.uuid4().hex}.npy"
+        np.save(os.path.join(self.index_dir, tombstones_file), self.tombstones)
+        manifest = f"manifest-{uuid.uuid4().hex}.json"
+        with open(os.path.join(self.index_dir, manifest), "w", encoding="utf-8") as f:
+            json.dump({
+                "segments": [segment.name for segment in self.segments],
+                "centroids": self.centroids_file,
+                "tombstones": tombstones_file,
+                "owners": self.owners,
+                "files": self.files,
+                "signature": self.signature,
+                "model": self.model,
+                "trained_size": self.trained_size,
+            }, f, ensure_ascii=False)
+
+        pointer_tmp = os.path.join(self.index_dir, f"CURRENT.{os.getpid()}.tmp")
+        with open(pointer_tmp, "w", encoding="utf-8") as f:
+            f.write(manifest)
+        os.replace(pointer_tmp, os.path.join(self.index_dir, "CURRENT"))
+        self._remove_stale_files({manifest, tombstones_file, self.centroids_file,
+                                  *(segment.name for segment in self.segments)})
+
+    def _remove_stale_files(self, current):
+        now = time.time()
+        for name in os.listdir(self.index_dir):
+            path = os.path.join(self.index_dir, name)
+            if name.startswith(("seg-", "centroids-", "tomb-", "manifest-")) and name not in current:
+                if now - os.path.getmtime(path) > self.STALE_SEGMENT_SECONDS:
+                    if os.path.isdir(path):
+                        shutil.rmtree(path, ignore_errors=True)
+                    else:
+                        os.remove(path)
+
+    def load(self) -> bool:
+        """Memory-map the current manifest's pieces; returns False if none is usable"""
+        pointer_path = os.path.join(self.index_dir, "CURRENT")
+        if not os.path.exists(pointer_path):
+            return False
+        try:
+            version = get_version(self.db_path, ANN_INDEX_VERSION)
+            with open(pointer_path, "r", encoding="utf-8") as f:
+                manifest_path = os.path.join(self.index_dir, f.read().strip())
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            segments = [Segment.load(self.index_dir, name) for name in manifest["segments"]]
+            centroids = (np.load(os.path.join(self.index_dir, manifest["centroids"]))
+                         if manifest["centroids"] else np.zeros((0, 0), dtype=np.float32))
+            tombstones = np.load(os.path.join(self.index_dir, manifest["tombstones"]))
+        except Exception as e:
+            log(logger, logging.ERROR, "Error loading ANN index", error=str(e))
+            return False
+
+        self._reset()
+        self.segments = segments
+        self.centroids = centroids
+        self.centroids_file = manifest["centroids"]
+        self.tombstones = tombstones
+        self.owners = manifest["owners"]
+        self.files = [tuple(entry) for entry in manifest["files"]]
+        self.signature = manifest.get("signature")
+        self.model = manifest.get("model")
+        self.trained_size = manifest.get("trained_size", 0)
+        self.version = version
+        self.loaded = True
+        return True
+
+    def ensure_loaded(self):
+        """Load from disk, reloading if another worker saved a newer index and
+        rebuilding if the chunk table or the embedding model changed"""
+        if self.loaded and get_version(self.db_path, ANN_INDEX_VERSION) == self.version:
+            return
+        if (not self.load() or self.signature != chunk_table_signature(self.db_path)
+                or self.model != self.provider.embedding_model):
+            self.build_from_database()
+
+    # ------------------------------------------------------------------
+    # Querying
+    # ------------------------------------------------------------------
+
+    def search_vector(self, vector, top_k: Optional[int] = 50, user_id: Optional[str] = None,
+                      nprobe: Optional[int] = None, min_similarity: float = ANN_MIN_SIMILARITY):
+        """Return [(chunk rowid, filename, file_type, similarity)] best first"""
+        query = normalize(vector).ravel()
+        nprobe = nprobe or ANN_NPROBE
+        lists = None
+        if len(self.centroids) and nprobe < len(self.centroids):
+            lists = np.argpartition(-(self.centroids @ query), nprobe)[:nprobe]
+        owner = None
+        if user_id is not None:
+            if user_id not in self.owners:
+                return []
+            owner = self.owners.index(user_id)
+
+        scores, refs, offset = [], [], 0
+        for number, segment in enumerate(self.segments):
+            rows = segment.candidates(lists)
+            if rows is None:
+                rows = np.arange(len(segment))
+                segment_scores = np.asarray(segment.vectors) @ query
+            else:
+                segment_scores = None
+            if owner is not None:
+                rows = rows[np.asarray(segment.chunk_owner)[rows] == owner]
+            if len(self.tombstones):
+                rows = rows[~np.isin(rows + offset, self.tombstones, assume_unique=True)]
+            offset += len(segment)
+            if not len(rows):
+                continue
+            row_scores = segment_scores[rows] if segment_scores is not None else np.asarray(segment.vectors[rows]) @ query
+            scores.append(row_scores)
+            refs.append(np.stack([np.full(len(rows), number), rows], axis=1))
+        if not scores:
+            return []
+
+        scores = np.concatenate(scores)
+        refs = np.concatenate(refs)
+        matched = np.flatnonzero(scores >= min_similarity)
+        if top_k and top_k > 0 and len(matched) > top_k:
+            matched = matched[np.argpartition(scores[matched], -top_k)[-top_k:]]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+
+        results = []
+        for position in matched:
+            segment = self.segments[refs[position][0]]
+            row = refs[position][1]
+            filename, file_type = self.files[int(segment.chunk_file[row])]
+            results.append((int(segment.chunk_ids[row]), filename, file_type, float(scores[position])))
+        return results
+
+    def search(self, question: str, top_k: Optional[int] = 50, user_id: Optional[str] = None,
+               nprobe: Optional[int] = None):
+        """Embed the question and return its nearest chunks"""
+        self.ensure_loaded()
+        if self.num_live == 0:
+            return []
+        return self.search_vector(self.embed([question], use_cache=False)[0], top_k, user_id, nprobe)
@@ -1,51 +1,189 @@
 from fastapi import HTTPException, Depends, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-import jwt
 from datetime import datetime, timedelta
 import os
 from typing import Optional
 import json
-import bcrypt
 import sqlite3
+import threading
+import asyncio
+import queue
+import time
 import uuid
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from contextlib import contextmanager
+from .shared_state import connect, bump_version, read_version
 
 # JWT Configuration
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-here")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "7"))
+
+# Verified-token cache and revocation settings
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "2048"))
+TOKEN_REVOCATION_ENABLED = os.getenv("TOKEN_REVOCATION_ENABLED", "true").lower() == "true"
+REVOCATION_CHECK_SECONDS = float(os.getenv("REVOCATION_CHECK_SECONDS", "5"))
+
+# cache_versions counter in users.db bumped on every revocation
+REVOKED_TOKENS_VERSION = "revoked_tokens"
 
 security = HTTPBearer()
 
+def _unauthorized(detail: str):
+    return HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=detail)
+
+def token_id(token: str, claims: dict) -> str:
+    """Revocation key: the jti, or a hash of the token for tokens issued before jti existed"""
+    return claims.get("jti") or "sha256:" + hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+class TokenCache:
+    """Bounded LRU of verified token -> decoded claims"""
+    
+    def __init__(self, max_size: int = TOKEN_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, token: str):
+        with self._lock:
+            claims = self._entries.get(token)
+            if claims is not None:
+                self._entries.move_to_end(token)
+            return claims
+    
+    def put(self, token: str, claims: dict):
+        with self._lock:
+            self._entries[token] = claims
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def discard(self, token: str):
+        with self._lock:
+            self._entries.pop(token, None)
+
+class TokenRevocationList:
+    """Revoked token ids (token_id) stored in users.db and mirrored in memory.
+    
+    Workers reload the in-memory set when the revoked_tokens counter in
+    cache_versions changes, checking at most every REVOCATION_CHECK_SECONDS."""
+    
+    def __init__(self):
+        self._revoked = set()
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+    
+    def revoke(self, jti: str, expires_at: float):
+        if not jti:
+            return
+        with user_db_pool.connection() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO revoked_tokens (jti, expires_at) VALUES (?, ?)',
+                (jti, expires_at)
+            )
+            # Expired tokens are rejected anyway, so their rows can go
+            conn.execute('DELETE FROM revoked_tokens WHERE expires_at < ?', (time.time(),))
+            bump_version(conn, REVOKED_TOKENS_VERSION)
+            conn.commit()
+        with self._lock:
+            self._revoked.add(jti)
+    
+    def is_revoked(self, jti: str) -> bool:
+        if not TOKEN_REVOCATION_ENABLED or not jti:
+            return False
+        now = time.monotonic()
+        if now - self._checked_at >= REVOCATION_CHECK_SECONDS:
+            self._refresh(now)
+        return jti in self._revoked
+    
+    def _refresh(self, now: float):
+        with self._lock:
+            if now - self._checked_at < REVOCATION_CHECK_SECONDS:
+                return
+            with user_db_pool.connection() as conn:
+                version = read_version(conn, REVOKED_TOKENS_VERSION)
+                if version != self._version:
+                    rows = conn.execute(
+                        'SELECT jti FROM revoked_tokens WHERE expires_at >= ?', (time.time(),)
+                    ).fetchall()
+                    self._revoked = {row[0] for row in rows}
+                    self._version = version
+            self._checked_at = now
+
 class AuthManager:
     def __init__(self):
         self.secret_key = SECRET_KEY
         self.algorithm = ALGORITHM
+        self.token_cache = TokenCache()
+        self.revocation_list = TokenRevocationList()
     
-    def create_access_token(self, data: dict, expires_delta: Optional[timedelta] = None):
+    def _encode(self, data: dict, token_type: str, expire: datetime):
         to_encode = data.copy()
+        to_encode.update({"exp": expire, "type": token_type, "jti": uuid.uuid4().hex})
+        import jwt  # deferred: PyJWT pulls in cryptography
+        return jwt.encode(to_encode, self.secret_key, algorithm=self.algorithm)
+    
+    def create_access_token(self, data: dict, expires_delta: Optional[timedelta] = None):
         if expires_delta:
             expire = datetime.utcnow() + expires_delta
         else:
             expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-        
-        to_encode.update({"exp": expire})
-        encoded_jwt = jwt.encode(to_encode, self.secret_key, algorithm=self.algorithm)
-        return encoded_jwt
+        return self._encode(data, "access", expire)
     
-    def verify_token(self, token: str):
+    def create_refresh_token(self, data: dict, expires_delta: Optional[timedelta] = None):
+        expire = datetime.utcnow() + (expires_delta or timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS))
+        return self._encode(data, "refresh", expire)
+    
+    def _decode(self, token: str):
+        """Full signature check; results are memoized in token_cache"""
+        claims = self.token_cache.get(token)
+        if claims is not None:
+            return claims
+        
+        import jwt  # deferred: PyJWT pulls in cryptography
         try:
-            payload = jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
-            return payload
+            claims = jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
         except jwt.ExpiredSignatureError:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Token has expired"
-            )
-        except jwt.JWTError:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Could not validate credentials"
-            )
+            raise _unauthorized("Token has expired")
+        except jwt.InvalidTokenError:
+            raise _unauthorized("Could not validate credentials")
+        
+        self.token_cache.put(token, claims)
+        return claims
+    
+    def verify_token(self, token: str, token_type: str = "access"):
+        claims = self._decode(token)
+        
+        # Cached claims still have to honor exp
+        if claims.get("exp", 0) <= time.time():
+            self.token_cache.discard(token)
+            raise _unauthorized("Token has expired")
+        
+        # Tokens issued before refresh tokens existed carry no type and are access tokens
+        if claims.get("type", "access") != token_type:
+            raise _unauthorized("Could not validate credentials")
+        
+        if self.revocation_list.is_revoked(token_id(token, claims)):
+            raise _unauthorized("Token has been revoked")
+        
+        return dict(claims)
+    
+    def revoke_token(self, token: str, token_type: str = "access"):
+        """Revoke a token until it would have expired anyway"""
+        claims = self.verify_token(token, token_type)
+        self.revocation_list.revoke(token_id(token, claims), claims.get("exp", time.time()))
+        self.token_cache.discard(token)
+    
+    def refresh_tokens(self, refresh_token: str):
+        """Swap a refresh token for a new access/refresh pair (the old one is revoked)"""
+        claims = self.verify_token(refresh_token, token_type="refresh")
+        self.revoke_token(refresh_token, token_type="refresh")
+        data = {key: value for key, value in claims.items() if key not in ("exp", "type", "jti")}
+        return self.create_access_token(data), self.create_refresh_token(data)
 
 auth_manager = AuthManager()
 
@@ -71,10 +209,61 @@ class UserRole:
     ADMIN = "admin"
     STANDARD = "standard"
 
+def get_current_user_role(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """Role claim of the current access token (standard if the token has none)"""
+    return auth_manager.verify_token(credentials.credentials).get("role", UserRole.STANDARD)
+
 # SQLite Database for User Management
-def init_user_db():
+USERS_DB_PATH = 'users.db'
+
+# bcrypt costs ~250 ms of CPU per call, so it runs in a small thread pool
+# (bcrypt releases the GIL) instead of on the event loop
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "30"))
+LAST_LOGIN_FLUSH_SECONDS = float(os.getenv("LAST_LOGIN_FLUSH_SECONDS", "5"))
+LAST_LOGIN_BATCH_SIZE = 100
+
+class UserDBPool:
+    """Small pool of users.db connections shared by the request threads"""
+    
+    def __init__(self, db_path: str, size: int = 4):
+        self.db_path = db_path
+        self.size = size
+        self._lock = threading.Lock()
+        self._pid = None
+        self._idle = None
+    
+    def _ensure_pool(self):
+        # Forked workers must not reuse the parent's connections
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    init_user_db(self.db_path)
+                    self._idle = queue.LifoQueue()
+                    self._pid = os.getpid()
+    
+    @contextmanager
+    def connection(self):
+        self._ensure_pool()
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            # Connections move between executor threads
+            conn = connect(self.db_path, check_same_thread=False)
+        try:
+            yield conn
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            if self._idle.qsize() < self.size:
+                self._idle.put(conn)
+            else:
+                conn.close()
+
+def init_user_db(db_path: str = USERS_DB_PATH):
     """Initialize the SQLite database for user management"""
-    conn = sqlite3.connect('users.db')
+    conn = connect(db_path)
     cursor = conn.cursor()
     
     cursor.execute('''
@@ -89,22 +278,60 @@ def init_user_db():
         )
     ''')
     
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS revoked_tokens (
+            jti TEXT PRIMARY KEY,
+            expires_at REAL NOT NULL
+        )
+    ''')
+    
     conn.commit()
     conn.close()
     print("User database initialized")
 
+user_db_pool = UserDBPool(USERS_DB_PATH)
+
+_password_executor = None
+_password_executor_pid = None
+
+def get_password_executor():
+    """Bounded thread pool for bcrypt work, one per worker process"""
+    global _password_executor, _password_executor_pid
+    if _password_executor_pid != os.getpid():
+        _password_executor = ThreadPoolExecutor(
+            max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt"
+        )
+        _password_executor_pid = os.getpid()
+    return _password_executor
+
+# Short-lived cache of user rows by email. Only hits are cached so a user
+# registered by another worker is visible immediately.
+_user_cache = {}
+_user_cache_lock = threading.Lock()
+
+def invalidate_user_cache(email: str = None):
+    """Drop one cached user, or all of them"""
+    with _user_cache_lock:
+        if email is None:
+            _user_cache.clear()
+        else:
+            _user_cache.pop(email, None)
+
 def get_user_by_email(email: str):
     """Get user by email from SQLite database"""
-    conn = sqlite3.connect('users.db')
-    cursor = conn.cursor()
+    now = time.monotonic()
+    with _user_cache_lock:
+        cached = _user_cache.get(email)
+        if cached and cached[0] > now:
+            return dict(cached[1])
     
-    cursor.execute('SELECT * FROM users WHERE email = ?', (email,))
-    user = cursor.fetchone()
-    
-    conn.close()
+    with user_db_pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM users WHERE email = ?', (email,))
+        user = cursor.fetchone()
     
     if user:
-        return {
+        user = {
             'id': user[0],
             'email': user[1],
             'password_hash': user[2],
@@ -113,34 +340,80 @@ def get_user_by_email(email: str):
             'created_at': user[5],
             'last_login': user[6]
         }
+        with _user_cache_lock:
+            _user_cache[email] = (now + USER_CACHE_TTL_SECONDS, user)
+        return dict(user)
     return None
 
 def create_user(email: str, password: str, name: str, role: str = UserRole.STANDARD):
     """Create a new user in SQLite database"""
-    conn = sqlite3.connect('users.db')
-    cursor = conn.cursor()
-    
-    # Check if user already exists
-    cursor.execute('SELECT id FROM users WHERE email = ?', (email,))
-    if cursor.fetchone():
-        conn.close()
+    if get_user_by_email(email):
         return None
     
     # Hash password
+    import bcrypt
     password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
     
     # Create user
     user_id = str(uuid.uuid4())
-    cursor.execute('''
-        INSERT INTO users (id, email, password_hash, name, role)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (user_id, email, password_hash, name, role))
-    
-    conn.commit()
-    conn.close()
+    with user_db_pool.connection() as conn:
+        try:
+            conn.execute('''
+                INSERT INTO users (id, email, password_hash, name, role)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (user_id, email, password_hash, name, role))
+            conn.commit()
+        except sqlite3.IntegrityError:
+            # Registered concurrently by another request
+            conn.rollback()
+            return None
     
+    invalidate_user_cache(email)
     return user_id
 
+class LastLoginBatcher:
+    """Collects last_login timestamps and writes them in one transaction"""
+    
+    def __init__(self, flush_seconds: float = LAST_LOGIN_FLUSH_SECONDS, batch_size: int = LAST_LOGIN_BATCH_SIZE):
+        self.flush_seconds = flush_seconds
+        self.batch_size = batch_size
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._timer = None
+    
+    def record(self, email: str):
+        timestamp = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        with self._lock:
+            self._pending[email] = timestamp
+            flush_now = len(self._pending) >= self.batch_size
+            if not flush_now and self._timer is None:
+                self._timer = threading.Timer(self.flush_seconds, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if flush_now:
+            self.flush()
+    
+    def flush(self):
+        """Write all pending last_login updates"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not pending:
+            return
+        try:
+            with user_db_pool.connection() as conn:
+                conn.executemany(
+                    'UPDATE users SET last_login = ? WHERE email = ?',
+                    [(timestamp, email) for email, timestamp in pending.items()]
+                )
+                conn.commit()
+        except Exception as e:
+            print(f"Error writing last_login batch: {e}")
+
+last_login_batcher = LastLoginBatcher()
+
 def verify_user_credentials(email: str, password: str):
     """Verify user credentials and return user data if valid"""
     user = get_user_by_email(email)
@@ -148,6 +421,7 @@ def verify_user_credentials(email: str, password: str):
         return None
     
     try:
+        import bcrypt
         # Verify password - handle both string and bytes formats
         password_bytes = password.encode('utf-8')
         stored_hash = user['password_hash']
@@ -160,12 +434,8 @@ def verify_user_credentials(email: str, password: str):
             hash_bytes = stored_hash.encode('utf-8')
         
         if bcrypt.checkpw(password_bytes, hash_bytes):
-            # Update last login
-            conn = sqlite3.connect('users.db')
-            cursor = conn.cursor()
-            cursor.execute('UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE email = ?', (email,))
-            conn.commit()
-            conn.close()
+            # Update last login (written in batches)
+            last_login_batcher.record(email)
             return user
     except Exception as e:
         print(f"Password verification error: {e}")
@@ -173,5 +443,12 @@ def verify_user_credentials(email: str, password: str):
     
     return None
 
-# Initialize database on import
-init_user_db() 
\ No newline at end of file
+async def verify_user_credentials_async(email: str, password: str):
+    """verify_user_credentials on the bcrypt pool, without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_password_executor(), verify_user_credentials, email, password)
+
+async def create_user_async(email: str, password: str, name: str, role: str = UserRole.STANDARD):
+    """create_user on the bcrypt pool, without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_password_executor(), create_user, email, password, name, role)
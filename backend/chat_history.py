@@ -1,28 +1,32 @@
 from datetime import datetime
 from typing import List, Optional, Dict, Any
-import json
 import os
-from pymongo import MongoClient
-from bson import ObjectId
+
+try:
+    from .event_log import EventLog, EVENT_LOG_DIR
+except ImportError:
+    from event_log import EventLog, EVENT_LOG_DIR
 
 # MongoDB connection - Made optional
 chat_history_collection = None
 client = None
 
-# Only try to connect if MongoDB is explicitly configured
+# Only try to connect if MongoDB is explicitly configured; pymongo is only
+# imported in that case
 mongodb_uri = os.getenv("MONGODB_URI")
 if mongodb_uri:
-try:
+    try:
+        from pymongo import MongoClient
         client = MongoClient(mongodb_uri, serverSelectionTimeoutMS=2000)
         # Test connection
         client.admin.command('ping')
-    db = client["whf_chatbot"]
-    chat_history_collection = db["chat_history"]
-    print("✅ Connected to MongoDB")
-except Exception as e:
-    print(f"❌ MongoDB connection failed: {e}")
-    chat_history_collection = None
-    client = None
+        db = client["whf_chatbot"]
+        chat_history_collection = db["chat_history"]
+        print("✅ Connected to MongoDB")
+    except Exception as e:
+        print(f"❌ MongoDB connection failed: {e}")
+        chat_history_collection = None
+        client = None
 else:
     print("ℹ️ MongoDB not configured - using file-based chat history")
 
@@ -147,50 +151,35 @@ chat_history_manager = ChatHistoryManager()
 
 # Fallback to file-based storage if MongoDB is not available
 class FileBasedChatHistory:
-    def __init__(self, file_path: str = "chat_history.json"):
-        self.file_path = file_path
-        self.ensure_file_exists()
+    """Chat history in an append-only JSONL log (see event_log.py)"""
     
-    def ensure_file_exists(self):
-        if not os.path.exists(self.file_path):
-            with open(self.file_path, 'w') as f:
-                json.dump([], f)
+    def __init__(self, file_path: str = "chat_history.json", log_dir: str = os.path.join(EVENT_LOG_DIR, "chat_history")):
+        self.file_path = file_path
+        self.log = EventLog(log_dir)
+        # Chats written by older versions to the single JSON file
+        self.log.import_legacy_json(file_path)
     
     def store_chat(self, user_id: str, question: str, answer: str, 
                    source_files: List[str] = None, metadata: Dict[str, Any] = None):
         try:
-            with open(self.file_path, 'r') as f:
-                history = json.load(f)
-            
-            chat_entry = {
-                "id": str(len(history) + 1),
+            now = datetime.utcnow().isoformat()
+            return self.log.append({
                 "user_id": user_id,
                 "question": question,
                 "answer": answer,
                 "source_files": source_files or [],
                 "metadata": metadata or {},
-                "timestamp": datetime.utcnow().isoformat(),
-                "created_at": datetime.utcnow().isoformat()
-            }
-            
-            history.append(chat_entry)
-            
-            with open(self.file_path, 'w') as f:
-                json.dump(history, f, indent=2)
-            
-            return chat_entry["id"]
+                "timestamp": now,
+                "created_at": now
+            })
         except Exception as e:
             print(f"Error storing chat to file: {e}")
             return None
     
     def get_user_history(self, user_id: str, limit: int = 50, offset: int = 0):
         try:
-            with open(self.file_path, 'r') as f:
-                history = json.load(f)
-            
-            user_history = [h for h in history if h["user_id"] == user_id]
-            user_history.sort(key=lambda x: x["timestamp"], reverse=True)
-            
+            # Newest days first, stopping as soon as the page is filled
+            user_history = self.log.query(user_id=user_id, newest_first=True, limit=offset + limit)
             return user_history[offset:offset + limit]
         except Exception as e:
             print(f"Error reading chat history: {e}")
@@ -198,14 +187,8 @@ class FileBasedChatHistory:
     
     def get_chat_context(self, user_id: str, limit: int = 10):
         try:
-            with open(self.file_path, 'r') as f:
-                history = json.load(f)
-            
-            user_history = [h for h in history if h["user_id"] == user_id]
-            user_history.sort(key=lambda x: x["timestamp"], reverse=True)
-            
             context = []
-            for doc in user_history[:limit]:
+            for doc in self.log.query(user_id=user_id, newest_first=True, limit=limit):
                 context.append({
                     "question": doc["question"],
                     "answer": doc["answer"],
@@ -1,6 +1,9 @@
 # Western Heat & Forge Company Data
 # Extracted from https://www.westernheatforge.com/
 
+import os
+import re
+
 COMPANY_DATA = {
     "company_name": "Western Heat & Forge",
     "website": "https://www.westernheatforge.com/",
@@ -116,51 +119,133 @@ def get_company_info():
     """Get formatted company information"""
     return COMPANY_DATA
 
-def search_company_data(query):
-    """Search through company data for relevant information"""
-    query_lower = query.lower()
-    results = []
-    
-    # Search in company basic info
-    if any(word in query_lower for word in ["contact", "email", "phone", "address"]):
-        results.append(f"**Contact Information:**\n📧 Email: {COMPANY_DATA['email']}\n📞 Phone: {COMPANY_DATA['phone']}\n📍 Address: {COMPANY_DATA['address']}")
-    
-    # Search in about section
-    if any(word in query_lower for word in ["about", "founded", "history", "company", "who"]):
-        about = COMPANY_DATA['about']
-        results.append(f"**About Western Heat & Forge:**\n🏢 Founded: {about['founded']}\n👥 Employees: {about['employees']}\n🌍 Exports: {about['exports']}\n📋 {about['description']}")
-    
-    # Search in services
-    if any(word in query_lower for word in ["service", "forging", "heat treatment", "machining", "coating", "cladding", "testing"]):
-        services = COMPANY_DATA['services']
-        service_list = []
-        for service_name, service_info in services.items():
-            service_list.append(f"🔧 **{service_info['name']}**: {service_info['description']}")
-        results.append("**Our Services:**\n" + "\n".join(service_list))
-    
-    # Search in products
-    if any(word in query_lower for word in ["product", "valve", "fitting", "flange", "component"]):
-        products = COMPANY_DATA['products']
-        results.append(f"**Our Products:**\n📦 Categories: {', '.join(products['categories'])}\n🏪 Specialty: {products['specialty']}")
+# ---- precompiled matcher ----
+
+# Trigger words for each response section, in the order sections are
+# returned. Triggers match anywhere in the question ("services" contains
+# "service"), as the original per-word substring checks did.
+SECTION_TRIGGERS = [
+    ("contact", ["contact", "email", "phone", "address"]),
+    ("about", ["about", "founded", "history", "company", "who"]),
+    ("services", ["service", "forging", "heat treatment", "machining", "coating", "cladding", "testing"]),
+    ("products", ["product", "valve", "fitting", "flange", "component"]),
+    ("industries", ["industry", "sector", "market"]),
+    ("certifications", ["certification", "certified", "api", "iso", "nabl"]),
+    ("customers", ["customer", "testimonial", "client", "feedback"]),
+]
+
+def render_sections():
+    """Render every response section from COMPANY_DATA"""
+    about = COMPANY_DATA['about']
+    products = COMPANY_DATA['products']
+    service_list = [f"🔧 **{info['name']}**: {info['description']}" for info in COMPANY_DATA['services'].values()]
+    testimonial_text = "**Customer Testimonials:**\n"
+    for testimonial in COMPANY_DATA['customers']['testimonials'][:2]:  # Show first 2
+        testimonial_text += f"\n💬 **{testimonial['company']}**: \"{testimonial['quote'][:150]}...\""
     
-    # Search in industries
-    if any(word in query_lower for word in ["industry", "sector", "market"]):
-        industries = COMPANY_DATA['industries']
-        results.append(f"**Industries We Serve:**\n🏭 {', '.join(industries)}")
+    return {
+        "contact": f"**Contact Information:**\n📧 Email: {COMPANY_DATA['email']}\n📞 Phone: {COMPANY_DATA['phone']}\n📍 Address: {COMPANY_DATA['address']}",
+        "about": f"**About Western Heat & Forge:**\n🏢 Founded: {about['founded']}\n👥 Employees: {about['employees']}\n🌍 Exports: {about['exports']}\n📋 {about['description']}",
+        "services": "**Our Services:**\n" + "\n".join(service_list),
+        "products": f"**Our Products:**\n📦 Categories: {', '.join(products['categories'])}\n🏪 Specialty: {products['specialty']}",
+        "industries": f"**Industries We Serve:**\n🏭 {', '.join(COMPANY_DATA['industries'])}",
+        "certifications": f"**Certifications:**\n🏆 {', '.join(COMPANY_DATA['certifications'])}",
+        "customers": testimonial_text,
+    }
+
+RENDERED_SECTIONS = render_sections()
+
+_TRIGGER_SECTION = {word: section for section, words in SECTION_TRIGGERS for word in words}
+
+def trie_pattern(words):
+    """Regex for any of words with shared prefixes factored out, so each
+    position in the question is rejected after a character or two"""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
     
-    # Search in certifications
-    if any(word in query_lower for word in ["certification", "certified", "api", "iso", "nabl"]):
-        certs = COMPANY_DATA['certifications']
-        results.append(f"**Certifications:**\n🏆 {', '.join(certs)}")
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # A word ending here may be extended by a longer one; the longest wins
+        return f"(?:{body})?" if "" in node else body
     
-    # Search in customers/testimonials
-    if any(word in query_lower for word in ["customer", "testimonial", "client", "feedback"]):
-        testimonials = COMPANY_DATA['customers']['testimonials']
-        testimonial_text = "**Customer Testimonials:**\n"
-        for i, testimonial in enumerate(testimonials[:2], 1):  # Show first 2
-            testimonial_text += f"\n💬 **{testimonial['company']}**: \"{testimonial['quote'][:150]}...\""
-        results.append(testimonial_text)
+    return build(trie)
+
+# The trie sits inside a lookahead, so a single scan of the question reports
+# every trigger occurrence, including overlapping ones
+_TRIGGER_RE = re.compile(f"(?=({trie_pattern(_TRIGGER_SECTION)}))")
+
+def search_company_data(query):
+    """Search through company data for relevant information"""
+    found = {_TRIGGER_SECTION[match.group(1)] for match in _TRIGGER_RE.finditer(query.lower())}
+    return [RENDERED_SECTIONS[section] for section, _ in SECTION_TRIGGERS if section in found]
+
+# ---- retrieval passages ----
+
+# Achievements, services and testimonials are also searchable as passages
+# that rank alongside document chunks in QAEngine.search_chunks
+INDEX_COMPANY_DATA = os.getenv("INDEX_COMPANY_DATA", "true").lower() == "true"
+COMPANY_SOURCE = "WHF Company Profile"
+
+# Same weights as the legacy scorer in QAEngine.search_chunks
+EXACT_MATCH_WEIGHT = 10
+PARTIAL_MATCH_WEIGHT = 5
+
+# A passage only counts when it shares a word other than these with the
+# question, otherwise "the" or "what" alone would pull it into every context
+_STOPWORDS = frozenset("""
+and are can does for from how the this was what when where which who why will with you your our
+please tell about there have has that into
+""".split())
+
+def company_passages():
+    """Plain-text passages for the achievements, services and testimonials"""
+    passages = [f"Western Heat & Forge achievement: {achievement}" for achievement in COMPANY_DATA['about']['achievements']]
+    for info in COMPANY_DATA['services'].values():
+        text = f"WHF service - {info['name']}: {info['description']}."
+        if info.get('capacity'):
+            text += f" Capacity: {info['capacity']}."
+        for field in ("types", "materials", "equipment"):
+            if info.get(field):
+                text += f" {field.capitalize()}: {', '.join(info[field])}."
+        passages.append(text)
+    for testimonial in COMPANY_DATA['customers']['testimonials']:
+        passages.append(f"Customer testimonial from {testimonial['company']}: \"{testimonial['quote']}\"")
+    return passages
+
+# (content, lowercased content, lowercased words) built once at import
+_PASSAGES = [(text, text.lower(), text.lower().split()) for text in company_passages()]
+
+def search_company_passages(question):
+    """Score the company passages the way search_chunks scores document chunks"""
+    if not INDEX_COMPANY_DATA:
+        return []
+    question_words = question.lower().split()
+    exact_words = [word for word in question_words if len(word) > 2]
+    partial_words = [word for word in question_words if len(word) > 4]
     
+    results = []
+    for content, content_lower, content_words in _PASSAGES:
+        matched = [word for word in exact_words if word in content_lower]
+        if not any(word not in _STOPWORDS for word in matched):
+            continue
+        score = EXACT_MATCH_WEIGHT * len(matched)
+        for word in partial_words:
+            for content_word in content_words:
+                if word in content_word or content_word in word:
+                    score += PARTIAL_MATCH_WEIGHT
+        results.append({
+            'content': content,
+            'filename': COMPANY_SOURCE,
+            'file_type': 'company',
+            'score': score
+        })
     return results
 
 class CompanyDataManager:
@@ -1,16 +1,51 @@
 import sqlite3
 import json
 import os
+import threading
 from datetime import datetime
+try:
+    from .shared_state import connect, bump_version
+    from . import rollups
+    from . import faq_cache
+    from . import embedding_pipeline
+    from . import language
+    from . import near_duplicates
+    from . import upload_sessions
+    from . import worker_metrics
+except ImportError:
+    # full_main.py imports this module as top-level `database`
+    from shared_state import connect, bump_version
+    import rollups
+    import faq_cache
+    import embedding_pipeline
+    import language
+    import near_duplicates
+    import upload_sessions
+    import worker_metrics
+
+# Cache counter bumped whenever documents or chunks change
+DOCUMENTS_VERSION = "documents"
+
+# Schema setup runs once per process per database file
+_schema_lock = threading.Lock()
+_initialized_paths = set()
 
 class DocumentDatabase:
     def __init__(self, db_path="documents.db"):
         self.db_path = db_path
-        self.init_database()
+    
+    def _connect(self):
+        """Open a connection, creating the schema on first use in this process"""
+        if self.db_path not in _initialized_paths:
+            with _schema_lock:
+                if self.db_path not in _initialized_paths:
+                    self.init_database()
+                    _initialized_paths.add(self.db_path)
+        return connect(self.db_path)
     
     def init_database(self):
         """Initialize the database with required tables"""
-        conn = sqlite3.connect(self.db_path)
+        conn = connect(self.db_path)
         cursor = conn.cursor()
         
         # Check if user_id column exists
@@ -35,10 +70,16 @@ class DocumentDatabase:
                 upload_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 file_type TEXT,
                 user_id TEXT,
+                content_hash TEXT,
                 UNIQUE(filename)
             )
         ''')
         
+        # Hash of the chunk texts, used to key precomputed FAQ pairs
+        cursor.execute("PRAGMA table_info(documents)")
+        if 'content_hash' not in [column[1] for column in cursor.fetchall()]:
+            cursor.execute('ALTER TABLE documents ADD COLUMN content_hash TEXT')
+        
         # Create document chunks table
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS document_chunks (
@@ -65,21 +106,39 @@ class DocumentDatabase:
             )
         ''')
         
+        # Hourly/daily analytics rollups, seeded once from existing rows
+        if rollups.create_rollup_tables(cursor):
+            rollups.backfill(cursor)
+        
+        faq_cache.create_faq_tables(cursor)
+        embedding_pipeline.create_embedding_tables(cursor)
+        near_duplicates.create_near_duplicate_tables(cursor)
+        upload_sessions.create_upload_tables(cursor)
+        worker_metrics.create_metrics_table(cursor)
+        
+        # Document language and the key linking its language versions
+        language.create_language_columns(cursor)
+        
         conn.commit()
         conn.close()
     
-    def add_document(self, filename, file_path, file_size, file_type, user_id=None):
-        """Add a new document to the database"""
-        conn = sqlite3.connect(self.db_path)
+    def add_document(self, filename, file_path, file_size, file_type, user_id=None, language_code=None,
+                     record_upload=True):
+        """Add a new document to the database (record_upload=False when re-writing the row of a counted upload)"""
+        conn = self._connect()
         cursor = conn.cursor()
         
         try:
             cursor.execute('''
-                INSERT OR REPLACE INTO documents (filename, file_path, file_size, file_type, upload_time, user_id)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (filename, file_path, file_size, file_type, datetime.now(), user_id))
+                INSERT OR REPLACE INTO documents (filename, file_path, file_size, file_type, upload_time, user_id,
+                                                  language, variant_key)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (filename, file_path, file_size, file_type, datetime.now(), user_id,
+                  language_code or language.ENGLISH, language.variant_key(filename)))
             
             document_id = cursor.lastrowid
+            if record_upload:
+                rollups.record_event(cursor, rollups.FILE_UPLOAD, user_id, datetime.utcnow(), dimension=file_type or "unknown")
             conn.commit()
             return document_id
         except Exception as e:
@@ -90,7 +149,7 @@ class DocumentDatabase:
     
     def add_chunks(self, document_id, chunks):
         """Add document chunks to the database"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         try:
@@ -100,6 +159,9 @@ class DocumentDatabase:
                     VALUES (?, ?, ?, ?)
                 ''', (document_id, i, chunk, len(chunk)))
             
+            cursor.execute('UPDATE documents SET content_hash = ? WHERE id = ?',
+                           (faq_cache.content_hash(chunks), document_id))
+            bump_version(conn, DOCUMENTS_VERSION)
             conn.commit()
         except Exception as e:
             print(f"Error adding chunks: {e}")
@@ -108,7 +170,7 @@ class DocumentDatabase:
     
     def get_all_chunks(self):
         """Get all document chunks for searching"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         try:
@@ -136,7 +198,7 @@ class DocumentDatabase:
     
     def store_chat_history(self, chat_entry):
         """Store chat history entry"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         try:
@@ -152,6 +214,10 @@ class DocumentDatabase:
                 chat_entry["has_context"],
                 chat_entry["response_time"]
             ))
+            rollups.record_event(
+                cursor, rollups.QUERY, chat_entry["user_id"], chat_entry["timestamp"],
+                success=bool(chat_entry["has_context"]), response_time=chat_entry["response_time"]
+            )
             
             conn.commit()
             return True
@@ -163,7 +229,7 @@ class DocumentDatabase:
     
     def get_chat_history(self, user_id, limit=50, offset=0):
         """Get user's chat history"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         try:
@@ -193,13 +259,49 @@ class DocumentDatabase:
         finally:
             conn.close()
     
+    def get_chat_history_range(self, user_id, start_date=None, end_date=None, limit=None):
+        """User's chat history between two dates (YYYY-MM-DD, inclusive), oldest first"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        try:
+            query = 'SELECT question, answer, source_files, timestamp, has_context, response_time FROM chat_history WHERE user_id = ?'
+            params = [user_id]
+            if start_date:
+                query += ' AND timestamp >= ?'
+                params.append(start_date)
+            if end_date:
+                # Timestamps are ISO strings, so everything on end_date sorts before its next character
+                query += ' AND timestamp < ?'
+                params.append(end_date + '\uffff')
+            query += ' ORDER BY timestamp ASC'
+            if limit:
+                query += ' LIMIT ?'
+                params.append(limit)
+            cursor.execute(query, params)
+            
+            return [{
+                "question": row[0],
+                "answer": row[1],
+                "source_files": json.loads(row[2]) if row[2] else [],
+                "timestamp": row[3],
+                "has_context": row[4],
+                "response_time": row[5]
+            } for row in cursor.fetchall()]
+        except Exception as e:
+            print(f"Error getting chat history range: {e}")
+            return []
+        finally:
+            conn.close()
+    
     def clear_chat_history(self, user_id):
         """Clear user's chat history"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         try:
             cursor.execute('DELETE FROM chat_history WHERE user_id = ?', (user_id,))
+            rollups.remove_user_events(cursor, user_id, rollups.QUERY)
             conn.commit()
             return True
         except Exception as e:
@@ -210,7 +312,7 @@ class DocumentDatabase:
 
     def init_chat_sessions_tables(self):
         """Initialize chat sessions tables"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         try:
@@ -247,7 +349,7 @@ class DocumentDatabase:
     def get_chat_sessions(self, user_id):
         """Get all chat sessions for a user"""
         self.init_chat_sessions_tables()
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         try:
@@ -299,7 +401,7 @@ class DocumentDatabase:
     def save_chat_session(self, session_id, user_id, title, messages):
         """Save or update a chat session"""
         self.init_chat_sessions_tables()
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         try:
@@ -341,10 +443,36 @@ class DocumentDatabase:
         finally:
             conn.close()
 
+    def get_chat_session(self, session_id, user_id):
+        """One of the user's chat sessions with its messages, or None"""
+        self.init_chat_sessions_tables()
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute('SELECT title, created_at FROM chat_sessions WHERE id = ? AND user_id = ?', (session_id, user_id))
+            row = cursor.fetchone()
+            if not row:
+                return None
+            
+            cursor.execute('''
+                SELECT role, content, timestamp
+                FROM chat_messages
+                WHERE session_id = ?
+                ORDER BY timestamp ASC, id ASC
+            ''', (session_id,))
+            messages = [{"role": r[0], "content": r[1], "timestamp": r[2]} for r in cursor.fetchall()]
+            return {"id": session_id, "title": row[0], "created_at": row[1], "messages": messages}
+        except Exception as e:
+            print(f"Error getting chat session: {e}")
+            return None
+        finally:
+            conn.close()
+    
     def delete_chat_session(self, session_id, user_id):
         """Delete a chat session and its messages"""
         self.init_chat_sessions_tables()
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         try:
@@ -362,7 +490,7 @@ class DocumentDatabase:
     
     def get_user_stats(self, user_id):
         """Get user's analytics statistics"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         try:
@@ -370,17 +498,9 @@ class DocumentDatabase:
             cursor.execute('SELECT COUNT(*) FROM documents WHERE user_id = ?', (user_id,))
             doc_count = cursor.fetchone()[0]
             
-            # Get chat count
-            cursor.execute('SELECT COUNT(*) FROM chat_history WHERE user_id = ?', (user_id,))
-            chat_count = cursor.fetchone()[0]
-            
-            # Get successful answers count
-            cursor.execute('SELECT COUNT(*) FROM chat_history WHERE user_id = ? AND has_context = 1', (user_id,))
-            success_count = cursor.fetchone()[0]
-            
-            # Get average response time
-            cursor.execute('SELECT AVG(response_time) FROM chat_history WHERE user_id = ?', (user_id,))
-            avg_response = cursor.fetchone()[0] or 0
+            # Chat count, successful answers and latency come from the daily rollups
+            chat_count, success_count, response_time_sum = rollups.user_totals(conn, user_id, rollups.QUERY)
+            avg_response = response_time_sum / chat_count if chat_count else 0
             
             return {
                 "total_documents": doc_count,
@@ -401,9 +521,33 @@ class DocumentDatabase:
         finally:
             conn.close()
     
+    def record_event(self, event_type, user_id=None):
+        """Count an event that has no table of its own (e.g. logins) in the rollups"""
+        conn = self._connect()
+        
+        try:
+            rollups.record_event(conn.cursor(), event_type, user_id, datetime.utcnow())
+            conn.commit()
+        except Exception as e:
+            print(f"Error recording {event_type} event: {e}")
+        finally:
+            conn.close()
+
+    def get_dashboard_stats(self, days=30, user_id=None):
+        """Dashboard aggregates for the last `days` days from the rollup table"""
+        conn = self._connect()
+        
+        try:
+            return rollups.dashboard_stats(conn, days, user_id)
+        except Exception as e:
+            print(f"Error getting dashboard stats: {e}")
+            return rollups.empty_stats()
+        finally:
+            conn.close()
+
     def get_documents(self, user_id=None):
         """Get list of all uploaded documents (optionally filtered by user)"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         try:
@@ -440,7 +584,7 @@ class DocumentDatabase:
     
     def delete_document(self, filename):
         """Delete a document and its chunks"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         try:
@@ -457,6 +601,7 @@ class DocumentDatabase:
                 # Delete document
                 cursor.execute('DELETE FROM documents WHERE id = ?', (document_id,))
                 
+                bump_version(conn, DOCUMENTS_VERSION)
                 conn.commit()
                 return True
             return False
@@ -468,12 +613,13 @@ class DocumentDatabase:
     
     def clear_all(self):
         """Clear all documents and chunks"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         try:
             cursor.execute('DELETE FROM document_chunks')
             cursor.execute('DELETE FROM documents')
+            bump_version(conn, DOCUMENTS_VERSION)
             conn.commit()
             return True
         except Exception as e:
@@ -482,7 +628,7 @@ class DocumentDatabase:
         finally:
             conn.close()
 
-# Global database instance
+# Global database instance (no I/O until first use)
 db = DocumentDatabase()
 
 class DatabaseManager:
@@ -502,7 +648,7 @@ class DatabaseManager:
         return self.db.delete_document(filename)
     
     def store_document(self, filename, size, user_id):
-        """Store document information"""
+        """Store document information; this is where an upload is counted in the rollups"""
         file_type = filename.split(".")[-1].lower() if "." in filename else "unknown"
         return self.db.add_document(filename, f"/uploads/{filename}", size, file_type, user_id)
     
@@ -530,10 +676,26 @@ class DatabaseManager:
         """Delete a chat session"""
         return self.db.delete_chat_session(session_id, user_id)
     
+    def get_chat_session(self, session_id, user_id):
+        """Get one of the user's chat sessions with its messages"""
+        return self.db.get_chat_session(session_id, user_id)
+    
+    def get_chat_history_range(self, user_id, start_date=None, end_date=None, limit=None):
+        """Get user's chat history between two dates, oldest first"""
+        return self.db.get_chat_history_range(user_id, start_date, end_date, limit)
+    
     def clear_chat_history(self, user_id):
         """Clear user's chat history"""
         return self.db.clear_chat_history(user_id)
     
     def get_user_stats(self, user_id):
         """Get user's analytics statistics"""
-        return self.db.get_user_stats(user_id) 
\ No newline at end of file
+        return self.db.get_user_stats(user_id)
+
+    def get_dashboard_stats(self, days=30, user_id=None):
+        """Get precomputed dashboard statistics"""
+        return self.db.get_dashboard_stats(days, user_id)
+
+    def record_login(self, user_id):
+        """Count a login in the analytics rollups"""
+        return self.db.record_event(rollups.LOGIN, user_id) 
\ No newline at end of file
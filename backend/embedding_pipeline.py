@@ -0,0 +1,232 @@
+# backend/embedding_pipeline.py
+#
+# Chunk embeddings for semantic search, computed once per distinct text.
+#
+# Every text is keyed by the SHA-256 of its content (chunk metadata header
+# stripped, so the same paragraph in two files or two uploads of a file
+# share a key). Keys already in the chunk_embeddings table are served from
+# there. The rest are grouped into large requests (EMBED_BATCH_SIZE texts,
+# at most EMBED_BATCH_TOKENS tokens) that run EMBED_CONCURRENCY at a time,
+# throttled by request and token buckets (EMBED_REQUESTS_PER_MINUTE,
+# EMBED_TOKENS_PER_MINUTE) and retried with backoff. New vectors are stored
+# as float16 blobs, half the size of float32, which is plenty for cosine
+# ranking.
+#
+# QAEngine.process_file runs this as its own stage before the DB write, so
+# the ANN index finds every vector in the cache when it indexes the upload.
+
+import hashlib
+import logging
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+try:
+    from .shared_state import connect
+    from .llm_provider import get_llm_provider, estimate_tokens
+    from .logs import get_logger, log
+except ImportError:
+    from shared_state import connect
+    from llm_provider import get_llm_provider, estimate_tokens
+    from logs import get_logger, log
+
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "256"))
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", "100000"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_REQUESTS_PER_MINUTE = float(os.getenv("EMBED_REQUESTS_PER_MINUTE", "3000"))
+EMBED_TOKENS_PER_MINUTE = float(os.getenv("EMBED_TOKENS_PER_MINUTE", "1000000"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "3"))
+
+logger = get_logger("embeddings")
+
+# Metadata lines chunk_text_enhanced puts in front of every chunk; they help
+# retrieval but are only noise once the chunk is grouped under its filename
+CHUNK_HEADER = re.compile(r"\AFILE: [^\n]*\nTYPE: [^\n]*\n(?:CONTENT:|SECTION:|SECTION_PART: \d+)\n")
+
+def strip_chunk_header(chunk: str) -> str:
+    return CHUNK_HEADER.sub("", chunk)
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def create_embedding_tables(cursor):
+    """Create the embedding cache table (caller commits)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS chunk_embeddings (
+            text_hash TEXT NOT NULL,
+            model TEXT NOT NULL,
+            dim INTEGER NOT NULL,
+            vector BLOB NOT NULL,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (text_hash, model)
+        )
+    ''')
+
+class RateLimiter:
+    """Thread-safe token bucket refilled at per_minute / 60 per second"""
+
+    def __init__(self, per_minute: float, burst_seconds: float = 10.0):
+        self.rate = per_minute / 60
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.available = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, amount: float = 1.0):
+        """Block until amount can be taken; oversized requests wait for a full bucket"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+                self.updated = now
+                needed = min(amount, self.capacity)
+                if self.available >= needed:
+                    self.available -= amount
+                    return
+                wait = (needed - self.available) / self.rate
+            time.sleep(wait)
+
+class EmbeddingCache:
+    """float16 vectors keyed by (text hash, model) in one SQLite table"""
+
+    def __init__(self, db_path: str = "documents.db"):
+        self.db_path = db_path
+        self._ready = False
+
+    def _connect(self):
+        conn = connect(self.db_path)
+        if not self._ready:
+            create_embedding_tables(conn.cursor())
+            conn.commit()
+            self._ready = True
+        return conn
+
+    def get_many(self, hashes: List[str], model: str) -> Dict[str, "np.ndarray"]:
+        import numpy as np
+
+        found = {}
+        conn = self._connect()
+        try:
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(hashes), 500):
+                part = hashes[start:start + 500]
+                placeholders = ",".join("?" for _ in part)
+                rows = conn.execute(f'''
+                    SELECT text_hash, vector FROM chunk_embeddings
+                    WHERE model = ? AND text_hash IN ({placeholders})
+                ''', [model, *part]).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float16).astype(np.float32)
+        finally:
+            conn.close()
+        return found
+
+    def put_many(self, vectors: Dict[str, "np.ndarray"], model: str):
+        import numpy as np
+
+        if not vectors:
+            return
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.executemany('''
+                INSERT OR REPLACE INTO chunk_embeddings (text_hash, model, dim, vector, created_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [(key, model, len(vector), np.asarray(vector, dtype=np.float16).tobytes(), now)
+                  for key, vector in vectors.items()])
+            conn.commit()
+        finally:
+            conn.close()
+
+class EmbeddingPipeline:
+    """Batched, concurrent, rate-limited embedding with a content-hash cache"""
+
+    def __init__(self, db_path: str = "documents.db", provider=None):
+        self.cache = EmbeddingCache(db_path)
+        self._provider = provider
+        self.request_limiter = RateLimiter(EMBED_REQUESTS_PER_MINUTE)
+        self.token_limiter = RateLimiter(EMBED_TOKENS_PER_MINUTE)
+        self.stats_lock = threading.Lock()
+        self.stats = {"texts": 0, "cached": 0, "computed": 0, "requests": 0, "retries": 0}
+
+    @property
+    def provider(self):
+        return self._provider or get_llm_provider()
+
+    def batches(self, items):
+        """Group (key, text) items into requests bounded by count and tokens"""
+        batch, tokens = [], 0
+        for key, text in items:
+            text_tokens = estimate_tokens(text)
+            if batch and (len(batch) >= EMBED_BATCH_SIZE or tokens + text_tokens > EMBED_BATCH_TOKENS):
+                yield batch
+                batch, tokens = [], 0
+            batch.append((key, text))
+            tokens += text_tokens
+        if batch:
+            yield batch
+
+    def _embed_batch(self, batch):
+        """One provider request, throttled and retried; returns {key: vector}"""
+        texts = [text for _, text in batch]
+        tokens = sum(estimate_tokens(text) for text in texts)
+        for attempt in range(EMBED_MAX_RETRIES + 1):
+            self.request_limiter.acquire()
+            self.token_limiter.acquire(tokens)
+            try:
+                vectors = self.provider.embed(texts)
+                with self.stats_lock:
+                    self.stats["requests"] += 1
+                return {key: vector for (key, _), vector in zip(batch, vectors)}
+            except Exception as e:
+                if attempt == EMBED_MAX_RETRIES:
+                    raise
+                with self.stats_lock:
+                    self.stats["retries"] += 1
+                delay = min(30.0, 0.5 * 2 ** attempt) * random.uniform(0.5, 1.5)
+                log(logger, logging.WARNING, "Embedding request failed, retrying", attempt=attempt + 1,
+                    texts=len(texts), delay=round(delay, 2), error=str(e))
+                time.sleep(delay)
+
+    def embed(self, texts: List[str], use_cache: bool = True):
+        """float32 matrix with one row per text, in order"""
+        import numpy as np
+
+        start = time.perf_counter()
+        model = self.provider.embedding_model
+        keys = [text_hash(text) for text in texts]
+        unique = dict(zip(keys, texts))
+        vectors = self.cache.get_many(list(unique), model) if use_cache else {}
+        cached = len(vectors)
+        missing = [(key, text) for key, text in unique.items() if key not in vectors]
+
+        computed = {}
+        if missing:
+            batches = list(self.batches(missing))
+            if len(batches) == 1 or EMBED_CONCURRENCY <= 1:
+                for batch in batches:
+                    computed.update(self._embed_batch(batch))
+            else:
+                with ThreadPoolExecutor(max_workers=min(EMBED_CONCURRENCY, len(batches)),
+                                        thread_name_prefix="embed") as pool:
+                    for result in pool.map(self._embed_batch, batches):
+                        computed.update(result)
+            computed = {key: np.asarray(vector, dtype=np.float32) for key, vector in computed.items()}
+            if use_cache:
+                self.cache.put_many(computed, model)
+            vectors.update(computed)
+
+        with self.stats_lock:
+            self.stats["texts"] += len(texts)
+            self.stats["cached"] += cached
+            self.stats["computed"] += len(computed)
+        if use_cache and texts:
+            log(logger, logging.INFO, "Embedded texts", texts=len(texts), unique=len(unique), cached=cached,
+                computed=len(computed), seconds=round(time.perf_counter() - start, 3))
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack([vectors[key] for key in keys])
@@ -0,0 +1,364 @@
+# backend/event_log.py
+#
+# Append-only JSONL event log used by the file-based analytics and chat
+# history stores instead of rewriting one big JSON array per event.
+#
+# Layout of a log directory:
+#   segments/<day>.<pid>.<seq>.active.jsonl   segment a worker is appending to
+#   segments/<day>.<pid>.<seq>.jsonl          sealed segment (rotated by size/age)
+#   days/<day>.<generation>.jsonl             compacted events of one day, sorted by user
+#   days/<day>.idx.json                       data file name + {user_id: [offset, length]}
+#
+# Writers buffer records in memory and a flusher thread appends them to the
+# worker's own segment with one write + fsync per batch, so concurrent
+# workers never share a file. A background compactor merges sealed segments
+# into the per-day files; reads for a user go straight to that user's byte
+# range in each day file and only scan the few recent, not yet compacted
+# segments.
+
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+EVENT_LOG_DIR = os.getenv("EVENT_LOG_DIR", os.path.join("data", "events"))
+FLUSH_INTERVAL_SECONDS = float(os.getenv("EVENT_LOG_FLUSH_SECONDS", "0.5"))
+FLUSH_BATCH_SIZE = 256
+SEGMENT_MAX_BYTES = int(os.getenv("EVENT_LOG_SEGMENT_BYTES", str(4 * 1024 * 1024)))
+SEGMENT_MAX_AGE_SECONDS = float(os.getenv("EVENT_LOG_SEGMENT_AGE_SECONDS", "300"))
+COMPACT_INTERVAL_SECONDS = float(os.getenv("EVENT_LOG_COMPACT_SECONDS", "60"))
+# An active segment nobody has written to for this long belongs to a dead worker
+STALE_SEGMENT_SECONDS = 3600
+STALE_LOCK_SECONDS = 600
+# Replaced day files stay readable this long for readers holding the old index
+OLD_GENERATION_GRACE_SECONDS = 300
+
+ACTIVE_SUFFIX = ".active.jsonl"
+SEALED_SUFFIX = ".jsonl"
+
+def _day_of(record: Dict[str, Any]) -> str:
+    return str(record.get("timestamp", ""))[:10] or datetime.utcnow().strftime("%Y-%m-%d")
+
+def _read_lines(path: str, offset: int = 0, length: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """Yield the JSON records in a byte range of a file, skipping torn lines"""
+    try:
+        with open(path, "rb") as f:
+            f.seek(offset)
+            data = f.read() if length is None else f.read(length)
+    except FileNotFoundError:
+        return
+    for line in data.splitlines():
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            continue  # partially written tail of an active segment
+
+class EventLog:
+    """Append-only, fsync-batched JSONL log partitioned by day and indexed by user"""
+
+    def __init__(self, log_dir: str, background: bool = True):
+        self.log_dir = log_dir
+        self.segment_dir = os.path.join(log_dir, "segments")
+        self.day_dir = os.path.join(log_dir, "days")
+        os.makedirs(self.segment_dir, exist_ok=True)
+        os.makedirs(self.day_dir, exist_ok=True)
+
+        self._buffer: List[Dict[str, Any]] = []
+        self._buffer_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wakeup = threading.Event()
+
+        # Active segment of this process: (day, path, file, created_at)
+        self._segment = None
+        self._segment_pid = None
+        self._seq = 0
+
+        self._background = background
+        self._threads_pid = None
+
+    # ---- writing -------------------------------------------------------
+
+    def append(self, record: Dict[str, Any]) -> str:
+        """Queue a record for the next flush and return its id"""
+        record = dict(record)
+        record.setdefault("id", uuid.uuid4().hex)
+        record.setdefault("timestamp", datetime.utcnow().isoformat())
+        with self._buffer_lock:
+            self._buffer.append(record)
+            flush_now = len(self._buffer) >= FLUSH_BATCH_SIZE
+        self._ensure_threads()
+        if not self._background:
+            self.flush()
+        elif flush_now:
+            self._wakeup.set()
+        return record["id"]
+
+    def flush(self):
+        """Write and fsync everything buffered so far"""
+        with self._buffer_lock:
+            pending, self._buffer = self._buffer, []
+        if not pending:
+            return
+        with self._write_lock:
+            by_day: Dict[str, List[bytes]] = {}
+            for record in pending:
+                line = json.dumps(record, default=str, ensure_ascii=False) + "\n"
+                by_day.setdefault(_day_of(record), []).append(line.encode("utf-8"))
+            for day, lines in by_day.items():
+                f = self._segment_for(day)
+                f.write(b"".join(lines))
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _segment_for(self, day: str):
+        """Return the open active segment for `day`, rotating when needed"""
+        if self._segment_pid != os.getpid():
+            # Forked child: the parent's segment is not ours to append to
+            self._segment = None
+            self._segment_pid = os.getpid()
+
+        if self._segment is not None:
+            seg_day, path, f, created_at = self._segment
+            if (seg_day != day or f.tell() >= SEGMENT_MAX_BYTES
+                    or time.time() - created_at >= SEGMENT_MAX_AGE_SECONDS):
+                self._seal()
+
+        if self._segment is None:
+            self._seq += 1
+            name = f"{day}.{os.getpid()}.{int(time.time() * 1000)}-{self._seq}{ACTIVE_SUFFIX}"
+            path = os.path.join(self.segment_dir, name)
+            self._segment = (day, path, open(path, "ab"), time.time())
+        return self._segment[2]
+
+    def _seal(self):
+        """Close the active segment and rename it so the compactor picks it up"""
+        if self._segment is None:
+            return
+        _, path, f, _ = self._segment
+        self._segment = None
+        f.close()
+        try:
+            os.replace(path, path[:-len(ACTIVE_SUFFIX)] + SEALED_SUFFIX)
+        except FileNotFoundError:
+            pass  # already compacted as a stale segment
+
+    def close(self):
+        """Flush buffered records and seal the active segment"""
+        self.flush()
+        with self._write_lock:
+            if self._segment_pid == os.getpid():
+                self._seal()
+
+    # ---- background threads --------------------------------------------
+
+    def _ensure_threads(self):
+        if not self._background or self._threads_pid == os.getpid():
+            return
+        with self._buffer_lock:
+            if self._threads_pid == os.getpid():
+                return
+            self._threads_pid = os.getpid()
+        threading.Thread(target=self._flush_loop, daemon=True, name="event-log-flush").start()
+        threading.Thread(target=self._compact_loop, daemon=True, name="event-log-compact").start()
+
+    def _flush_loop(self):
+        while True:
+            self._wakeup.wait(FLUSH_INTERVAL_SECONDS)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing event log {self.log_dir}: {e}")
+
+    def _compact_loop(self):
+        while True:
+            time.sleep(COMPACT_INTERVAL_SECONDS)
+            try:
+                # Let idle segments age out so their events get indexed
+                with self._write_lock:
+                    if (self._segment is not None and self._segment_pid == os.getpid()
+                            and time.time() - self._segment[3] >= SEGMENT_MAX_AGE_SECONDS):
+                        self._seal()
+                self.compact()
+            except Exception as e:
+                print(f"Error compacting event log {self.log_dir}: {e}")
+
+    # ---- compaction ----------------------------------------------------
+
+    def _compactable_segments(self) -> Dict[str, List[str]]:
+        """Sealed segments (plus abandoned active ones) grouped by day"""
+        by_day: Dict[str, List[str]] = {}
+        now = time.time()
+        for name in os.listdir(self.segment_dir):
+            path = os.path.join(self.segment_dir, name)
+            if name.endswith(ACTIVE_SUFFIX):
+                try:
+                    if now - os.path.getmtime(path) < STALE_SEGMENT_SECONDS:
+                        continue
+                except FileNotFoundError:
+                    continue
+            elif not name.endswith(SEALED_SUFFIX):
+                continue
+            by_day.setdefault(name.split(".", 1)[0], []).append(path)
+        return by_day
+
+    def _acquire_compaction_lock(self) -> Optional[str]:
+        """Cross-process lock file; O_EXCL works on every platform we run on"""
+        lock_path = os.path.join(self.log_dir, "compact.lock")
+        try:
+            if time.time() - os.path.getmtime(lock_path) > STALE_LOCK_SECONDS:
+                os.remove(lock_path)
+        except FileNotFoundError:
+            pass
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return lock_path
+        except FileExistsError:
+            return None
+
+    def compact(self) -> int:
+        """Merge sealed segments into the per-day files; returns segments merged"""
+        lock_path = self._acquire_compaction_lock()
+        if lock_path is None:
+            return 0
+        merged = 0
+        try:
+            for day, segments in self._compactable_segments().items():
+                self._compact_day(day, segments)
+                merged += len(segments)
+        finally:
+            os.remove(lock_path)
+        return merged
+
+    def _load_day_index(self, day: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(os.path.join(self.day_dir, f"{day}.idx.json")) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _compact_day(self, day: str, segments: List[str]):
+        index = self._load_day_index(day)
+        old_data = index["data"] if index else None
+        records = list(_read_lines(os.path.join(self.day_dir, old_data))) if old_data else []
+        for segment in segments:
+            records.extend(_read_lines(segment))
+
+        # Sorting by user makes each user's events one contiguous byte range
+        records.sort(key=lambda r: (str(r.get("user_id") or ""), str(r.get("timestamp", ""))))
+
+        data_name = f"{day}.{int(time.time() * 1000)}.jsonl"
+        users: Dict[str, List[int]] = {}
+        with open(os.path.join(self.day_dir, data_name), "wb") as f:
+            for record in records:
+                line = (json.dumps(record, default=str, ensure_ascii=False) + "\n").encode("utf-8")
+                entry = users.setdefault(str(record.get("user_id") or ""), [f.tell(), 0])
+                entry[1] += len(line)
+                f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+        # Swapping the index is the commit point: readers always see a
+        # data file together with the offsets that were computed for it
+        index_path = os.path.join(self.day_dir, f"{day}.idx.json")
+        with open(index_path + ".tmp", "w") as f:
+            json.dump({"data": data_name, "count": len(records), "users": users}, f)
+        os.replace(index_path + ".tmp", index_path)
+
+        for segment in segments:
+            try:
+                os.remove(segment)
+            except FileNotFoundError:
+                pass
+        self._remove_old_generations(day, data_name)
+
+    def _remove_old_generations(self, day: str, current: str):
+        now = time.time()
+        for name in os.listdir(self.day_dir):
+            if name.startswith(day + ".") and name.endswith(".jsonl") and name != current:
+                path = os.path.join(self.day_dir, name)
+                try:
+                    if now - os.path.getmtime(path) > OLD_GENERATION_GRACE_SECONDS:
+                        os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    # ---- reading -------------------------------------------------------
+
+    def days(self) -> List[str]:
+        """Every day that has events, oldest first"""
+        days = {name.split(".", 1)[0] for name in os.listdir(self.day_dir) if name.endswith(".idx.json")}
+        days.update(name.split(".", 1)[0] for name in os.listdir(self.segment_dir) if name.endswith(SEALED_SUFFIX))
+        return sorted(days)
+
+    def read_day(self, day: str, user_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Events of one day (optionally only one user's), unordered"""
+        self.flush()
+        records = []
+        index = self._load_day_index(day)
+        if index:
+            data_path = os.path.join(self.day_dir, index["data"])
+            if user_id is None:
+                records.extend(_read_lines(data_path))
+            else:
+                span = index["users"].get(str(user_id))
+                if span:
+                    records.extend(_read_lines(data_path, span[0], span[1]))
+
+        # Recent events that have not been compacted yet
+        seen = {record.get("id") for record in records}
+        for name in os.listdir(self.segment_dir):
+            if not name.startswith(day + ".") or not name.endswith(SEALED_SUFFIX):
+                continue
+            for record in _read_lines(os.path.join(self.segment_dir, name)):
+                # A segment can still be here right after the compactor merged it
+                if record.get("id") in seen:
+                    continue
+                if user_id is None or record.get("user_id") == user_id:
+                    records.append(record)
+        return records
+
+    def query(self, user_id: Optional[str] = None, start_day: Optional[str] = None,
+              end_day: Optional[str] = None, predicate: Optional[Callable[[Dict[str, Any]], bool]] = None,
+              newest_first: bool = False, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Events in [start_day, end_day] (YYYY-MM-DD, inclusive) sorted by timestamp"""
+        days = [day for day in self.days()
+                if (start_day is None or day >= start_day) and (end_day is None or day <= end_day)]
+        if newest_first:
+            days.reverse()
+
+        results: List[Dict[str, Any]] = []
+        for day in days:
+            records = [r for r in self.read_day(day, user_id) if predicate is None or predicate(r)]
+            records.sort(key=lambda r: str(r.get("timestamp", "")), reverse=newest_first)
+            results.extend(records)
+            # Days are visited in order, so we can stop once we have enough
+            if limit is not None and len(results) >= limit:
+                return results[:limit]
+        return results
+
+    def import_legacy_json(self, file_path: str):
+        """One-time import of a legacy JSON array file (analytics.json, chat_history.json)"""
+        marker = os.path.join(self.log_dir, "imported-" + os.path.basename(file_path))
+        if os.path.exists(marker) or not os.path.exists(file_path):
+            return
+        try:
+            with open(file_path, "r") as f:
+                records = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error importing {file_path} into event log: {e}")
+            return
+
+        with self._buffer_lock:
+            self._buffer.extend(records)
+        self.flush()
+        with self._write_lock:
+            self._seal()
+        with open(marker, "w") as f:
+            f.write(datetime.utcnow().isoformat())
+        print(f"📥 Imported {len(records)} records from {file_path} into {self.log_dir}")
@@ -1,25 +1,44 @@
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.lib import colors
-from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_JUSTIFY
+# reportlab and sendgrid are imported on first export rather than at module
+# import, so loading the API doesn't pay for them.
+#
+# Batch exports (a whole chat session or a date range of chat history) are
+# rendered in a process pool so reportlab's CPU work never runs on the event
+# loop. Each pool worker keeps one PDFExporter, so its style sheet, table
+# styles and static header/footer flowables are built once per worker
+# rather than once per PDF.
 from datetime import datetime
 import os
 import io
 from typing import Dict, List, Any, Optional
-import base64
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail, Attachment, FileContent, FileName, FileType, Disposition
+import asyncio
+import copy
 import tempfile
+import threading
+import zipfile
+from xml.sax.saxutils import escape
+try:
+    from .outbox import email_outbox, EmailNotConfigured
+except ImportError:
+    from outbox import email_outbox, EmailNotConfigured
+
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", str(min(4, os.cpu_count() or 1))))
+EXPORT_MAX_ENTRIES = int(os.getenv("EXPORT_MAX_ENTRIES", "2000"))
 
 class PDFExporter:
     def __init__(self):
+        from reportlab.lib.styles import getSampleStyleSheet
         self.styles = getSampleStyleSheet()
         self.setup_custom_styles()
+        self._table_styles = {}
+        self._logo = None
+        self._footer = None
     
     def setup_custom_styles(self):
         """Setup custom styles for WHF branding"""
+        from reportlab.lib.styles import ParagraphStyle
+        from reportlab.lib import colors
+        from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_JUSTIFY
+        
         # WHF Header Style
         self.whf_header_style = ParagraphStyle(
             'WHFHeader',
@@ -66,12 +85,16 @@ class PDFExporter:
     
     def create_whf_header(self, doc, title: str):
         """Create WHF branded header"""
+        from reportlab.platypus import Paragraph, Spacer
+        
         elements = []
         
-        # WHF Logo placeholder (you can add actual logo)
-        logo_text = "🏭 WESTERN HEAT & FORGE"
-        logo_para = Paragraph(logo_text, self.whf_header_style)
-        elements.append(logo_para)
+        # WHF Logo placeholder (you can add actual logo). The parsed paragraph
+        # is built once; each document gets a shallow copy because reportlab
+        # keeps per-build layout state on flowables
+        if self._logo is None:
+            self._logo = Paragraph("🏭 WESTERN HEAT & FORGE", self.whf_header_style)
+        elements.append(copy.copy(self._logo))
         
         # Title
         title_para = Paragraph(title, self.whf_subheader_style)
@@ -87,6 +110,8 @@ class PDFExporter:
     
     def create_question_section(self, question: str):
         """Create question section"""
+        from reportlab.platypus import Paragraph, Spacer
+        
         elements = []
         
         # Question header
@@ -102,6 +127,8 @@ class PDFExporter:
     
     def create_answer_section(self, answer: str):
         """Create answer section"""
+        from reportlab.platypus import Paragraph, Spacer
+        
         elements = []
         
         # Answer header
@@ -115,8 +142,31 @@ class PDFExporter:
         elements.append(Spacer(1, 15))
         return elements
     
+    def get_table_style(self, header_color: str, body_color):
+        """WHF table style for a header/body colour pair, built once"""
+        from reportlab.platypus import TableStyle
+        from reportlab.lib import colors
+        
+        key = (header_color, str(body_color))
+        if key not in self._table_styles:
+            self._table_styles[key] = TableStyle([
+                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor(header_color)),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, 0), (-1, 0), 10),
+                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+                ('BACKGROUND', (0, 1), (-1, -1), body_color),
+                ('GRID', (0, 0), (-1, -1), 1, colors.black)
+            ])
+        return self._table_styles[key]
+    
     def create_source_files_section(self, source_files: List[str]):
         """Create source files section"""
+        from reportlab.platypus import Paragraph, Spacer, Table
+        from reportlab.lib.units import inch
+        from reportlab.lib import colors
+        
         elements = []
         
         if source_files:
@@ -130,16 +180,7 @@ class PDFExporter:
                 data.append([str(i), file_name])
             
             table = Table(data, colWidths=[0.5*inch, 5*inch])
-            table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#ff6600')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 10),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black)
-            ]))
+            table.setStyle(self.get_table_style('#ff6600', colors.beige))
             
             elements.append(table)
             elements.append(Spacer(1, 15))
@@ -148,6 +189,10 @@ class PDFExporter:
     
     def create_metadata_section(self, metadata: Dict[str, Any]):
         """Create metadata section"""
+        from reportlab.platypus import Paragraph, Spacer, Table
+        from reportlab.lib.units import inch
+        from reportlab.lib import colors
+        
         elements = []
         
         if metadata:
@@ -161,16 +206,7 @@ class PDFExporter:
                 data.append([key.title(), str(value)])
             
             table = Table(data, colWidths=[2*inch, 3.5*inch])
-            table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#333333')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 10),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.lightgrey),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black)
-            ]))
+            table.setStyle(self.get_table_style('#333333', colors.lightgrey))
             
             elements.append(table)
             elements.append(Spacer(1, 15))
@@ -178,7 +214,12 @@ class PDFExporter:
         return elements
     
     def create_whf_footer(self):
-        """Create WHF branded footer"""
+        """Create WHF branded footer (static, so parsed once and copied per document)"""
+        from reportlab.platypus import Paragraph, Spacer
+        
+        if self._footer is not None:
+            return [copy.copy(flowable) for flowable in self._footer]
+        
         elements = []
         
         elements.append(Spacer(1, 20))
@@ -197,11 +238,14 @@ class PDFExporter:
         contact_para = Paragraph(contact_info, self.whf_footer_style)
         elements.append(contact_para)
         
-        return elements
+        self._footer = elements
+        return [copy.copy(flowable) for flowable in elements]
     
     def generate_pdf(self, question: str, answer: str, source_files: List[str] = None, 
                     metadata: Dict[str, Any] = None, title: str = "WHF AI Assistant Response"):
         """Generate a complete PDF document"""
+        from reportlab.lib.pagesizes import A4
+        from reportlab.platypus import SimpleDocTemplate
         
         # Create PDF buffer
         buffer = io.BytesIO()
@@ -240,6 +284,33 @@ class PDFExporter:
         
         return pdf_content
     
+    def generate_batch_pdf(self, entries: List[Dict[str, Any]], title: str = "WHF AI Assistant Q&A Export"):
+        """One PDF holding every question/answer entry in order"""
+        from reportlab.lib.pagesizes import A4
+        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+        
+        buffer = io.BytesIO()
+        doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=72, leftMargin=72,
+                              topMargin=72, bottomMargin=72)
+        
+        story = self.create_whf_header(doc, escape(title))
+        for i, entry in enumerate(entries, 1):
+            heading = f"#{i}"
+            if entry.get("timestamp"):
+                heading += f" &middot; {escape(str(entry['timestamp'])[:19].replace('T', ' '))}"
+            story.append(Paragraph(heading, self.whf_footer_style))
+            story.extend(self.create_question_section(to_markup(entry.get("question", ""))))
+            story.extend(self.create_answer_section(to_markup(entry.get("answer", ""))))
+            if entry.get("source_files"):
+                story.extend(self.create_source_files_section(entry["source_files"]))
+            story.append(Spacer(1, 10))
+        story.extend(self.create_whf_footer())
+        
+        doc.build(story)
+        pdf_content = buffer.getvalue()
+        buffer.close()
+        return pdf_content
+    
     def save_pdf(self, pdf_content: bytes, filename: str = None):
         """Save PDF to file"""
         if not filename:
@@ -253,57 +324,160 @@ class PDFExporter:
 
 class EmailExporter:
     def __init__(self):
-        self.sendgrid_api_key = os.getenv("SENDGRID_API_KEY")
         self.from_email = os.getenv("FROM_EMAIL", "forgia@whf.com")
         self.from_name = os.getenv("FROM_NAME", "Forgia AI Assistant")
     
     def send_pdf_email(self, to_email: str, subject: str, pdf_content: bytes, 
-                      pdf_filename: str, message: str = None):
-        """Send PDF via email using SendGrid"""
-        
-        if not self.sendgrid_api_key:
-            raise Exception("SendGrid API key not configured")
-        
+                      pdf_filename: str, message: str = None, user_id: str = None):
+        """Queue a PDF email in the outbox; delivery happens in the background"""
         try:
-            # Create email message
-            mail = Mail(
-                from_email=self.from_email,
-                to_emails=to_email,
+            email_id = email_outbox.enqueue(
+                to_email=to_email,
                 subject=subject,
-                html_content=message or f"""
+                html=message or f"""
                 <h2>WHF AI Assistant Response</h2>
                 <p>Please find attached the response to your question from Forgia AI Assistant.</p>
                 <p>Best regards,<br/>Forgia AI Assistant<br/>Western Heat & Forge</p>
-                """
-            )
-            
-            # Attach PDF
-            encoded_pdf = base64.b64encode(pdf_content).decode()
-            attachedFile = Attachment(
-                FileContent(encoded_pdf),
-                FileName(pdf_filename),
-                FileType('application/pdf'),
-                Disposition('attachment')
+                """,
+                from_email=self.from_email,
+                from_name=self.from_name,
+                attachment=pdf_content,
+                attachment_name=pdf_filename,
+                user_id=user_id
             )
-            mail.attachment = attachedFile
-            
-            # Send email
-            sg = SendGridAPIClient(api_key=self.sendgrid_api_key)
-            response = sg.send(mail)
             
             return {
                 "success": True,
-                "status_code": response.status_code,
-                "message": "Email sent successfully"
+                "email_id": email_id,
+                "status": "queued",
+                "message": "Email queued for delivery"
             }
             
+        except EmailNotConfigured as e:
+            return {
+                "success": False,
+                "error": str(e),
+                "configured": False,
+                "message": "Email delivery is not configured"
+            }
         except Exception as e:
             return {
                 "success": False,
                 "error": str(e),
-                "message": "Failed to send email"
+                "message": "Failed to queue email"
             }
+    
+    def get_status(self, email_id: str, user_id: str = None):
+        """Delivery status of a queued email, or None if unknown"""
+        return email_outbox.status(email_id, user_id)
+
+# Initialize exporters (the PDF exporter is built on first access because
+# creating its style sheet imports reportlab)
+email_exporter = EmailExporter()
+_pdf_exporter = None
+
+def get_pdf_exporter():
+    """Shared PDFExporter, created on first use"""
+    global _pdf_exporter
+    if _pdf_exporter is None:
+        _pdf_exporter = PDFExporter()
+    return _pdf_exporter
+
+def to_markup(text: str) -> str:
+    """Plain chat text as reportlab paragraph markup (escaped, line breaks kept)"""
+    return escape(text or "").replace("\n", "<br/>")
+
+def session_entries(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Pair a chat session's user/assistant messages into question/answer entries"""
+    entries = []
+    for message in messages:
+        if message.get("role") == "user":
+            entries.append({"question": message.get("content", ""), "answer": "", "timestamp": message.get("timestamp")})
+        elif entries and not entries[-1]["answer"]:
+            entries[-1]["answer"] = message.get("content", "")
+    return entries
+
+# Pool tasks: module-level functions so they can be pickled to the workers
+
+def render_batch_pdf(entries: List[Dict[str, Any]], title: str) -> bytes:
+    return get_pdf_exporter().generate_batch_pdf(entries, title)
+
+def render_entry_pdf(entry: Dict[str, Any], title: str) -> bytes:
+    metadata = dict(entry.get("metadata") or {})
+    if entry.get("timestamp"):
+        metadata["asked"] = str(entry["timestamp"])[:19].replace("T", " ")
+    metadata = {escape(str(key)): escape(str(value)) for key, value in metadata.items()} or None
+    return get_pdf_exporter().generate_pdf(
+        to_markup(entry.get("question", "")), to_markup(entry.get("answer", "")),
+        entry.get("source_files") or None, metadata, escape(title)
+    )
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+def get_export_pool():
+    """This process's renderer pool, started on first export"""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            # spawn, not fork: the API process runs background threads
+            _pool = ProcessPoolExecutor(max_workers=EXPORT_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+            _pool_pid = os.getpid()
+        return _pool
+
+async def render_pdf_async(entries: List[Dict[str, Any]], title: str) -> bytes:
+    """Render one combined PDF in the pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_export_pool(), render_batch_pdf, entries, title)
+
+async def render_entry_async(entry: Dict[str, Any], title: str) -> bytes:
+    """Render one question/answer PDF in the pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_export_pool(), render_entry_pdf, entry, title)
+
+class _StreamBuffer:
+    """Write-only file object that hands back what was written since the last drain"""
+    
+    def __init__(self):
+        self._chunks = []
+    
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+    
+    def flush(self):
+        pass
+    
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+async def stream_zip(entries: List[Dict[str, Any]], title: str, name_prefix: str = "whf_qa"):
+    """Yield a ZIP with one PDF per entry, streaming each PDF as soon as it (and those before it) is rendered"""
+    loop = asyncio.get_running_loop()
+    pool = get_export_pool()
+    # Keep a bounded number of renders in flight so a large export doesn't
+    # hold every PDF in memory at once
+    window = max(1, EXPORT_WORKERS * 2)
+    pending = [loop.run_in_executor(pool, render_entry_pdf, entry, title) for entry in entries[:window]]
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for i, entry in enumerate(entries):
+            pdf_content = await pending[i]
+            pending[i] = None
+            if i + window < len(entries):
+                pending.append(loop.run_in_executor(pool, render_entry_pdf, entries[i + window], title))
+            stamp = str(entry.get("timestamp") or "")[:19].replace(":", "").replace("T", "_").replace(" ", "_")
+            archive.writestr(f"{name_prefix}_{i + 1:04d}{'_' + stamp if stamp else ''}.pdf", pdf_content)
+            yield buffer.drain()
+    yield buffer.drain()
 
-# Initialize exporters
-pdf_exporter = PDFExporter()
-email_exporter = EmailExporter() 
\ No newline at end of file
+def __getattr__(name):
+    # Keeps `from backend.export import pdf_exporter` working
+    if name == "pdf_exporter":
+        return get_pdf_exporter()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}") 
\ No newline at end of file
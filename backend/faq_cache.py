@@ -0,0 +1,340 @@
+# backend/faq_cache.py
+#
+# Precomputed question/answer pairs per document. After a document is
+# ingested a background thread asks the LLM provider for the questions
+# operators are likely to ask about it (steps, safety, temperatures) and
+# stores the pairs with their keyword sets in documents.db. /ask checks
+# these first and answers in milliseconds when a stored question is close
+# enough to the incoming one.
+#
+# Pairs are keyed by the document's content hash (documents.content_hash,
+# set when chunks are stored), so re-uploading an unchanged file reuses
+# them and only a changed document is sent to the LLM again.
+#
+# A generation that fails (provider error, or a reply without usable pairs)
+# is marked failed and logged at WARNING. Once FAQ_RETRY_SECONDS have passed,
+# the background thread retries it the next time it is idle, and
+# `precompute_faqs.py --failed` retries every failed document at once.
+
+import hashlib
+import json
+import logging
+import math
+import os
+import queue
+import threading
+import time
+from typing import Dict, FrozenSet, List, Optional
+
+try:
+    from .shared_state import connect, bump_version, read_version
+    from .logs import get_logger, log
+    from .language import word_tokens
+except ImportError:
+    from shared_state import connect, bump_version, read_version
+    from logs import get_logger, log
+    from language import word_tokens
+
+FAQ_PRECOMPUTE = os.getenv("FAQ_PRECOMPUTE", "true").lower() == "true"
+FAQ_PAIRS_PER_DOCUMENT = int(os.getenv("FAQ_PAIRS_PER_DOCUMENT", "8"))
+FAQ_MATCH_THRESHOLD = float(os.getenv("FAQ_MATCH_THRESHOLD", "0.8"))
+FAQ_MAX_CONTEXT_CHARS = int(os.getenv("FAQ_MAX_CONTEXT_CHARS", "12000"))
+# A failed or abandoned generation may be retried after this long
+FAQ_RETRY_SECONDS = float(os.getenv("FAQ_RETRY_SECONDS", "3600"))
+
+# Cache counter bumped whenever stored pairs change
+FAQ_VERSION = "document_faqs"
+
+DONE = "done"
+PENDING = "pending"
+FAILED = "failed"
+
+logger = get_logger("faq")
+
+FAQ_SYSTEM_PROMPT = """You write FAQ entries for work instructions at Western Heat & Forge (WHF), a forging company.
+Given one document, list the questions shift operators are most likely to ask about it - procedure steps, safety equipment and precautions, temperatures, settings and checks - and answer each one only from the document.
+Reply with a JSON array of objects with "question" and "answer" keys and nothing else."""
+
+# Question words and particles; Hindi and Marathi ones too, so that what is
+# left of "डाय को कितना गरम करना है?" is the die and the heating
+_STOPWORDS = frozenset("""
+a an and are as at be by can do does for from how i in is it me of on or should the this
+to was what when where which who why will with you your we our my please tell about there
+को का की के में है हैं से पर और या क्या कैसे कितना कितनी कितने कब कहाँ कहां कौन क्यों
+करना करनी करें करने करते करता चाहिए होता होती होते होना होगा होगी हो तो भी सा सी यह वह ये वे इस उस लिए साथ
+तथा नहीं जाता किया मुझे हम आप बताइए बताएं बताओ कृपया
+आहे आहेत काय कसे कशी किती कधी कुठे कोण ला ची चा चे च्या मध्ये व आणि करावे करावी करणे
+पाहिजे साठी नाही असे मला सांगा यांची याची
+""".split())
+
+def content_hash(chunks: List[str]) -> str:
+    """Stable hash of a document's chunk texts"""
+    digest = hashlib.sha256()
+    for chunk in chunks:
+        digest.update(chunk.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def question_terms(text: str) -> FrozenSet[str]:
+    """Content words of a question, used for matching (Devanagari words kept whole)"""
+    return frozenset(word for word in word_tokens(text) if word not in _STOPWORDS)
+
+def similarity(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    """Cosine similarity of two term sets"""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / math.sqrt(len(a) * len(b))
+
+def parse_pairs(text: str) -> List[Dict[str, str]]:
+    """Question/answer pairs from the model's JSON reply; [] if it isn't usable"""
+    start, end = text.find("["), text.rfind("]")
+    if start < 0 or end <= start:
+        return []
+    try:
+        items = json.loads(text[start:end + 1])
+    except ValueError:
+        return []
+    pairs = []
+    for item in items if isinstance(items, list) else []:
+        if isinstance(item, dict) and isinstance(item.get("question"), str) and isinstance(item.get("answer"), str):
+            if item["question"].strip() and item["answer"].strip():
+                pairs.append({"question": item["question"].strip(), "answer": item["answer"].strip()})
+    return pairs
+
+def create_faq_tables(cursor):
+    """Create the FAQ tables (caller commits)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS faq_documents (
+            document_hash TEXT PRIMARY KEY,
+            filename TEXT,
+            status TEXT NOT NULL,
+            pairs INTEGER NOT NULL DEFAULT 0,
+            updated_at REAL NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS document_faqs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            document_hash TEXT NOT NULL,
+            question TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            terms TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_document_faqs_hash ON document_faqs (document_hash)')
+
+class FAQStore:
+    """Generates, stores and matches precomputed FAQ pairs for one database"""
+
+    def __init__(self, db_path: str = "documents.db"):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._version = None
+        self._pairs: Dict[str, List[tuple]] = {}
+        self._queue: "queue.Queue" = queue.Queue()
+        self._worker = None
+        self._worker_pid = None
+        self._provider = None
+        self.hits = 0
+        self.misses = 0
+
+    # ---- matching ------------------------------------------------------
+
+    def _refresh(self, conn):
+        """Reload pairs if another process (or thread) changed them"""
+        version = read_version(conn, FAQ_VERSION)
+        if version == self._version:
+            return
+        pairs: Dict[str, List[tuple]] = {}
+        # Terms are recomputed rather than read from the stored column, so pairs
+        # saved by an older tokenizer match the same way as new ones
+        for document_hash, question, answer in conn.execute(
+            'SELECT document_hash, question, answer FROM document_faqs'
+        ):
+            pairs.setdefault(document_hash, []).append((question_terms(question), question, answer))
+        with self._lock:
+            self._pairs = pairs
+            self._version = version
+
+    def match(self, question: str, user_id: Optional[str] = None, threshold: float = FAQ_MATCH_THRESHOLD):
+        """Best stored pair for the user's documents, or None below the threshold"""
+        terms = question_terms(question)
+        if not terms:
+            return None
+        conn = connect(self.db_path)
+        try:
+            self._refresh(conn)
+            if user_id:
+                documents = conn.execute(
+                    'SELECT content_hash, filename FROM documents WHERE user_id = ? AND content_hash IS NOT NULL',
+                    (user_id,)
+                ).fetchall()
+            else:
+                documents = conn.execute(
+                    'SELECT content_hash, filename FROM documents WHERE content_hash IS NOT NULL'
+                ).fetchall()
+        except Exception as e:
+            log(logger, logging.WARNING, "FAQ lookup failed", error=str(e))
+            return None
+        finally:
+            conn.close()
+
+        best = None
+        best_score = threshold
+        for document_hash, filename in documents:
+            for pair_terms, pair_question, answer in self._pairs.get(document_hash, ()):
+                score = similarity(terms, pair_terms)
+                if score >= best_score:
+                    best_score = score
+                    best = {"question": pair_question, "answer": answer, "filename": filename, "score": round(score, 3)}
+
+        with self._lock:
+            if best:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return best
+
+    # ---- generation ----------------------------------------------------
+
+    def _claim(self, conn, document_hash: str, filename: str, force: bool) -> bool:
+        """Mark a hash as being generated; False if it is done or being done elsewhere"""
+        now = time.time()
+        if force:
+            conn.execute('DELETE FROM faq_documents WHERE document_hash = ?', (document_hash,))
+        cursor = conn.execute('''
+            INSERT INTO faq_documents (document_hash, filename, status, pairs, updated_at)
+            VALUES (?, ?, ?, 0, ?)
+            ON CONFLICT(document_hash) DO UPDATE SET
+                filename = excluded.filename, status = excluded.status, updated_at = excluded.updated_at
+            WHERE faq_documents.status != ? AND faq_documents.updated_at < ?
+        ''', (document_hash, filename, PENDING, now, DONE, now - FAQ_RETRY_SECONDS))
+        conn.commit()
+        return cursor.rowcount > 0
+
+    def generate(self, document_id: int, provider, force: bool = False) -> int:
+        """Generate and store pairs for one document; returns how many were stored"""
+        conn = connect(self.db_path)
+        try:
+            row = conn.execute('SELECT filename, content_hash FROM documents WHERE id = ?', (document_id,)).fetchone()
+            if not row:
+                return 0
+            filename, document_hash = row
+            chunks = [content for (content,) in conn.execute(
+                'SELECT content FROM document_chunks WHERE document_id = ? ORDER BY chunk_id', (document_id,)
+            )]
+            if not chunks:
+                return 0
+            if not document_hash:
+                document_hash = content_hash(chunks)
+                conn.execute('UPDATE documents SET content_hash = ? WHERE id = ?', (document_hash, document_id))
+                conn.commit()
+            if not self._claim(conn, document_hash, filename, force):
+                return 0
+
+            try:
+                text = "\n\n".join(chunks)[:FAQ_MAX_CONTEXT_CHARS]
+                prompt = f"Document: {filename}\n\n{text}\n\nWrite up to {FAQ_PAIRS_PER_DOCUMENT} entries."
+                pairs = parse_pairs(provider.complete(prompt, system=FAQ_SYSTEM_PROMPT, temperature=0.2, max_tokens=2000))
+                reason = None if pairs else "reply had no usable question/answer pairs"
+            except Exception as e:
+                pairs = []
+                reason = f"provider error: {e}"
+
+            conn.execute('DELETE FROM document_faqs WHERE document_hash = ?', (document_hash,))
+            conn.executemany(
+                'INSERT INTO document_faqs (document_hash, question, answer, terms) VALUES (?, ?, ?, ?)',
+                [(document_hash, pair["question"], pair["answer"], json.dumps(sorted(question_terms(pair["question"]))))
+                 for pair in pairs[:FAQ_PAIRS_PER_DOCUMENT]]
+            )
+            conn.execute(
+                'UPDATE faq_documents SET status = ?, pairs = ?, updated_at = ? WHERE document_hash = ?',
+                (DONE if pairs else FAILED, min(len(pairs), FAQ_PAIRS_PER_DOCUMENT), time.time(), document_hash)
+            )
+            # Pairs of documents that were replaced or deleted are unreachable
+            conn.execute('''
+                DELETE FROM document_faqs WHERE document_hash NOT IN
+                    (SELECT content_hash FROM documents WHERE content_hash IS NOT NULL)
+            ''')
+            bump_version(conn, FAQ_VERSION)
+            conn.commit()
+            if reason:
+                log(logger, logging.WARNING, "FAQ generation failed", filename=filename, reason=reason,
+                    retry_after_seconds=FAQ_RETRY_SECONDS)
+                return 0
+            log(logger, logging.INFO, "Generated FAQ pairs", filename=filename, pairs=len(pairs[:FAQ_PAIRS_PER_DOCUMENT]))
+            return min(len(pairs), FAQ_PAIRS_PER_DOCUMENT)
+        finally:
+            conn.close()
+
+    def failed_documents(self, user_id: Optional[str] = None, min_age: float = 0.0) -> List[tuple]:
+        """(document id, filename) of one document per content hash whose generation failed min_age ago or more"""
+        conn = connect(self.db_path)
+        try:
+            query = '''
+                SELECT MIN(d.id), d.filename FROM documents d
+                JOIN faq_documents f ON f.document_hash = d.content_hash
+                WHERE f.status = ? AND f.updated_at <= ?
+            '''
+            params = [FAILED, time.time() - min_age]
+            if user_id:
+                query += ' AND d.user_id = ?'
+                params.append(user_id)
+            return conn.execute(query + ' GROUP BY f.document_hash ORDER BY MIN(d.id)', params).fetchall()
+        finally:
+            conn.close()
+
+    def schedule(self, document_id: int, provider):
+        """Queue a document for generation on this process's background thread"""
+        with self._lock:
+            self._provider = provider
+            if self._worker_pid != os.getpid() or not self._worker.is_alive():
+                self._queue = queue.Queue()
+                self._worker = threading.Thread(target=self._run, args=(self._queue,), name="faq-precompute", daemon=True)
+                self._worker.start()
+                self._worker_pid = os.getpid()
+        self._queue.put((document_id, provider))
+
+    def _run(self, jobs: "queue.Queue"):
+        while True:
+            try:
+                document_id, provider = jobs.get(timeout=FAQ_RETRY_SECONDS)
+            except queue.Empty:
+                self._retry_failed()
+                continue
+            try:
+                self.generate(document_id, provider)
+            except Exception as e:
+                log(logger, logging.ERROR, "FAQ job failed", exc_info=True, document_id=document_id, error=str(e))
+
+    def _retry_failed(self):
+        """Regenerate documents whose last attempt failed at least FAQ_RETRY_SECONDS ago"""
+        try:
+            for document_id, _ in self.failed_documents(min_age=FAQ_RETRY_SECONDS):
+                # _claim keeps two workers from retrying the same document
+                self.generate(document_id, self._provider)
+        except Exception as e:
+            log(logger, logging.ERROR, "FAQ retry failed", exc_info=True, error=str(e))
+
+    def snapshot(self):
+        """Lookup hit/miss counts for this worker process"""
+        return self.merged_snapshot([self.export_state()])
+
+    def export_state(self) -> Dict[str, int]:
+        """Raw counters, written to the shared database by worker_metrics"""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "pairs": sum(len(pairs) for pairs in self._pairs.values())}
+
+    @staticmethod
+    def merged_snapshot(states: List[Dict[str, int]]):
+        """snapshot() over the export_state() of several workers"""
+        hits = sum(state["hits"] for state in states)
+        total = hits + sum(state["misses"] for state in states)
+        return {
+            "lookups": total,
+            "hits": hits,
+            "hit_ratio": round(hits / total, 4) if total else 0,
+            # Every worker loads the same pairs from the database
+            "pairs": max((state["pairs"] for state in states), default=0),
+        }
@@ -3,18 +3,20 @@ from fastapi import FastAPI, UploadFile, File
 from pydantic import BaseModel
 import json
 from dotenv import load_dotenv
-from openai import OpenAI
 import fitz  # PyMuPDF
 import pandas as pd
 from PIL import Image
 import io
 import os
 import sys
+import asyncio
+import shutil
 # Add the backend directory to Python path
 backend_dir = os.path.dirname(os.path.abspath(__file__))
 if backend_dir not in sys.path:
     sys.path.insert(0, backend_dir)
 from database import db
+from llm_provider import get_llm_provider
 
 # Import company data functions directly
 try:
@@ -30,9 +32,6 @@ except ImportError:
 # Load environment variables
 load_dotenv()
 
-# Initialize OpenAI client
-openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
 # FastAPI App
 app = FastAPI()
 
@@ -152,13 +151,7 @@ def chunk_text(text, chunk_size=1000):
 def get_ai_answer(question, prompt):
     """Get AI-powered answer based on context"""
     try:
-        response = openai_client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.2,
-            max_tokens=1000
-        )
-        return response.choices[0].message.content
+        return get_llm_provider().complete(prompt, temperature=0.2, max_tokens=1000)
     except Exception as e:
         return f"Error generating AI response: {str(e)}"
 
@@ -168,8 +161,9 @@ async def upload_file(file: UploadFile = File(...)):
     
     try:
         # Save the uploaded file
+        # Streamed in blocks from the spooled upload, not read into memory
         with open(filepath, "wb") as f:
-            f.write(await file.read())
+            await asyncio.to_thread(shutil.copyfileobj, file.file, f, 1024 * 1024)
         
         print(f"File saved: {filepath}")
         
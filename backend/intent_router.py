@@ -0,0 +1,114 @@
+# backend/intent_router.py
+#
+# Cheap question classifier that runs in front of QAEngine.get_answer so
+# that questions which don't need document retrieval (greetings, "list my
+# files", company facts) never reach the search or the LLM.
+
+import re
+import threading
+from typing import Dict, List
+
+try:
+    from .single_flight import normalize_question
+except ImportError:
+    from single_flight import normalize_question
+
+GREETING = "greeting"
+LISTING = "listing"
+COMPANY = "company"
+DOCUMENT = "document"
+
+INTENTS = [GREETING, LISTING, COMPANY, DOCUMENT]
+
+_GREETING_RE = re.compile(
+    r"^(hi|hello|hey|hii+|namaste|good (morning|afternoon|evening)|thanks|thank you|thx|ok(ay)?|bye|goodbye)"
+    r"( (there|forgia|team|all|so much|a lot))?$"
+)
+
+# Whole-question match like _GREETING_RE, so "who are you and what is
+# WI-PR-06 step 3" still goes to the documents
+_IDENTITY_RE = re.compile(
+    r"^((hi|hello|hey|namaste)( there| forgia)? )?(please )?(tell me )?"
+    r"(who are you|what are you|(what is|what s|whats|tell me) your name|your name"
+    r"|who (created|made|developed|built) you|what can you do|(what are )?your capabilities"
+    r"|(tell me )?about yourself)( forgia)?$"
+)
+
+_LISTING_PATTERNS = [
+    # "list all documents", "show me my uploaded files"
+    re.compile(r"^(please )?(list|show|display|give)( me)?( all| my| the| of)*( uploaded| available| stored)? (documents|files|docs|uploads)$"),
+    # "what documents have I uploaded", "which files are available"
+    re.compile(r"^(what|which) (documents|files|docs)( (do|did) i| have i| are| were| is)( have)?( been)?( uploaded| available| stored| there| in the system)?$"),
+    # "how many documents are uploaded"
+    re.compile(r"^how many (documents|files|docs)\b"),
+    # bare "all documents" / "uploaded files"
+    re.compile(r"^(all|my|uploaded)( uploaded)? (documents|files|docs)$"),
+]
+
+_COMPANY_RE = re.compile(
+    r"\b(whf|western heat|your company|the company|company|contact|phone|email address|address"
+    r"|founded|certifications?|certified|testimonials?|customers?|clients?|industries)\b"
+)
+
+# Words that mean the user is really asking about a work instruction
+_DOCUMENT_TERMS_RE = re.compile(
+    r"\b(hammer|furnace|billet|die|press|trim|coining|ibh|heater|heating|step|steps|procedure|instruction"
+    r"|wi|wi pr \d+|route card|calibration|traceability|punching|temperature|safety)\b"
+)
+
+def classify_intent(question: str) -> str:
+    """Return one of GREETING, LISTING, COMPANY or DOCUMENT"""
+    normalized = normalize_question(question)
+    if not normalized:
+        return GREETING
+
+    if _GREETING_RE.match(normalized) or _IDENTITY_RE.match(normalized):
+        return GREETING
+
+    if any(pattern.search(normalized) for pattern in _LISTING_PATTERNS):
+        return LISTING
+
+    if _COMPANY_RE.search(normalized) and not _DOCUMENT_TERMS_RE.search(normalized):
+        return COMPANY
+
+    return DOCUMENT
+
+class IntentStats:
+    """Running per-intent request counts and latency"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def record(self, intent: str, seconds: float):
+        with self._lock:
+            entry = self._stats.setdefault(intent, {"count": 0, "total": 0.0, "max": 0.0})
+            entry["count"] += 1
+            entry["total"] += seconds
+            entry["max"] = max(entry["max"], seconds)
+
+    def snapshot(self):
+        """Counts plus average and max latency (ms) for every intent"""
+        return self.merged_snapshot([self.export_state()])
+
+    def export_state(self) -> Dict[str, Dict[str, float]]:
+        """Raw per-intent counters, written to the shared database by worker_metrics"""
+        with self._lock:
+            return {intent: dict(entry) for intent, entry in self._stats.items()}
+
+    @staticmethod
+    def merged_snapshot(states: List[Dict[str, Dict[str, float]]]):
+        """snapshot() over the export_state() of several workers"""
+        report = {}
+        for intent in INTENTS:
+            entries = [state[intent] for state in states if intent in state]
+            count = sum(entry["count"] for entry in entries)
+            total = sum(entry["total"] for entry in entries)
+            report[intent] = {
+                "count": count,
+                "avg_latency_ms": round(total / count * 1000, 2) if count else 0,
+                "max_latency_ms": round(max((entry["max"] for entry in entries), default=0.0) * 1000, 2),
+            }
+        return report
+
+intent_stats = IntentStats()
@@ -0,0 +1,325 @@
+# backend/language.py
+#
+# Language handling for the English, Hindi and Marathi work instructions.
+#
+# At ingest, text from PDF spans set in the legacy Shivaji Devanagari fonts
+# (ASCII codes drawn as Devanagari glyphs, so "kao" is really को) is
+# decoded to Unicode, then every document is NFC-normalized and tagged with
+# a language ("en", "hi" or "mr") and a variant key - the WI document code
+# from its filename, shared by the English, Hindi and Marathi versions of
+# the same instruction.
+#
+# At query time tokenize() keeps Devanagari vowel signs and viramas inside
+# words (\w alone splits every word at each matra), transliteration keys
+# give English words and their Devanagari loanword spellings a common
+# consonant skeleton (hammer / हॅमर -> "hmr"), and select_language_variants
+# keeps one language version per document, preferring the asker's.
+
+import re
+import sqlite3
+import unicodedata
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+ENGLISH = "en"
+HINDI = "hi"
+MARATHI = "mr"
+
+# ---- normalization ----
+
+_INVISIBLE = dict.fromkeys(map(ord, "­​‌‍⁠﻿"))
+_DEVANAGARI_DIGITS = {0x0966 + i: str(i) for i in range(10)}
+_DEVANAGARI_RE = re.compile(r"[ऀ-ॿ]")
+_LATIN_RE = re.compile(r"[A-Za-z]")
+
+def normalize_text(text: str) -> str:
+    """NFC, without zero-width joiners and soft hyphens, with ASCII digits"""
+    return unicodedata.normalize("NFC", text).translate(_INVISIBLE).translate(_DEVANAGARI_DIGITS)
+
+def has_devanagari(text: str) -> bool:
+    return _DEVANAGARI_RE.search(text) is not None
+
+# ---- legacy Shivaji font decoding ----
+
+# Consonants drawn without their vertical stroke; "a" completes them
+_SHIVAJI_HALF = {
+    "m": "म", "n": "न", "l": "ल", "y": "य", "s": "स", "v": "व", "g": "ग", "b": "ब",
+    "j": "ज", "c": "च", "N": "ण", "S": "श", "B": "भ", "Q": "ध", "G": "घ", "J": "झ",
+    "x": "क्ष", "q": "थ", "Y": "ष", "P": "प", "H": "त्र", "@": "क", "%": "त", "F": "फ",
+}
+# Consonants drawn complete; a following "a" is the ा sign
+_SHIVAJI_FULL = {
+    "k": "क", "r": "र", "h": "ह", "D": "ड", "T": "ट", "d": "द", "f": "फ", "z": "ठ",
+    "L": "ळ", "Z": "ढ", "C": "छ", "K": "ख", "p": "प", "t": "त", "w": "द्ध", "~": "त्र",
+    "Ë": "क्र",
+}
+_SHIVAJI_VOWELS = {"A": "अ", "[": "इ", "[-": "ई", "]": "उ", "}": "ऊ", "e": "ए"}
+_SHIVAJI_SIGNS = {"I": "ी", "u": "ु", "U": "ू", "M": "ं"}
+_SHIVAJI_PUNCTUATION = {"È": "।", "Ê": ",", "¸": ",", "Á": ":", "¹": "-", "³": "(", "´": ")", "À": "/"}
+# After ा (or अ -> आ) these combine into one sign
+_AA_COMBINED = {"o": ("ो", "ओ"), "O": ("ौ", "औ"), "^": ("ॉ", "ऑ")}
+_LONE_LA = re.compile(r"(?<!\S)ल्(?!\S)")
+
+def is_legacy_devanagari_font(font: str) -> bool:
+    return font.lower().startswith("shivaji")
+
+class _Syllable:
+    """One akshara being assembled from Shivaji glyph codes"""
+
+    def __init__(self, pre_i=False):
+        self.reph = False
+        self.base = ""
+        self.complete = False
+        self.pre_i = pre_i
+        self.signs = ""
+
+    def render(self) -> str:
+        text = ("र्" if self.reph else "") + self.base + ("ि" if self.pre_i else "")
+        # The anusvara comes after any vowel sign
+        if self.signs.startswith("ं") and len(self.signs) > 1:
+            return text + self.signs[1:] + "ं"
+        return text + self.signs
+
+def decode_shivaji(text: str) -> str:
+    """Unicode Devanagari for text typed in a Shivaji font"""
+    out: List[str] = []
+    current: Optional[_Syllable] = None
+    pre_i = False
+
+    def flush():
+        nonlocal current
+        if current is not None:
+            out.append(current.render())
+            current = None
+
+    def start(base="", complete=False):
+        nonlocal current, pre_i
+        flush()
+        current = _Syllable(pre_i)
+        current.base, current.complete = base, complete
+        pre_i = False
+
+    i = 0
+    while i < len(text):
+        ch = text[i]
+        pair = text[i:i + 2]
+        i += 1
+        if pair == "[-":
+            start(_SHIVAJI_VOWELS[pair], True)
+            i += 1
+        elif ch in _SHIVAJI_HALF:
+            if current is not None and current.base and not current.complete and not current.signs:
+                current.base += _SHIVAJI_HALF[ch] + "्"
+            else:
+                start(_SHIVAJI_HALF[ch] + "्")
+        elif ch in _SHIVAJI_FULL:
+            if current is not None and current.base and not current.complete and not current.signs:
+                current.base += _SHIVAJI_FULL[ch]
+                current.complete = True
+            else:
+                start(_SHIVAJI_FULL[ch], True)
+        elif ch == "$":
+            # रू is one glyph
+            start("र", True)
+            current.signs = "ू"
+        elif ch in _SHIVAJI_VOWELS:
+            start(_SHIVAJI_VOWELS[ch], True)
+        elif current is None:
+            if ch == "i":
+                pre_i = True
+            else:
+                out.append(_SHIVAJI_PUNCTUATION.get(ch, ch))
+        elif ch == "a":
+            if not current.complete:
+                current.base = current.base[:-1]
+                current.complete = True
+            elif current.base == "अ" and not current.signs:
+                current.base = "आ"
+            else:
+                current.signs += "ा"
+        elif ch in _AA_COMBINED:
+            sign, vowel = _AA_COMBINED[ch]
+            if current.base == "आ" and not current.signs:
+                current.base = vowel
+            elif current.signs.endswith("ा"):
+                current.signs = current.signs[:-1] + sign
+            elif ch == "O" and current.base == "ए" and not current.signs:
+                current.base = "ऐ"
+            else:
+                current.signs += {"o": "े", "O": "ै", "^": "ॅ"}[ch]
+        elif ch in _SHIVAJI_SIGNS:
+            current.signs += _SHIVAJI_SIGNS[ch]
+        elif ch in "/`":
+            # Subscript र joins the consonant, before any vowel sign
+            if ch == "`" and text[i:i + 1] == "/":
+                i += 1
+            current.base = current.base + "र्" if not current.complete else current.base + "्र"
+        elif ch == "\\":
+            current.base += "्"
+            current.complete = False
+        elif ch == "-" and current.base:
+            current.reph = True
+        elif ch == "i":
+            flush()
+            pre_i = True
+        else:
+            flush()
+            out.append(_SHIVAJI_PUNCTUATION.get(ch, ch))
+    flush()
+    # A bare ल between spaces is how these documents type the danda
+    return _LONE_LA.sub("।", "".join(out))
+
+def decode_span(text: str, font: str) -> str:
+    """Span text as Unicode, decoding legacy Devanagari fonts"""
+    return decode_shivaji(text) if is_legacy_devanagari_font(font) else text
+
+# ---- language detection ----
+
+_MARATHI_MARKERS = frozenset("आहे आणि करणे करावे करावी मध्ये साठी नाही यांची याची असल्यास झाल्यावर घ्या करा व".split())
+_HINDI_MARKERS = frozenset("है हैं और के की में से को करें करना करने लिए यह पर नहीं चाहिए करे".split())
+_FILENAME_HINTS = ((re.compile(r"marathi", re.I), MARATHI), (re.compile(r"hindi", re.I), HINDI))
+
+def detect_language(text: str, filename: str = "") -> str:
+    """"en", "hi" or "mr" from the script and common words, with the filename as a tiebreak"""
+    devanagari = len(_DEVANAGARI_RE.findall(text))
+    latin = len(_LATIN_RE.findall(text))
+    hint = next((language for pattern, language in _FILENAME_HINTS if pattern.search(filename)), None)
+    if devanagari + latin == 0:
+        return hint or ENGLISH
+    if devanagari < 0.2 * (devanagari + latin):
+        return ENGLISH
+
+    words = text.split()
+    marathi = sum(word in _MARATHI_MARKERS for word in words) + text.count("ळ")
+    hindi = sum(word in _HINDI_MARKERS for word in words)
+    if hint == MARATHI:
+        marathi += 3
+    elif hint == HINDI:
+        hindi += 3
+    return MARATHI if marathi > hindi else HINDI
+
+def script_of(language: Optional[str]) -> str:
+    return "latin" if language in (None, ENGLISH) else "devanagari"
+
+# ---- tokens and transliteration keys ----
+
+# Letters plus Devanagari vowel signs, nukta and virama; dandas split words
+_TOKEN_RE = re.compile(r"[\wऀ-ॣ०-ॿ]+")
+_DEVANAGARI_STOPWORDS = frozenset("""
+में हैं लिए करें करना करने करते चाहिए नहीं जाता किया साथ तथा आहे आणि करणे करावे करावी मध्ये
+साठी नाही यांची याची होते असे
+""".split())
+
+def word_tokens(text: str) -> List[str]:
+    """Every case-folded word of the normalized text, Devanagari words kept whole"""
+    return _TOKEN_RE.findall(normalize_text(text).casefold())
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens longer than two characters, Devanagari kept whole"""
+    return [token for token in _TOKEN_RE.findall(unicodedata.normalize("NFC", text).lower())
+            if len(token) > 2 and token not in _DEVANAGARI_STOPWORDS]
+
+_DEVANAGARI_SKELETON = {
+    "क": "k", "ख": "k", "ग": "g", "घ": "g", "ङ": "n", "च": "c", "छ": "c", "ज": "j", "झ": "j",
+    "ञ": "n", "ट": "t", "ठ": "t", "ड": "d", "ढ": "d", "ण": "n", "त": "t", "थ": "t", "द": "d",
+    "ध": "d", "न": "n", "प": "p", "फ": "f", "ब": "b", "भ": "b", "म": "m", "य": "y", "र": "r",
+    "ल": "l", "व": "v", "श": "s", "ष": "s", "स": "s", "ह": "h", "ळ": "l", "ं": "n", "ँ": "n",
+}
+_LATIN_DIGRAPHS = re.compile(r"ph|sh|ch|th|dh|kh|gh|bh|ck|qu|c(?=[eiy])|[cqxzw]")
+_LATIN_REPLACEMENTS = {"ph": "f", "sh": "s", "ch": "c", "th": "t", "dh": "d", "kh": "k", "gh": "g",
+                       "bh": "b", "ck": "k", "qu": "kv", "c": "k", "q": "k", "x": "ks", "z": "j", "w": "v"}
+_SKELETON_DROP = re.compile(r"(?<=.)[aeiouyh]")
+_REPEATS = re.compile(r"(.)\1+")
+
+@lru_cache(maxsize=65536)
+def transliteration_key(token: str) -> str:
+    """Consonant skeleton shared by an English word and its Devanagari spelling"""
+    if has_devanagari(token):
+        initial_vowel = "ऄ" <= token[0] <= "औ"
+        latin = ("a" if initial_vowel else "") + "".join(_DEVANAGARI_SKELETON.get(ch, "") for ch in token)
+    elif token.isalpha() and token.isascii():
+        latin = _LATIN_DIGRAPHS.sub(
+            lambda m: "s" if m.group() == "c" and m.end() < len(token) and token[m.end()] in "eiy"
+            else _LATIN_REPLACEMENTS[m.group()], token)
+        if latin[0] in "aeiou":
+            latin = "a" + latin[1:]
+    else:
+        return ""
+    key = _REPEATS.sub(r"\1", _SKELETON_DROP.sub("", latin))
+    return key if len(key) >= 3 else ""
+
+def _tagged_keys(tokens: Iterable[str], opposite: bool) -> List[str]:
+    keys = []
+    for token in tokens:
+        key = transliteration_key(token)
+        if key:
+            devanagari = has_devanagari(token)
+            keys.append(("~l" if devanagari else "~d") + key if opposite else ("~d" if devanagari else "~l") + key)
+    return keys
+
+def transliteration_terms(text: str) -> List[str]:
+    """Index terms for a chunk: each key tagged with the script it came from"""
+    return _tagged_keys(tokenize(text), opposite=False)
+
+def query_transliteration_terms(question: str) -> List[str]:
+    """Keys of the question's words tagged with the other script, so they
+    only ever match across scripts"""
+    return _tagged_keys(tokenize(question), opposite=True)
+
+@lru_cache(maxsize=8192)
+def chunk_transliteration_terms(content: str) -> frozenset:
+    return frozenset(transliteration_terms(content))
+
+# ---- language variants ----
+
+_DOCUMENT_CODE = re.compile(r"\b([A-Z]{2,4})-([A-Z]{2,4})-(\d+)")
+_VARIANT_NOISE = re.compile(r"\b(?:english|hindii?|marathi)\b|\(\s*\)|[^\w\s]", re.I)
+
+def variant_key(filename: str) -> str:
+    """Key shared by the language versions of one document: its WI/WP code
+    (30-WI-PR-08 and WI-PR-08 -> WI-PR-8), else the filename stem without
+    language words"""
+    stem = filename.rsplit(".", 1)[0]
+    match = _DOCUMENT_CODE.search(stem.upper())
+    if match:
+        return f"{match.group(1)}-{match.group(2)}-{int(match.group(3))}"
+    return " ".join(_VARIANT_NOISE.sub(" ", stem).lower().split())
+
+def create_language_columns(cursor: sqlite3.Cursor):
+    """Add documents.language / variant_key and fill them for existing rows"""
+    cursor.execute("PRAGMA table_info(documents)")
+    columns = {column[1] for column in cursor.fetchall()}
+    for column in ("language", "variant_key"):
+        if column not in columns:
+            cursor.execute(f"ALTER TABLE documents ADD COLUMN {column} TEXT")
+
+    cursor.execute("SELECT id, filename FROM documents WHERE language IS NULL OR variant_key IS NULL")
+    for document_id, filename in cursor.fetchall():
+        cursor.execute("SELECT content FROM document_chunks WHERE document_id = ? ORDER BY id LIMIT 5",
+                       (document_id,))
+        sample = " ".join(row[0] for row in cursor.fetchall())
+        cursor.execute("UPDATE documents SET language = ?, variant_key = ? WHERE id = ?",
+                       (detect_language(sample, filename), variant_key(filename), document_id))
+
+def select_language_variants(chunks: List[Dict], variants: Dict[str, Tuple[str, str]], language: str) -> List[Dict]:
+    """Keep the chunks of one language version per document.
+
+    variants maps filename -> (language, variant key). Within each variant
+    key the asker's language wins, then another language in the same
+    script, then whichever version scored best. Chunks without variant
+    info (company passages) are kept.
+    """
+    best: Dict[str, Dict[str, float]] = {}
+    for chunk in chunks:
+        variant = variants.get(chunk["filename"])
+        if variant:
+            scores = best.setdefault(variant[1], {})
+            scores[variant[0]] = max(scores.get(variant[0], float("-inf")), chunk.get("score", 0))
+
+    chosen = {
+        key: max(scores, key=lambda lang: (lang == language, script_of(lang) == script_of(language), scores[lang]))
+        for key, scores in best.items()
+    }
+    return [chunk for chunk in chunks
+            if chunk["filename"] not in variants
+            or chosen[variants[chunk["filename"]][1]] == variants[chunk["filename"]][0]]
@@ -0,0 +1,179 @@
+# backend/latency.py
+#
+# Fixed-memory latency histograms per endpoint and stage (retrieval,
+# context build, LLM call, DB write, ...). Values go into log-spaced
+# buckets (HDR-style): every bucket is LATENCY_PRECISION wider than the one
+# before, so percentiles are accurate to about 1% and each histogram costs
+# the same ~1k counters whether it has seen ten requests or ten million.
+#
+# The endpoint is carried in a context variable that the HTTP middleware
+# sets, so code deep inside QAEngine only names its stage.
+#
+# Each worker process keeps its own histograms; export_state() is what
+# worker_metrics writes to the shared database, and merge_states() adds the
+# bucket counts of every worker back together for /analytics/latency.
+
+import contextvars
+import math
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+MIN_SECONDS = 0.0001     # 0.1 ms; anything faster lands in the first bucket
+MAX_SECONDS = 600.0      # 10 min; anything slower lands in the last bucket
+LATENCY_PRECISION = 0.02
+
+PERCENTILES = (50, 95, 99)
+
+# Endpoints whose requests are timed by the middleware in main.py; {name}
+# segments match any one path segment and are reported by their template
+TRACKED_ENDPOINTS = ("/ask", "/upload", "/upload-multiple", "/export/email",
+                     "/uploads", "/uploads/{upload_id}/parts", "/uploads/{upload_id}/complete")
+
+_ENDPOINT_RES = [(re.compile("^" + re.sub(r"\{\w+\}", "[^/]+", endpoint) + "$"), endpoint)
+                 for endpoint in TRACKED_ENDPOINTS]
+
+def tracked_endpoint(path: str) -> Optional[str]:
+    """The TRACKED_ENDPOINTS template a request path belongs to, or None"""
+    for pattern, endpoint in _ENDPOINT_RES:
+        if pattern.match(path):
+            return endpoint
+    return None
+
+_current_endpoint = contextvars.ContextVar("latency_endpoint", default="internal")
+
+class StreamingHistogram:
+    """Log-bucketed histogram with constant memory"""
+
+    _log_growth = math.log1p(LATENCY_PRECISION)
+    num_buckets = int(math.ceil(math.log(MAX_SECONDS / MIN_SECONDS) / _log_growth)) + 1
+
+    def __init__(self):
+        self.counts = [0] * self.num_buckets
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def _bucket(self, seconds: float) -> int:
+        if seconds <= MIN_SECONDS:
+            return 0
+        index = int(math.log(seconds / MIN_SECONDS) / self._log_growth) + 1
+        return min(index, self.num_buckets - 1)
+
+    def _bucket_value(self, index: int) -> float:
+        """Geometric midpoint of a bucket"""
+        if index == 0:
+            return MIN_SECONDS
+        low = MIN_SECONDS * math.exp((index - 1) * self._log_growth)
+        return low * math.sqrt(1 + LATENCY_PRECISION)
+
+    def record(self, seconds: float):
+        self.counts[self._bucket(seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, percent: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = max(1, int(math.ceil(self.count * percent / 100)))
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                # Never report more than the slowest value actually seen
+                return min(self._bucket_value(index), self.max)
+        return self.max
+
+    def to_state(self) -> Dict[str, Any]:
+        """JSON-able counts (non-empty buckets only)"""
+        return {
+            "buckets": {str(index): count for index, count in enumerate(self.counts) if count},
+            "count": self.count,
+            "total": self.total,
+            "max": self.max,
+        }
+
+    def merge_state(self, state: Dict[str, Any]):
+        """Add another histogram's to_state() into this one"""
+        for index, count in state["buckets"].items():
+            self.counts[int(index)] += count
+        self.count += state["count"]
+        self.total += state["total"]
+        self.max = max(self.max, state["max"])
+
+    def summary(self) -> Dict[str, float]:
+        report = {"count": self.count}
+        for percent in PERCENTILES:
+            report[f"p{percent}_ms"] = round(self.percentile(percent) * 1000, 2)
+        report["mean_ms"] = round(self.total / self.count * 1000, 2) if self.count else 0
+        report["max_ms"] = round(self.max * 1000, 2)
+        return report
+
+class LatencyTracker:
+    """Histograms keyed by (endpoint, stage) for this worker process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple[str, str], StreamingHistogram] = {}
+
+    def record(self, stage: str, seconds: float, endpoint: Optional[str] = None):
+        key = (endpoint or _current_endpoint.get(), stage)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = StreamingHistogram()
+            histogram.record(seconds)
+
+    @contextmanager
+    def stage(self, stage: str, endpoint: Optional[str] = None):
+        """Time the body of a `with` block as one stage of the current endpoint"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start, endpoint)
+
+    @contextmanager
+    def request(self, endpoint: str):
+        """Mark the current request's endpoint and time it as the `total` stage"""
+        token = _current_endpoint.set(endpoint)
+        try:
+            with self.stage("total", endpoint):
+                yield
+        finally:
+            _current_endpoint.reset(token)
+
+    def snapshot(self):
+        """{endpoint: {stage: {count, p50_ms, p95_ms, p99_ms, mean_ms, max_ms}}}"""
+        with self._lock:
+            report: Dict[str, Dict[str, Dict[str, float]]] = {}
+            for (endpoint, stage), histogram in sorted(self._histograms.items()):
+                report.setdefault(endpoint, {})[stage] = histogram.summary()
+            return report
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def export_state(self) -> Dict[str, Dict[str, Any]]:
+        """{"endpoint stage": histogram state} for worker_metrics"""
+        with self._lock:
+            return {f"{endpoint} {stage}": histogram.to_state()
+                    for (endpoint, stage), histogram in self._histograms.items()}
+
+def merge_states(states: List[Dict[str, Dict[str, Any]]]):
+    """snapshot()-shaped report over the export_state() of several workers"""
+    merged: Dict[Tuple[str, str], StreamingHistogram] = {}
+    for state in states:
+        for key, histogram_state in state.items():
+            endpoint, stage = key.rsplit(" ", 1)
+            merged.setdefault((endpoint, stage), StreamingHistogram()).merge_state(histogram_state)
+    report: Dict[str, Dict[str, Dict[str, float]]] = {}
+    for (endpoint, stage), histogram in sorted(merged.items()):
+        report.setdefault(endpoint, {})[stage] = histogram.summary()
+    return report
+
+latency_tracker = LatencyTracker()
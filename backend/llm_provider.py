@@ -0,0 +1,258 @@
+# backend/llm_provider.py
+#
+# Pluggable LLM backends for answer generation. QAEngine and full_main only
+# talk to an LLMProvider (complete / stream), so the OpenAI client can be
+# swapped for the fake provider below when load testing: it sleeps for a
+# configurable time-to-first-token, emits tokens at a fixed rate and fails
+# a configurable fraction of calls, which lets us measure our own overhead
+# and tail latency without paying for (or being rate limited by) OpenAI.
+#
+# LLM_PROVIDER selects the backend: "openai" (default) or "fake".
+#
+# Callers pass the static instructions as `system` and the per-request
+# context and question as `prompt`. Keeping the system message identical
+# across requests gives the provider a stable prefix it can cache. Every
+# complete() call logs its input/output token counts.
+#
+# embed() turns texts into vectors for semantic search (backend/ann_index.py).
+# The fake provider hashes words into a fixed number of dimensions, so texts
+# that share words get similar vectors with no network involved.
+#
+# Asked for FAQ pairs (faq_cache.FAQ_SYSTEM_PROMPT), the fake provider
+# replies with a small JSON array built from the document's lines, so the
+# FAQ fast path can be exercised and load tested offline.
+
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import zlib
+from typing import Dict, Iterator, List, Optional, Tuple
+
+try:
+    from .logs import get_logger, log
+    from .faq_cache import FAQ_SYSTEM_PROMPT
+except ImportError:
+    from logs import get_logger, log
+    from faq_cache import FAQ_SYSTEM_PROMPT
+
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai").lower()
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+
+# Fake provider behaviour
+FAKE_LLM_LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", "500"))
+FAKE_LLM_JITTER_MS = float(os.getenv("FAKE_LLM_JITTER_MS", "0"))
+FAKE_LLM_TOKENS_PER_SECOND = float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "50"))
+FAKE_LLM_OUTPUT_TOKENS = int(os.getenv("FAKE_LLM_OUTPUT_TOKENS", "150"))
+FAKE_LLM_FAILURE_RATE = float(os.getenv("FAKE_LLM_FAILURE_RATE", "0"))
+FAKE_EMBEDDING_DIM = int(os.getenv("FAKE_EMBEDDING_DIM", "256"))
+
+logger = get_logger("llm")
+
+_WORD_RE = re.compile(r"\w+")
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token) for providers without usage data"""
+    return max(1, len(text) // 4) if text else 0
+
+def build_messages(prompt: str, system: Optional[str] = None) -> List[Dict[str, str]]:
+    messages = [{"role": "system", "content": system}] if system else []
+    messages.append({"role": "user", "content": prompt})
+    return messages
+
+class LLMError(Exception):
+    """Raised when a provider can't produce an answer"""
+
+class LLMProvider:
+    """Interface every LLM backend implements"""
+    name = "base"
+    model = ""
+    embedding_model = ""
+
+    def available(self) -> bool:
+        return True
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """One embedding vector per text"""
+        raise NotImplementedError
+
+    def generate(self, prompt: str, system: Optional[str] = None, temperature: float = 0.2,
+                 max_tokens: Optional[int] = None) -> Tuple[str, Dict[str, int]]:
+        """Return the answer and its token usage: input_tokens, output_tokens, cached_tokens"""
+        raise NotImplementedError
+
+    def stream(self, prompt: str, system: Optional[str] = None, temperature: float = 0.2,
+               max_tokens: Optional[int] = None) -> Iterator[str]:
+        """Yield the answer as it is generated"""
+        yield self.complete(prompt, system, temperature, max_tokens)
+
+    def complete(self, prompt: str, system: Optional[str] = None, temperature: float = 0.2,
+                 max_tokens: Optional[int] = None) -> str:
+        """Return the whole answer, logging token usage and duration"""
+        start = time.perf_counter()
+        text, usage = self.generate(prompt, system, temperature, max_tokens)
+        log(logger, logging.INFO, "LLM call", provider=self.name, model=self.model,
+            seconds=round(time.perf_counter() - start, 3), **usage)
+        return text
+
+class OpenAIProvider(LLMProvider):
+    """Chat completions via the OpenAI API"""
+    name = "openai"
+
+    def __init__(self, model: str = LLM_MODEL, embedding_model: str = EMBEDDING_MODEL):
+        self.model = model
+        self.embedding_model = embedding_model
+        # Client is created lazily once per worker process so that importing
+        # this module has no side effects and forked workers never share an
+        # HTTP connection pool
+        self._client = None
+        self._client_pid = None
+
+    @property
+    def client(self):
+        """Return this process's OpenAI client, or None if it can't be created"""
+        if self._client_pid != os.getpid():
+            try:
+                from openai import OpenAI
+                self._client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+            except Exception:
+                self._client = None
+            self._client_pid = os.getpid()
+        return self._client
+
+    def available(self) -> bool:
+        return self.client is not None
+
+    def _create(self, prompt: str, system: Optional[str], temperature: float, max_tokens: Optional[int], stream: bool):
+        if self.client is None:
+            raise LLMError("OpenAI client is not available")
+        kwargs = {"max_tokens": max_tokens} if max_tokens else {}
+        return self.client.chat.completions.create(
+            model=self.model,
+            messages=build_messages(prompt, system),
+            temperature=temperature,
+            stream=stream,
+            **kwargs
+        )
+
+    def generate(self, prompt: str, system: Optional[str] = None, temperature: float = 0.2,
+                 max_tokens: Optional[int] = None) -> Tuple[str, Dict[str, int]]:
+        response = self._create(prompt, system, temperature, max_tokens, stream=False)
+        usage = response.usage
+        # prompt_tokens_details.cached_tokens is only reported by newer API versions
+        details = getattr(usage, "prompt_tokens_details", None)
+        return response.choices[0].message.content, {
+            "input_tokens": usage.prompt_tokens if usage else 0,
+            "output_tokens": usage.completion_tokens if usage else 0,
+            "cached_tokens": (getattr(details, "cached_tokens", 0) or 0) if details else 0,
+        }
+
+    def stream(self, prompt: str, system: Optional[str] = None, temperature: float = 0.2,
+               max_tokens: Optional[int] = None) -> Iterator[str]:
+        for chunk in self._create(prompt, system, temperature, max_tokens, stream=True):
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        if self.client is None:
+            raise LLMError("OpenAI client is not available")
+        response = self.client.embeddings.create(model=self.embedding_model, input=texts)
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+class FakeLLMProvider(LLMProvider):
+    """Offline stand-in with configurable latency, token rate and failure rate"""
+    name = "fake"
+    model = "fake"
+
+    WORDS = ("the", "forging", "process", "requires", "operators", "to", "check", "die",
+             "temperature", "before", "each", "shift", "and", "record", "results", "in", "the", "log")
+
+    def __init__(self, latency_ms: float = FAKE_LLM_LATENCY_MS, jitter_ms: float = FAKE_LLM_JITTER_MS,
+                 tokens_per_second: float = FAKE_LLM_TOKENS_PER_SECOND,
+                 output_tokens: int = FAKE_LLM_OUTPUT_TOKENS, failure_rate: float = FAKE_LLM_FAILURE_RATE,
+                 embedding_dim: int = FAKE_EMBEDDING_DIM):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.failure_rate = failure_rate
+        self.embedding_dim = embedding_dim
+        self.embedding_model = f"fake-hash-{embedding_dim}"
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Signed feature hashing of the words in each text"""
+        vectors = []
+        for text in texts:
+            vector = [0.0] * self.embedding_dim
+            for word in _WORD_RE.findall(text.lower()):
+                code = zlib.crc32(word.encode("utf-8"))
+                vector[code % self.embedding_dim] += 1.0 if code & 0x80000000 else -1.0
+            vectors.append(vector)
+        return vectors
+
+    def generate(self, prompt: str, system: Optional[str] = None, temperature: float = 0.2,
+                 max_tokens: Optional[int] = None) -> Tuple[str, Dict[str, int]]:
+        text = "".join(self.stream(prompt, system, temperature, max_tokens))
+        return text, {
+            "input_tokens": estimate_tokens(system or "") + estimate_tokens(prompt),
+            "output_tokens": estimate_tokens(text),
+            "cached_tokens": 0,
+        }
+
+    def stream(self, prompt: str, system: Optional[str] = None, temperature: float = 0.2,
+               max_tokens: Optional[int] = None) -> Iterator[str]:
+        first_token_ms = max(0.0, self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms))
+        time.sleep(first_token_ms / 1000)
+        if random.random() < self.failure_rate:
+            raise LLMError("Simulated LLM failure")
+        if system == FAQ_SYSTEM_PROMPT:
+            yield self.faq_reply(prompt)
+            return
+
+        tokens = min(self.output_tokens, max_tokens) if max_tokens else self.output_tokens
+        delay = 1 / self.tokens_per_second if self.tokens_per_second > 0 else 0
+        yield f"[fake answer, {len(prompt)} prompt characters]"
+        for i in range(tokens):
+            if delay:
+                time.sleep(delay)
+            yield " " + self.WORDS[i % len(self.WORDS)]
+
+    def faq_reply(self, prompt: str) -> str:
+        """Up to three question/answer pairs, one per line of the document in the prompt"""
+        header, _, body = prompt.partition("\n\n")
+        filename = header[len("Document: "):] if header.startswith("Document: ") else "the document"
+        lines = [line.strip() for line in body.splitlines()
+                 if len(line.split()) >= 3 and not line.startswith("Write up to")]
+        pairs = [{"question": f"What does {filename} say about {' '.join(line.split()[:5])}?", "answer": line}
+                 for line in lines[:3]]
+        if not pairs:
+            pairs = [{"question": f"What is {filename} about?", "answer": body.strip()[:200] or filename}]
+        return json.dumps(pairs, ensure_ascii=False)
+
+PROVIDERS = {
+    "openai": OpenAIProvider,
+    "fake": FakeLLMProvider,
+}
+
+_provider: Optional[LLMProvider] = None
+_provider_lock = threading.Lock()
+
+def get_llm_provider() -> LLMProvider:
+    """The provider selected by LLM_PROVIDER, created on first use"""
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                if LLM_PROVIDER not in PROVIDERS:
+                    raise ValueError(f"Unknown LLM_PROVIDER {LLM_PROVIDER!r}; expected one of {sorted(PROVIDERS)}")
+                _provider = PROVIDERS[LLM_PROVIDER]()
+    return _provider
+
+def set_llm_provider(provider: LLMProvider):
+    """Replace the process-wide provider (benchmarks, tests)"""
+    global _provider
+    _provider = provider
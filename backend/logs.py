@@ -0,0 +1,49 @@
+# backend/logs.py
+#
+# Leveled, structured logging for the backend. Messages carry key=value
+# fields instead of being pre-formatted f-strings, so a disabled level
+# costs only an isEnabledFor() check. Per-chunk / per-word messages on the
+# retrieval hot path go through hot_path(), which is DEBUG and additionally
+# sampled, so it stays silent unless LOG_LEVEL=DEBUG.
+
+import logging
+import os
+import random
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+HOT_PATH_SAMPLE_RATE = float(os.getenv("HOT_PATH_LOG_SAMPLE_RATE", "0.01"))
+
+_configured = False
+
+class StructuredFormatter(logging.Formatter):
+    """`time LEVEL logger message key=value ...`"""
+
+    def format(self, record):
+        line = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join(f"{key}={value!r}" for key, value in fields.items())
+        return line
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger under the `whf` namespace, configured on first use"""
+    global _configured
+    if not _configured:
+        handler = logging.StreamHandler()
+        handler.setFormatter(StructuredFormatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+        root = logging.getLogger("whf")
+        root.addHandler(handler)
+        root.setLevel(LOG_LEVEL)
+        root.propagate = False
+        _configured = True
+    return logging.getLogger(f"whf.{name}")
+
+def log(logger: logging.Logger, level: int, message: str, exc_info=False, **fields):
+    """Log `message` with structured fields if the level is enabled"""
+    if logger.isEnabledFor(level):
+        logger.log(level, message, exc_info=exc_info, extra={"fields": fields})
+
+def hot_path(logger: logging.Logger, message: str, **fields):
+    """Sampled DEBUG message for code that runs per chunk or per word"""
+    if logger.isEnabledFor(logging.DEBUG) and random.random() < HOT_PATH_SAMPLE_RATE:
+        logger.debug(message, extra={"fields": dict(fields, sampled=HOT_PATH_SAMPLE_RATE)})
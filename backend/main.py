@@ -1,22 +1,32 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, status
+from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, Request, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.security import HTTPAuthorizationCredentials
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 import os
+import asyncio
+import shutil
 import time
 import tempfile
 from datetime import datetime
 import sqlite3
-import bcrypt
 import uuid
 import json
 
 # Import local modules
-from .auth import auth_manager, get_current_user, get_current_user_optional, get_user_by_email, create_user, verify_user_credentials
+from .auth import auth_manager, security, get_current_user, get_current_user_optional, get_current_user_role, UserRole, get_user_by_email, create_user_async, verify_user_credentials_async, user_db_pool, last_login_batcher
 from .qa_engine import qa_engine
 from .database import DatabaseManager
 from .company_data import CompanyDataManager
+from .intent_router import intent_stats, IntentStats
+from .single_flight import ask_flights, SingleFlight
+from .latency import latency_tracker, tracked_endpoint, merge_states
+from .faq_cache import FAQStore
+from .worker_metrics import worker_metrics
+from .export import EXPORT_MAX_ENTRIES, session_entries, render_pdf_async, render_entry_async, stream_zip, email_exporter
+from .outbox import email_outbox
+from .upload_sessions import UploadError, upload_sessions
 
 app = FastAPI(title="WHF AI Chatbot API", version="2.0.0")
 
@@ -29,10 +39,44 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize managers
+@app.middleware("http")
+async def track_latency(request, call_next):
+    """Per-endpoint latency histograms; stages inside are recorded by QAEngine"""
+    endpoint = tracked_endpoint(request.url.path)
+    if endpoint is None:
+        return await call_next(request)
+    with latency_tracker.request(endpoint):
+        return await call_next(request)
+
+# Initialize managers (cheap - no database or network I/O at import time)
 db_manager = DatabaseManager()
 company_data = CompanyDataManager()
 
+# Per-worker counters, flushed to documents.db so reports cover every worker
+worker_metrics.register("latency", latency_tracker.export_state)
+worker_metrics.register("intents", intent_stats.export_state)
+worker_metrics.register("coalescing", ask_flights.export_state)
+worker_metrics.register("faq", lambda: qa_engine.faq_store.export_state())
+
+@app.on_event("startup")
+async def init_worker():
+    """Per-process initialization; runs once in every uvicorn/gunicorn worker"""
+    with user_db_pool.connection():
+        pass
+    db_manager.db._connect().close()
+    if qa_engine.use_sparse_search():
+        qa_engine.sparse_index.ensure_loaded()
+    # Deliver emails still queued from before a restart
+    email_outbox.start()
+    worker_metrics.start()
+    print(f"Worker {os.getpid()} ready")
+
+@app.on_event("shutdown")
+async def shutdown_worker():
+    """Write out anything still buffered in this worker"""
+    last_login_batcher.flush()
+    worker_metrics.flush()
+
 # Pydantic models
 class QuestionRequest(BaseModel):
     question: str
@@ -47,12 +91,34 @@ class RegisterRequest(BaseModel):
     password: str
     name: str
 
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+class LogoutRequest(BaseModel):
+    refresh_token: Optional[str] = None
+
 class ExportRequest(BaseModel):
     question: str
     answer: str
     source_files: Optional[List[str]] = None
     metadata: Optional[Dict[str, Any]] = None
 
+class EmailExportRequest(ExportRequest):
+    to_email: str
+    subject: Optional[str] = None
+    message: Optional[str] = None
+
+class BatchExportRequest(BaseModel):
+    session_id: Optional[str] = None
+    start_date: Optional[str] = None  # YYYY-MM-DD
+    end_date: Optional[str] = None    # YYYY-MM-DD, inclusive
+    format: str = "pdf"               # "pdf" (one file) or "zip" (one PDF per answer)
+
+class UploadSessionRequest(BaseModel):
+    filename: str
+    size: int
+    sha256: Optional[str] = None  # hex digest of the whole file, checked on completion
+
 class ChatHistoryRequest(BaseModel):
     limit: int = 50
     offset: int = 0
@@ -60,7 +126,13 @@ class ChatHistoryRequest(BaseModel):
 # Health check endpoint
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "timestamp": datetime.utcnow().isoformat()}
+    return {
+        "status": "healthy",
+        "timestamp": datetime.utcnow().isoformat(),
+        # Per worker: a failing index shows up as fallbacks, not a silent mode switch
+        "worker_pid": os.getpid(),
+        "search": qa_engine.search_status()
+    }
 
 # Authentication endpoints
 @app.post("/auth/register")
@@ -82,7 +154,7 @@ async def register(request: RegisterRequest):
             )
         
         # Create user
-        user_id = create_user(request.email, request.password, request.name)
+        user_id = await create_user_async(request.email, request.password, request.name)
         
         if user_id is None:
             raise HTTPException(
@@ -109,19 +181,24 @@ async def login(request: LoginRequest):
     """Email/password login with proper authentication"""
     try:
         # Verify user credentials
-        user = verify_user_credentials(request.email, request.password)
+        user = await verify_user_credentials_async(request.email, request.password)
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid email or password"
             )
         
+        # Count the login in the analytics rollups (a SQLite write, so off the event loop)
+        await asyncio.to_thread(db_manager.record_login, user["id"])
+        
         # Generate JWT token
         token_data = {"sub": user["id"], "email": user["email"], "role": user["role"]}
         access_token = auth_manager.create_access_token(token_data)
+        refresh_token = auth_manager.create_refresh_token(token_data)
         
         return {
             "access_token": access_token,
+            "refresh_token": refresh_token,
             "token_type": "bearer",
             "user": {
                 "user_id": user["id"],
@@ -138,6 +215,80 @@ async def login(request: LoginRequest):
             detail=f"Login failed: {str(e)}"
         )
 
+# Plain def: the JWT and users.db work runs in FastAPI's threadpool, not on the event loop
+@app.post("/auth/refresh")
+def refresh(request: RefreshRequest):
+    """Exchange a refresh token for a new access/refresh token pair"""
+    access_token, refresh_token = auth_manager.refresh_tokens(request.refresh_token)
+    return {
+        "access_token": access_token,
+        "refresh_token": refresh_token,
+        "token_type": "bearer"
+    }
+
+@app.post("/auth/logout")
+def logout(
+    request: LogoutRequest,
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Revoke the current access token (and refresh token, if given)"""
+    auth_manager.revoke_token(credentials.credentials)
+    if request.refresh_token:
+        try:
+            auth_manager.revoke_token(request.refresh_token, token_type="refresh")
+        except HTTPException:
+            pass  # already expired or revoked
+    return {"message": "Logged out"}
+
+# Supported upload formats
+ALLOWED_UPLOAD_TYPES = ["pdf", "xlsx", "xls", "png", "jpg", "jpeg", "csv", "txt", "doc", "docx", "ppt", "pptx"]
+
+def upload_extension(filename):
+    """Lower-case extension of an upload, or 400 if the format isn't supported"""
+    file_extension = filename.split(".")[-1].lower()
+    if file_extension not in ALLOWED_UPLOAD_TYPES:
+        raise HTTPException(status_code=400, detail="File type not supported")
+    return file_extension
+
+async def ingest_file(file_path, filename, size, current_user, start_time):
+    """Record an upload and extract its content from file_path (the caller removes the file)"""
+    file_extension = upload_extension(filename)
+    
+    # Store in database first
+    try:
+        with latency_tracker.stage("db_write"):
+            result = db_manager.store_document(filename, size, current_user)
+        if not result:
+            raise HTTPException(status_code=500, detail="Failed to store document in database")
+    except HTTPException:
+        raise
+    except Exception as db_error:
+        print(f"Database error: {db_error}")
+        raise HTTPException(status_code=500, detail=f"Database error: {str(db_error)}")
+    
+    # Process file content for AI understanding
+    try:
+        # Extract and process all content (text, tables, images)
+        processed = await qa_engine.process_file(file_path, filename, current_user)
+    except Exception as process_error:
+        print(f"Processing error: {process_error}")
+        processed = False
+    
+    if processed:
+        message = "File uploaded and fully processed for AI understanding"
+    elif file_extension in ["xlsx", "xls"]:
+        # For Excel files, consider it processed even if some sheets fail
+        message, processed = "File uploaded and processed for AI understanding", True
+    else:
+        message = "File uploaded (processing failed)"
+    return {
+        "message": message,
+        "filename": filename,
+        "size": size,
+        "processing_time": time.time() - start_time,
+        "processed": processed
+    }
+
 # File upload endpoint (protected)
 @app.post("/upload")
 async def upload_file(
@@ -149,84 +300,21 @@ async def upload_file(
     
     try:
         # Validate file type - support all common formats
-        allowed_types = ["pdf", "xlsx", "xls", "png", "jpg", "jpeg", "csv", "txt", "doc", "docx", "ppt", "pptx"]
-        file_extension = file.filename.split(".")[-1].lower()
-        
-        if file_extension not in allowed_types:
-            raise HTTPException(status_code=400, detail="File type not supported")
+        file_extension = upload_extension(file.filename)
         
-        # Read file content
-        content = await file.read()
+        # Stream the (already spooled) upload to a temp file for the
+        # extractors instead of reading it into memory
+        with tempfile.NamedTemporaryFile(delete=False, suffix=f".{file_extension}") as tmp_file:
+            await asyncio.to_thread(shutil.copyfileobj, file.file, tmp_file, 1024 * 1024)
+            size = tmp_file.tell()
+            tmp_file_path = tmp_file.name
         
-        # Store in database first
         try:
-            result = db_manager.store_document(file.filename, len(content), current_user)
-            if not result:
-                raise HTTPException(status_code=500, detail="Failed to store document in database")
-        except Exception as db_error:
-            print(f"Database error: {db_error}")
-            raise HTTPException(status_code=500, detail=f"Database error: {str(db_error)}")
-        
-        # Process file content for AI understanding
-        try:
-            # Save file temporarily for processing
-            with tempfile.NamedTemporaryFile(delete=False, suffix=f".{file_extension}") as tmp_file:
-                tmp_file.write(content)
-                tmp_file_path = tmp_file.name
-            
-            # Extract and process all content (text, tables, images)
-            success = await qa_engine.process_file(tmp_file_path, file.filename, current_user)
-            
+            return await ingest_file(tmp_file_path, file.filename, size, current_user, start_time)
+        finally:
             # Clean up
             os.unlink(tmp_file_path)
             
-            if success:
-                return {
-                    "message": "File uploaded and fully processed for AI understanding",
-                    "filename": file.filename,
-                    "size": len(content),
-                    "processing_time": time.time() - start_time,
-                    "processed": True
-                }
-            else:
-                # For Excel files, consider it processed even if some sheets fail
-                if file_extension in ["xlsx", "xls"]:
-                    return {
-                        "message": "File uploaded and processed for AI understanding",
-                        "filename": file.filename,
-                        "size": len(content),
-                        "processing_time": time.time() - start_time,
-                        "processed": True
-                    }
-                else:
-                    return {
-                        "message": "File uploaded (processing failed)",
-                        "filename": file.filename,
-                        "size": len(content),
-                        "processing_time": time.time() - start_time,
-                        "processed": False
-                    }
-                
-        except Exception as process_error:
-            print(f"Processing error: {process_error}")
-            # For Excel files, consider it processed even if there are errors
-            if file_extension in ["xlsx", "xls"]:
-                return {
-                    "message": "File uploaded and processed for AI understanding",
-                    "filename": file.filename,
-                    "size": len(content),
-                    "processing_time": time.time() - start_time,
-                    "processed": True
-                }
-            else:
-                return {
-                    "message": "File uploaded (processing failed)",
-                    "filename": file.filename,
-                    "size": len(content),
-                    "processing_time": time.time() - start_time,
-                    "processed": False
-                }
-            
     except HTTPException:
         raise
     except Exception as e:
@@ -235,6 +323,74 @@ async def upload_file(
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Upload error: {str(e)}")
 
+# Resumable uploads: open a session, PUT parts at the returned offset
+# (resume from GET's offset after a dropped connection), then complete
+@app.post("/uploads")
+async def create_upload_session(
+    request: UploadSessionRequest,
+    current_user: str = Depends(get_current_user)
+):
+    """Start a resumable upload"""
+    upload_extension(request.filename)
+    try:
+        return await asyncio.to_thread(upload_sessions.create, request.filename, request.size,
+                                       current_user, request.sha256)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+@app.get("/uploads/{upload_id}")
+async def get_upload_session(upload_id: str, current_user: str = Depends(get_current_user)):
+    """Offset to continue a resumable upload from"""
+    try:
+        return await asyncio.to_thread(upload_sessions.status, upload_id, current_user)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+@app.put("/uploads/{upload_id}/parts")
+async def append_upload_part(
+    upload_id: str,
+    offset: int,
+    request: Request,
+    current_user: str = Depends(get_current_user)
+):
+    """Append the raw request body at offset; the body is streamed to disk"""
+    try:
+        return await upload_sessions.append(upload_id, current_user, offset, request.stream())
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+@app.post("/uploads/{upload_id}/complete")
+async def complete_upload_session(upload_id: str, current_user: str = Depends(get_current_user)):
+    """Verify a resumable upload and process it like /upload"""
+    start_time = time.time()
+    try:
+        upload = await asyncio.to_thread(upload_sessions.complete, upload_id, current_user)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    
+    # Extraction reads the assembled file in place. The session stays claimed
+    # meanwhile, so a concurrent or retried completion gets 409 rather than
+    # ingesting the file a second time
+    try:
+        result = await ingest_file(upload["path"], upload["filename"], upload["size"], current_user, start_time)
+    except Exception:
+        # ingest_file only raises before the document is stored; let the client retry
+        await asyncio.to_thread(upload_sessions.reopen, upload_id, upload["claim"])
+        raise
+    # A session deleted meanwhile counts as already cleaned up
+    await asyncio.to_thread(upload_sessions.finish, upload_id, upload["filename"], upload["claim"])
+    result["sha256"] = upload["sha256"]
+    return result
+
+@app.delete("/uploads/{upload_id}")
+async def abort_upload_session(upload_id: str, current_user: str = Depends(get_current_user)):
+    """Discard a resumable upload and its data"""
+    try:
+        await asyncio.to_thread(upload_sessions.abort, upload_id, current_user)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    return {"message": "Upload discarded"}
+
 @app.post("/upload-multiple")
 async def upload_multiple_files(
     files: List[UploadFile] = File(...),
@@ -291,7 +447,8 @@ async def ask_question(
         }
         
         # Save to SQLite
-        db_manager.store_chat_history(chat_entry)
+        with latency_tracker.stage("db_write"):
+            db_manager.store_chat_history(chat_entry)
         
         return {
             "answer": answer,
@@ -369,6 +526,103 @@ async def delete_chat_session(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Batch export endpoint (protected)
+@app.post("/export/batch")
+async def export_batch(
+    request: BatchExportRequest,
+    current_user: str = Depends(get_current_user)
+):
+    """Export a chat session or a date range of Q&A history as one PDF or a ZIP of PDFs"""
+    if request.format not in ("pdf", "zip"):
+        raise HTTPException(status_code=400, detail="format must be 'pdf' or 'zip'")
+    
+    try:
+        if request.session_id:
+            session = db_manager.get_chat_session(request.session_id, current_user)
+            if session is None:
+                raise HTTPException(status_code=404, detail="Chat session not found")
+            entries = session_entries(session["messages"])
+            title = f"Chat session: {session['title'] or request.session_id}"
+            name = f"whf_session_{request.session_id[:8]}"
+        elif request.start_date or request.end_date:
+            for value in (request.start_date, request.end_date):
+                if value:
+                    datetime.strptime(value, "%Y-%m-%d")
+            entries = db_manager.get_chat_history_range(
+                current_user, request.start_date, request.end_date, limit=EXPORT_MAX_ENTRIES + 1
+            )
+            title = f"Q&A history {request.start_date or '...'} to {request.end_date or 'today'}"
+            name = f"whf_qa_{request.start_date or 'start'}_{request.end_date or 'today'}"
+        else:
+            raise HTTPException(status_code=400, detail="Give a session_id or a start_date/end_date range")
+    except HTTPException:
+        raise
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be YYYY-MM-DD")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    if not entries:
+        raise HTTPException(status_code=404, detail="Nothing to export")
+    if len(entries) > EXPORT_MAX_ENTRIES:
+        raise HTTPException(status_code=413, detail=f"Export is limited to {EXPORT_MAX_ENTRIES} answers; narrow the date range")
+    
+    if request.format == "zip":
+        return StreamingResponse(
+            stream_zip(entries, title),
+            media_type="application/zip",
+            headers={"Content-Disposition": f'attachment; filename="{name}.zip"'}
+        )
+    
+    pdf_content = await render_pdf_async(entries, title)
+    return StreamingResponse(
+        iter([pdf_content[i:i + 65536] for i in range(0, len(pdf_content), 65536)]),
+        media_type="application/pdf",
+        headers={"Content-Disposition": f'attachment; filename="{name}.pdf"'}
+    )
+
+@app.post("/export/email", status_code=status.HTTP_202_ACCEPTED)
+async def email_export(
+    request: EmailExportRequest,
+    current_user: str = Depends(get_current_user)
+):
+    """Render an answer as PDF and queue it for email; poll /email/{email_id} for delivery"""
+    if "@" not in request.to_email:
+        raise HTTPException(status_code=400, detail="Invalid email address")
+    # Refuse up front rather than queue mail that can never be sent
+    transport_error = email_outbox.configuration_error()
+    if transport_error:
+        raise HTTPException(status_code=503, detail=transport_error)
+    
+    entry = {
+        "question": request.question,
+        "answer": request.answer,
+        "source_files": request.source_files,
+        "metadata": request.metadata
+    }
+    pdf_content = await render_entry_async(entry, "WHF AI Assistant Response")
+    # Queuing inserts the whole PDF into SQLite; keep it off the event loop
+    result = await asyncio.to_thread(
+        email_exporter.send_pdf_email,
+        request.to_email,
+        request.subject or "Your WHF AI Assistant response",
+        pdf_content,
+        f"whf_response_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf",
+        request.message,
+        user_id=current_user
+    )
+    if not result["success"]:
+        raise HTTPException(status_code=503 if result.get("configured") is False else 500, detail=result["error"])
+    return result
+
+@app.get("/email/{email_id}")
+async def get_email_status(email_id: str, current_user: str = Depends(get_current_user)):
+    """Delivery status of a queued email: queued, sending, sent or failed"""
+    report = await asyncio.to_thread(email_exporter.get_status, email_id, current_user)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Email not found")
+    return report
+
 # Documents endpoint (protected)
 @app.get("/documents")
 async def get_documents(current_user: str = Depends(get_current_user)):
@@ -394,6 +648,16 @@ async def get_documents_list(current_user: str = Depends(get_current_user)):
         print(f"Error getting document list: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/documents/{filename}/duplicates")
+async def get_document_duplicates(filename: str, current_user: str = Depends(get_current_user)):
+    """Near-duplicate chunk clusters (MinHash/LSH) that include chunks of this document"""
+    if not qa_engine.use_near_duplicates():
+        raise HTTPException(status_code=503, detail="Near-duplicate detection needs NumPy")
+    report = await asyncio.to_thread(qa_engine.near_duplicates.document_report, filename, current_user)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return report
+
 @app.delete("/documents/{filename}")
 async def delete_document(
     filename: str,
@@ -403,6 +667,7 @@ async def delete_document(
     try:
         success = db_manager.delete_document(filename, current_user)
         if success:
+            qa_engine.on_document_deleted(filename)
             return {"message": f"Document {filename} deleted successfully"}
         else:
             raise HTTPException(status_code=404, detail="Document not found")
@@ -414,20 +679,60 @@ async def clear_documents(current_user: str = Depends(get_current_user)):
     """Clear all user's documents"""
     try:
         db_manager.clear_documents(current_user)
+        qa_engine.on_documents_cleared()
         return {"message": "All documents cleared successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # Analytics endpoint (protected)
 @app.get("/analytics/stats")
-async def get_analytics_stats(current_user: str = Depends(get_current_user)):
-    """Get user's analytics statistics"""
+async def get_analytics_stats(
+    days: int = 30,
+    scope: str = "user",
+    current_user: str = Depends(get_current_user),
+    role: str = Depends(get_current_user_role)
+):
+    """Get user's analytics statistics plus dashboard aggregates for the last `days` days.
+    
+    scope="all" (site-wide aggregates) is for admins only."""
+    if scope not in ("user", "all"):
+        raise HTTPException(status_code=400, detail="scope must be 'user' or 'all'")
+    if scope == "all" and role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Site-wide analytics require the admin role")
     try:
-        stats = db_manager.get_user_stats(current_user)
+        stats = await asyncio.to_thread(db_manager.get_user_stats, current_user)
+        # Dashboard numbers are read from the hourly/daily rollups
+        stats["scope"] = scope
+        stats["dashboard"] = await asyncio.to_thread(
+            db_manager.get_dashboard_stats, days, current_user if scope == "user" else None
+        )
         return stats
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/analytics/intents")
+async def get_intent_stats(current_user: str = Depends(get_current_user)):
+    """Per-intent request counts and latency for /ask, plus coalescing and FAQ hit counts (all workers)"""
+    try:
+        report = await asyncio.to_thread(worker_metrics.report, ["intents", "coalescing", "faq"])
+        return {
+            "workers": report["workers"],
+            "intents": IntentStats.merged_snapshot(report["intents"]),
+            "coalescing": SingleFlight.merged_snapshot(report["coalescing"]),
+            "faq": FAQStore.merged_snapshot(report["faq"])
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/analytics/latency")
+async def get_latency_stats(current_user: str = Depends(get_current_user)):
+    """p50/p95/p99 latency per endpoint and stage, merged over all workers"""
+    try:
+        report = await asyncio.to_thread(worker_metrics.report, ["latency"])
+        return {"workers": report["workers"], "latency": merge_states(report["latency"])}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 # Company info endpoint
 @app.get("/company/info")
 async def get_company_info():
@@ -0,0 +1,325 @@
+# backend/near_duplicates.py
+#
+# Near-duplicate chunks via MinHash signatures and LSH banding.
+#
+# Every stored chunk (metadata header stripped) is cut into overlapping
+# word 5-grams and summarised by NEAR_DUP_PERMUTATIONS min-hashes; the share
+# of equal positions in two signatures estimates the Jaccard similarity of
+# their shingle sets. The signature is also split into NEAR_DUP_BANDS bands
+# and each band hashed into a bucket, so chunks sharing any bucket are the
+# only pairs worth comparing (with 16 bands of 8 rows, pairs at Jaccard 0.7
+# collide about half the time and pairs at 0.9 almost always).
+#
+# Signatures and buckets are written at ingest, next to the chunks. At
+# query time search results are diversified: walking down the ranking, a
+# chunk is skipped when it is NEAR_DUP_THRESHOLD-similar to one already
+# kept, so repeated WI boilerplate and revision copies don't crowd out
+# distinct content. document_report() lists the duplicate clusters a
+# document belongs to, across every document the user can see.
+
+import logging
+import os
+import time
+import zlib
+from typing import Dict, List, Optional
+
+try:
+    from .shared_state import connect
+    from .embedding_pipeline import strip_chunk_header, text_hash
+    from .language import tokenize
+    from .logs import get_logger, log
+except ImportError:
+    from shared_state import connect
+    from embedding_pipeline import strip_chunk_header, text_hash
+    from language import tokenize
+    from logs import get_logger, log
+
+NEAR_DUP_DIVERSIFY = os.getenv("NEAR_DUP_DIVERSIFY", "true").lower() == "true"
+# Estimated Jaccard similarity at which two chunks count as duplicates
+NEAR_DUP_THRESHOLD = float(os.getenv("NEAR_DUP_THRESHOLD", "0.7"))
+# Index searches fetch this many times top_k so diversified results stay full
+NEAR_DUP_OVERFETCH = int(os.getenv("NEAR_DUP_OVERFETCH", "2"))
+NEAR_DUP_PERMUTATIONS = 128
+NEAR_DUP_BANDS = 16
+SHINGLE_WORDS = 5
+
+# Universal hashing (a * x + b) mod p over 32-bit shingle hashes
+_PRIME = 4294967311
+_EMPTY = 0xFFFFFFFF
+
+logger = get_logger("near_duplicates")
+
+def create_near_duplicate_tables(cursor):
+    """Create the MinHash signature and LSH bucket tables (caller commits)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS chunk_minhash (
+            chunk_id INTEGER PRIMARY KEY,
+            document_id INTEGER NOT NULL,
+            text_hash TEXT NOT NULL,
+            signature BLOB NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_chunk_minhash_hash ON chunk_minhash (text_hash)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_chunk_minhash_document ON chunk_minhash (document_id)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS chunk_lsh (
+            band INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            chunk_id INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_chunk_lsh_bucket ON chunk_lsh (band, bucket)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_chunk_lsh_chunk ON chunk_lsh (chunk_id)')
+
+def shingles(text: str) -> List[int]:
+    """crc32 of every SHINGLE_WORDS-word window (one window for short texts)"""
+    words = tokenize(strip_chunk_header(text))
+    if not words:
+        return []
+    width = min(SHINGLE_WORDS, len(words))
+    return list({zlib.crc32(" ".join(words[i:i + width]).encode("utf-8"))
+                 for i in range(len(words) - width + 1)})
+
+class MinHasher:
+    """Fixed hash family, so signatures from any process are comparable"""
+
+    def __init__(self, permutations: int = NEAR_DUP_PERMUTATIONS, seed: int = 1):
+        import numpy as np
+
+        rng = np.random.default_rng(seed)
+        # a < 2^31 and x < 2^32 keep a * x + b inside uint64
+        self.a = rng.integers(1, 1 << 31, permutations, dtype=np.uint64)
+        self.b = rng.integers(0, 1 << 32, permutations, dtype=np.uint64)
+
+    def signature(self, text: str):
+        import numpy as np
+
+        values = np.asarray(shingles(text), dtype=np.uint64)
+        if len(values) == 0:
+            return np.full(len(self.a), _EMPTY, dtype=np.uint32)
+        hashed = (np.outer(self.a, values) + self.b[:, None]) % np.uint64(_PRIME)
+        return hashed.min(axis=1).astype(np.uint32)
+
+def is_empty(signature) -> bool:
+    return bool((signature == _EMPTY).all())
+
+def similarity(first, second) -> float:
+    """Estimated Jaccard similarity of two signatures"""
+    if is_empty(first) or is_empty(second):
+        return 0.0
+    return float((first == second).mean())
+
+def band_buckets(signature) -> List[int]:
+    rows = len(signature) // NEAR_DUP_BANDS
+    return [zlib.crc32(signature[band * rows:(band + 1) * rows].tobytes()) for band in range(NEAR_DUP_BANDS)]
+
+class NearDuplicateIndex:
+    def __init__(self, db_path: str = "documents.db"):
+        self.db_path = db_path
+        self.hasher = MinHasher()
+        self._ready = False
+
+    def _connect(self):
+        conn = connect(self.db_path)
+        if not self._ready:
+            create_near_duplicate_tables(conn.cursor())
+            conn.commit()
+            self._ready = True
+        return conn
+
+    # ---- ingest ----
+
+    def _store(self, conn, rows):
+        """Signatures and buckets for (chunk rowid, document id, content) rows"""
+        signatures, buckets = [], []
+        for chunk_id, document_id, content in rows:
+            signature = self.hasher.signature(content)
+            signatures.append((chunk_id, document_id, text_hash(strip_chunk_header(content)), signature.tobytes()))
+            if not is_empty(signature):
+                buckets.extend((band, bucket, chunk_id) for band, bucket in enumerate(band_buckets(signature)))
+        conn.executemany('INSERT OR REPLACE INTO chunk_minhash (chunk_id, document_id, text_hash, signature) '
+                         'VALUES (?, ?, ?, ?)', signatures)
+        conn.executemany('INSERT INTO chunk_lsh (band, bucket, chunk_id) VALUES (?, ?, ?)', buckets)
+
+    def prune(self, conn=None):
+        """Drop signatures of chunks whose document is gone (deleted or re-uploaded)"""
+        own = conn is None
+        conn = conn or self._connect()
+        try:
+            conn.execute('''
+                DELETE FROM chunk_lsh WHERE chunk_id IN (
+                    SELECT chunk_id FROM chunk_minhash WHERE document_id NOT IN (SELECT id FROM documents)
+                )
+            ''')
+            conn.execute('DELETE FROM chunk_minhash WHERE document_id NOT IN (SELECT id FROM documents)')
+            if own:
+                conn.commit()
+        finally:
+            if own:
+                conn.close()
+
+    def add_document(self, document_id: int):
+        """Sign the chunks of a freshly stored document"""
+        start = time.perf_counter()
+        conn = self._connect()
+        try:
+            rows = conn.execute('SELECT id, document_id, content FROM document_chunks WHERE document_id = ? ORDER BY id',
+                                (document_id,)).fetchall()
+            self.prune(conn)
+            self._store(conn, rows)
+            conn.commit()
+        finally:
+            conn.close()
+        log(logger, logging.DEBUG, "Signed chunks", document_id=document_id, chunks=len(rows),
+            seconds=round(time.perf_counter() - start, 3))
+
+    def ensure_indexed(self):
+        """Sign chunks stored before signatures existed"""
+        conn = self._connect()
+        try:
+            rows = conn.execute('''
+                SELECT dc.id, dc.document_id, dc.content
+                FROM document_chunks dc
+                JOIN documents d ON dc.document_id = d.id
+                LEFT JOIN chunk_minhash m ON m.chunk_id = dc.id
+                WHERE m.chunk_id IS NULL
+            ''').fetchall()
+            if rows:
+                self.prune(conn)
+                self._store(conn, rows)
+                conn.commit()
+                log(logger, logging.INFO, "Signed existing chunks", chunks=len(rows))
+        finally:
+            conn.close()
+
+    # ---- query time ----
+
+    def signatures_for(self, contents: List[str]):
+        """Stored signatures looked up by content hash; anything else
+        (company passages, chunks not signed yet) is signed on the fly"""
+        import numpy as np
+
+        keys = [text_hash(strip_chunk_header(content)) for content in contents]
+        stored = {}
+        conn = self._connect()
+        try:
+            unique = list(set(keys))
+            for start in range(0, len(unique), 500):
+                part = unique[start:start + 500]
+                placeholders = ",".join("?" for _ in part)
+                stored.update(conn.execute(f'SELECT text_hash, signature FROM chunk_minhash '
+                                           f'WHERE text_hash IN ({placeholders})', part).fetchall())
+        finally:
+            conn.close()
+        return [np.frombuffer(stored[key], dtype=np.uint32) if key in stored else self.hasher.signature(content)
+                for key, content in zip(keys, contents)]
+
+    def diversify(self, chunks: List[Dict], top_k: Optional[int] = 50, threshold: float = NEAR_DUP_THRESHOLD):
+        """Best-first chunks with near-duplicates of a higher-ranked chunk removed"""
+        import numpy as np
+
+        if len(chunks) < 2:
+            return chunks
+        candidates = chunks[:top_k * NEAR_DUP_OVERFETCH] if top_k and top_k > 0 else chunks
+        signatures = self.signatures_for([chunk['content'] for chunk in candidates])
+        kept, kept_signatures = [], []
+        for chunk, signature in zip(candidates, signatures):
+            if kept_signatures and not is_empty(signature):
+                matches = (np.stack(kept_signatures) == signature).mean(axis=1)
+                if matches.max() >= threshold:
+                    continue
+            kept.append(chunk)
+            if not is_empty(signature):
+                kept_signatures.append(signature)
+            if top_k and top_k > 0 and len(kept) == top_k:
+                break
+        if len(kept) < len(candidates):
+            log(logger, logging.DEBUG, "Collapsed near-duplicate chunks", kept=len(kept), candidates=len(candidates))
+        return kept
+
+    # ---- reporting ----
+
+    def document_report(self, filename: str, user_id: Optional[str] = None,
+                        threshold: float = NEAR_DUP_THRESHOLD) -> Optional[Dict]:
+        """Duplicate clusters containing chunks of filename, or None if the
+        document does not exist for this user"""
+        import numpy as np
+
+        self.ensure_indexed()
+        conn = self._connect()
+        try:
+            owner_clause = ' AND d.user_id = ?' if user_id else ''
+            owner_args = (user_id,) if user_id else ()
+            document = conn.execute('SELECT id FROM documents d WHERE d.filename = ?' + owner_clause,
+                                    (filename, *owner_args)).fetchone()
+            if not document:
+                return None
+            own = conn.execute('''
+                SELECT m.chunk_id FROM chunk_minhash m WHERE m.document_id = ?
+            ''', document).fetchall()
+            # Every chunk sharing an LSH bucket with one of ours
+            pairs = conn.execute(f'''
+                SELECT DISTINCT mine.chunk_id, other.chunk_id
+                FROM chunk_minhash m
+                JOIN chunk_lsh mine ON mine.chunk_id = m.chunk_id
+                JOIN chunk_lsh other ON other.band = mine.band AND other.bucket = mine.bucket
+                    AND other.chunk_id != mine.chunk_id
+                JOIN chunk_minhash om ON om.chunk_id = other.chunk_id
+                JOIN documents d ON d.id = om.document_id
+                WHERE m.document_id = ?{owner_clause}
+            ''', (document[0], *owner_args)).fetchall()
+            members = {chunk_id for pair in pairs for chunk_id in pair}
+            details = {}
+            if members:
+                placeholders = ",".join("?" for _ in members)
+                for chunk_id, signature, name, index, content in conn.execute(f'''
+                    SELECT m.chunk_id, m.signature, d.filename, dc.chunk_id, dc.content
+                    FROM chunk_minhash m
+                    JOIN document_chunks dc ON dc.id = m.chunk_id
+                    JOIN documents d ON d.id = m.document_id
+                    WHERE m.chunk_id IN ({placeholders})
+                ''', list(members)):
+                    details[chunk_id] = (np.frombuffer(signature, dtype=np.uint32), name, index, content)
+        finally:
+            conn.close()
+
+        # Union-find over the candidate pairs that really are similar
+        parent = {chunk_id: chunk_id for chunk_id in details}
+
+        def find(chunk_id):
+            while parent[chunk_id] != chunk_id:
+                parent[chunk_id] = parent[parent[chunk_id]]
+                chunk_id = parent[chunk_id]
+            return chunk_id
+
+        for first, second in pairs:
+            if first in details and second in details and \
+                    similarity(details[first][0], details[second][0]) >= threshold:
+                parent[find(first)] = find(second)
+
+        groups: Dict[int, List[int]] = {}
+        for chunk_id in details:
+            groups.setdefault(find(chunk_id), []).append(chunk_id)
+
+        own_ids = {row[0] for row in own}
+        clusters = []
+        for group in groups.values():
+            if len(group) < 2 or not own_ids.intersection(group):
+                continue
+            group.sort(key=lambda chunk_id: (details[chunk_id][1] != filename, details[chunk_id][1], details[chunk_id][2]))
+            first = details[group[0]]
+            clusters.append({
+                "size": len(group),
+                "min_similarity": round(min(similarity(first[0], details[chunk_id][0]) for chunk_id in group[1:]), 3),
+                "preview": " ".join(strip_chunk_header(first[3]).split())[:160],
+                "members": [{"filename": details[chunk_id][1], "chunk": details[chunk_id][2]} for chunk_id in group],
+            })
+        clusters.sort(key=lambda cluster: -cluster["size"])
+        return {
+            "filename": filename,
+            "chunks": len(own_ids),
+            "duplicate_chunks": sum(1 for cluster in clusters for member in cluster["members"]
+                                    if member["filename"] == filename),
+            "threshold": threshold,
+            "clusters": clusters,
+        }
@@ -0,0 +1,394 @@
+# backend/outbox.py
+#
+# Durable outbound email queue. Requests only insert a row into the
+# email_outbox table (documents.db) and return its id; a background sender
+# thread in each worker process claims due messages in batches, hands them
+# to the configured transport and records the outcome. Failed sends are
+# retried with exponential backoff until EMAIL_MAX_ATTEMPTS, so a slow or
+# flaky mail provider never blocks a request.
+#
+# EMAIL_TRANSPORT picks the transport:
+#   - "sendgrid": SendGrid API (SENDGRID_API_KEY)
+#   - "smtp":     any SMTP server (EMAIL_SMTP_HOST/PORT, optional login/TLS);
+#                 smtp_sink.py is a local stand-in for offline testing
+#   - "file":     writes every message as an .eml file to EMAIL_SINK_DIR
+#
+# A transport that can't work as configured (unknown name, SendGrid without
+# an API key or package) makes enqueue() raise EmailNotConfigured instead of
+# accepting mail that could never be delivered, and start() leaves earlier
+# queued mail alone until the configuration is fixed.
+
+import base64
+import importlib.util
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+try:
+    from .shared_state import connect
+    from .logs import get_logger, log
+except ImportError:
+    from shared_state import connect
+    from logs import get_logger, log
+
+EMAIL_TRANSPORT = os.getenv("EMAIL_TRANSPORT", "sendgrid").lower()
+EMAIL_BATCH_SIZE = int(os.getenv("EMAIL_BATCH_SIZE", "20"))
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "5"))
+EMAIL_RETRY_BASE_SECONDS = float(os.getenv("EMAIL_RETRY_BASE_SECONDS", "30"))
+EMAIL_RETRY_MAX_SECONDS = float(os.getenv("EMAIL_RETRY_MAX_SECONDS", "3600"))
+EMAIL_POLL_SECONDS = float(os.getenv("EMAIL_POLL_SECONDS", "2"))
+# A 'sending' row whose worker died is picked up again after this long
+EMAIL_CLAIM_TIMEOUT_SECONDS = float(os.getenv("EMAIL_CLAIM_TIMEOUT_SECONDS", "600"))
+
+EMAIL_SMTP_HOST = os.getenv("EMAIL_SMTP_HOST", "localhost")
+EMAIL_SMTP_PORT = int(os.getenv("EMAIL_SMTP_PORT", "1025"))
+EMAIL_SMTP_USER = os.getenv("EMAIL_SMTP_USER", "")
+EMAIL_SMTP_PASSWORD = os.getenv("EMAIL_SMTP_PASSWORD", "")
+EMAIL_SMTP_STARTTLS = os.getenv("EMAIL_SMTP_STARTTLS", "false").lower() == "true"
+EMAIL_SINK_DIR = os.getenv("EMAIL_SINK_DIR", os.path.join("data", "outbox"))
+
+logger = get_logger("outbox")
+
+QUEUED = "queued"
+SENDING = "sending"
+SENT = "sent"
+FAILED = "failed"
+
+class EmailNotConfigured(Exception):
+    """The configured transport can't deliver anything"""
+
+def create_outbox_table(cursor):
+    """Create the outbox table (caller commits)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS email_outbox (
+            id TEXT PRIMARY KEY,
+            user_id TEXT,
+            from_email TEXT NOT NULL,
+            from_name TEXT,
+            to_email TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            html TEXT NOT NULL,
+            attachment_name TEXT,
+            attachment BLOB,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            claimed_at REAL,
+            last_error TEXT,
+            transport TEXT,
+            created_at REAL NOT NULL,
+            sent_at REAL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_email_outbox_due ON email_outbox (status, next_attempt_at)')
+
+def build_message(row: Dict[str, Any]):
+    """MIME message (email.message.EmailMessage) for an outbox row"""
+    from email.message import EmailMessage
+
+    message = EmailMessage()
+    message["From"] = f"{row['from_name']} <{row['from_email']}>" if row.get("from_name") else row["from_email"]
+    message["To"] = row["to_email"]
+    message["Subject"] = row["subject"]
+    message["Message-ID"] = f"<{row['id']}@whf-outbox>"
+    message.set_content("This message is best viewed in an HTML-capable mail client.")
+    message.add_alternative(row["html"], subtype="html")
+    if row.get("attachment") is not None:
+        message.add_attachment(bytes(row["attachment"]), maintype="application", subtype="pdf",
+                               filename=row["attachment_name"] or "attachment.pdf")
+    return message
+
+class EmailTransport:
+    """Delivers a batch of outbox rows; returns one error string (or None) per row"""
+    name = "base"
+
+    def configuration_error(self) -> Optional[str]:
+        """Why this transport can't send at all, or None if it may"""
+        return None
+
+    def send_batch(self, rows: List[Dict[str, Any]]) -> List[Optional[str]]:
+        raise NotImplementedError
+
+class SendGridTransport(EmailTransport):
+    name = "sendgrid"
+
+    def __init__(self):
+        self.api_key = os.getenv("SENDGRID_API_KEY")
+
+    def configuration_error(self):
+        if not self.api_key:
+            return "SendGrid API key not configured (set SENDGRID_API_KEY or choose another EMAIL_TRANSPORT)"
+        if importlib.util.find_spec("sendgrid") is None:
+            return "The sendgrid package is not installed"
+        return None
+
+    def send_batch(self, rows):
+        if not self.api_key:
+            return ["SendGrid API key not configured"] * len(rows)
+        from sendgrid import SendGridAPIClient
+        from sendgrid.helpers.mail import Mail, Attachment, FileContent, FileName, FileType, Disposition
+
+        client = SendGridAPIClient(api_key=self.api_key)
+        errors = []
+        for row in rows:
+            try:
+                mail = Mail(
+                    from_email=(row["from_email"], row["from_name"]) if row.get("from_name") else row["from_email"],
+                    to_emails=row["to_email"],
+                    subject=row["subject"],
+                    html_content=row["html"]
+                )
+                if row.get("attachment") is not None:
+                    mail.attachment = Attachment(
+                        FileContent(base64.b64encode(bytes(row["attachment"])).decode()),
+                        FileName(row["attachment_name"] or "attachment.pdf"),
+                        FileType('application/pdf'),
+                        Disposition('attachment')
+                    )
+                response = client.send(mail)
+                errors.append(None if response.status_code < 300 else f"SendGrid returned {response.status_code}")
+            except Exception as e:
+                errors.append(str(e))
+        return errors
+
+class SMTPTransport(EmailTransport):
+    """One SMTP connection per batch"""
+    name = "smtp"
+
+    def __init__(self, host: str = EMAIL_SMTP_HOST, port: int = EMAIL_SMTP_PORT):
+        self.host = host
+        self.port = port
+
+    def send_batch(self, rows):
+        import smtplib
+
+        try:
+            server = smtplib.SMTP(self.host, self.port, timeout=30)
+        except (OSError, smtplib.SMTPException) as e:
+            return [f"SMTP connect failed: {e}"] * len(rows)
+        errors = []
+        try:
+            if EMAIL_SMTP_STARTTLS:
+                server.starttls()
+            if EMAIL_SMTP_USER:
+                server.login(EMAIL_SMTP_USER, EMAIL_SMTP_PASSWORD)
+            for row in rows:
+                try:
+                    server.send_message(build_message(row))
+                    errors.append(None)
+                except smtplib.SMTPException as e:
+                    errors.append(str(e))
+        except (OSError, smtplib.SMTPException) as e:
+            errors.extend([str(e)] * (len(rows) - len(errors)))
+        finally:
+            try:
+                server.quit()
+            except (OSError, smtplib.SMTPException):
+                pass
+        return errors
+
+class FileSinkTransport(EmailTransport):
+    """Writes each message to EMAIL_SINK_DIR/<id>.eml instead of sending it"""
+    name = "file"
+
+    def __init__(self, sink_dir: str = EMAIL_SINK_DIR):
+        self.sink_dir = sink_dir
+
+    def send_batch(self, rows):
+        os.makedirs(self.sink_dir, exist_ok=True)
+        errors = []
+        for row in rows:
+            try:
+                path = os.path.join(self.sink_dir, f"{row['id']}.eml")
+                with open(path + ".tmp", "wb") as f:
+                    f.write(build_message(row).as_bytes())
+                os.replace(path + ".tmp", path)
+                errors.append(None)
+            except OSError as e:
+                errors.append(str(e))
+        return errors
+
+TRANSPORTS = {
+    "sendgrid": SendGridTransport,
+    "smtp": SMTPTransport,
+    "file": FileSinkTransport,
+}
+
+def retry_delay(attempts: int) -> float:
+    """Exponential backoff with jitter after `attempts` failed sends"""
+    delay = min(EMAIL_RETRY_MAX_SECONDS, EMAIL_RETRY_BASE_SECONDS * (2 ** (attempts - 1)))
+    return delay * random.uniform(0.8, 1.2)
+
+class EmailOutbox:
+    """Queue of outbound emails in SQLite with a per-process background sender"""
+
+    COLUMNS = ("id", "from_email", "from_name", "to_email", "subject", "html",
+               "attachment_name", "attachment", "attempts")
+
+    def __init__(self, db_path: str = "documents.db", transport: Optional[EmailTransport] = None):
+        self.db_path = db_path
+        self._transport = transport
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._schema_ready = False
+        self._thread_pid = None
+
+    @property
+    def transport(self) -> EmailTransport:
+        if self._transport is None:
+            if EMAIL_TRANSPORT not in TRANSPORTS:
+                raise ValueError(f"Unknown EMAIL_TRANSPORT {EMAIL_TRANSPORT!r}; expected one of {sorted(TRANSPORTS)}")
+            self._transport = TRANSPORTS[EMAIL_TRANSPORT]()
+        return self._transport
+
+    def configuration_error(self) -> Optional[str]:
+        """Why mail can't be delivered with the current settings, or None"""
+        try:
+            return self.transport.configuration_error()
+        except ValueError as e:
+            return str(e)
+
+    def _connect(self):
+        conn = connect(self.db_path)
+        if not self._schema_ready:
+            create_outbox_table(conn.cursor())
+            conn.commit()
+            self._schema_ready = True
+        return conn
+
+    def enqueue(self, to_email: str, subject: str, html: str, from_email: str, from_name: str = None,
+                attachment: bytes = None, attachment_name: str = None, user_id: str = None) -> str:
+        """Store a message for delivery and return its id"""
+        error = self.configuration_error()
+        if error:
+            raise EmailNotConfigured(error)
+        email_id = uuid.uuid4().hex
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute('''
+                INSERT INTO email_outbox
+                    (id, user_id, from_email, from_name, to_email, subject, html,
+                     attachment_name, attachment, status, next_attempt_at, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (email_id, user_id, from_email, from_name, to_email, subject, html,
+                  attachment_name, attachment, QUEUED, now, now))
+            conn.commit()
+        finally:
+            conn.close()
+        self._ensure_thread()
+        self._wakeup.set()
+        return email_id
+
+    def status(self, email_id: str, user_id: str = None) -> Optional[Dict[str, Any]]:
+        """Delivery status of one message (only the sender's own when user_id is given)"""
+        conn = self._connect()
+        try:
+            query = '''
+                SELECT id, to_email, subject, status, attempts, last_error, transport, created_at, sent_at, next_attempt_at
+                FROM email_outbox WHERE id = ?
+            '''
+            params = [email_id]
+            if user_id:
+                query += ' AND user_id = ?'
+                params.append(user_id)
+            row = conn.execute(query, params).fetchone()
+        finally:
+            conn.close()
+        if not row:
+            return None
+        keys = ("id", "to_email", "subject", "status", "attempts", "last_error", "transport",
+                "created_at", "sent_at", "next_attempt_at")
+        report = dict(zip(keys, row))
+        if report["status"] != QUEUED:
+            report.pop("next_attempt_at")
+        return report
+
+    def _claim(self) -> List[Dict[str, Any]]:
+        """Atomically mark up to EMAIL_BATCH_SIZE due messages as being sent by us"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            rows = conn.execute(f'''
+                SELECT {", ".join(self.COLUMNS)} FROM email_outbox
+                WHERE (status = ? AND next_attempt_at <= ?) OR (status = ? AND claimed_at < ?)
+                ORDER BY next_attempt_at
+                LIMIT ?
+            ''', (QUEUED, now, SENDING, now - EMAIL_CLAIM_TIMEOUT_SECONDS, EMAIL_BATCH_SIZE)).fetchall()
+            conn.executemany('UPDATE email_outbox SET status = ?, claimed_at = ? WHERE id = ?',
+                             [(SENDING, now, row[0]) for row in rows])
+            conn.commit()
+        finally:
+            conn.close()
+        return [dict(zip(self.COLUMNS, row)) for row in rows]
+
+    def process_batch(self) -> int:
+        """Send one batch of due messages; returns how many were attempted"""
+        rows = self._claim()
+        if not rows:
+            return 0
+        transport = self.transport
+        try:
+            errors = transport.send_batch(rows)
+        except Exception as e:
+            errors = [str(e)] * len(rows)
+
+        now = time.time()
+        updates = []
+        for row, error in zip(rows, errors):
+            attempts = row["attempts"] + 1
+            if error is None:
+                updates.append((SENT, attempts, None, now, now, transport.name, row["id"]))
+            elif attempts >= EMAIL_MAX_ATTEMPTS:
+                updates.append((FAILED, attempts, error, now, None, transport.name, row["id"]))
+            else:
+                updates.append((QUEUED, attempts, error, now + retry_delay(attempts), None, transport.name, row["id"]))
+        conn = self._connect()
+        try:
+            conn.executemany('''
+                UPDATE email_outbox
+                SET status = ?, attempts = ?, last_error = ?, next_attempt_at = ?, sent_at = ?,
+                    transport = ?, claimed_at = NULL,
+                    attachment = CASE WHEN ? = 'sent' THEN NULL ELSE attachment END
+                WHERE id = ?
+            ''', [update[:6] + (update[0], update[6]) for update in updates])
+            conn.commit()
+        finally:
+            conn.close()
+        return len(rows)
+
+    def _ensure_thread(self):
+        if self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+        threading.Thread(target=self._send_loop, daemon=True, name="email-outbox").start()
+
+    def _send_loop(self):
+        while True:
+            try:
+                # Keep going while full batches come back; otherwise wait
+                if self.process_batch() >= EMAIL_BATCH_SIZE:
+                    continue
+            except Exception as e:
+                log(logger, logging.ERROR, "Outbox batch failed", exc_info=True, error=str(e))
+            self._wakeup.wait(EMAIL_POLL_SECONDS)
+            self._wakeup.clear()
+
+    def start(self):
+        """Start the sender so messages queued before a restart get delivered"""
+        error = self.configuration_error()
+        if error:
+            # Sending would only use up the queued messages' attempts
+            log(logger, logging.WARNING, "Email outbox not started", transport=EMAIL_TRANSPORT, reason=error)
+            return
+        self._ensure_thread()
+
+email_outbox = EmailOutbox()
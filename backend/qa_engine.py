@@ -1,33 +1,64 @@
 # backend/qa_engine.py
 
+# Heavy libraries (openai, PyMuPDF, pandas, PIL, pytesseract, numpy) are
+# imported inside the functions that use them so that importing the API
+# module stays fast; see profile_imports.py for the import-time budget.
+
 import os
+import re
 import asyncio
-from openai import OpenAI
+import logging
+import importlib.util
 from dotenv import load_dotenv
-import fitz  # PyMuPDF
-import pandas as pd
-from PIL import Image
-import pytesseract
 import tempfile
 import json
 import sqlite3
+import time
 from datetime import datetime
+from .shared_state import connect
+from .intent_router import classify_intent, intent_stats, GREETING, LISTING, COMPANY, DOCUMENT
+from .company_data import search_company_data, search_company_passages
+from .latency import latency_tracker
+from .logs import get_logger, log, hot_path
+from .tracing import span, traced
+from .llm_provider import get_llm_provider
+from .single_flight import ask_flights, normalize_question
+from .faq_cache import FAQStore, FAQ_PRECOMPUTE
+from .near_duplicates import NEAR_DUP_DIVERSIFY, NEAR_DUP_OVERFETCH
+from .embedding_pipeline import strip_chunk_header
+from .language import (normalize_text, detect_language, decode_span, is_legacy_devanagari_font, tokenize,
+                       query_transliteration_terms, chunk_transliteration_terms, select_language_variants,
+                       ENGLISH)
 
 load_dotenv()
 
-# Initialize OpenAI client (optional)
-try:
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    openai_available = True
-except:
-    openai_available = False
-    client = None
+logger = get_logger("qa_engine")
+
+# Retrieval mode: "legacy" (word-matching loop), "sparse" (term-chunk matrix)
+# or "ann" (embeddings in an approximate nearest-neighbour index)
+SEARCH_MODE = os.getenv("SEARCH_MODE", "legacy").lower()
+# Retries (with backoff) of a failed sparse/ANN search before that one
+# request falls back to the legacy scan
+INDEX_SEARCH_RETRIES = int(os.getenv("INDEX_SEARCH_RETRIES", "2"))
+
+# Instructions sent as the system message of every document question. Keep
+# this text fixed (no per-request values) so it stays a cacheable prefix.
+SYSTEM_PROMPT = """You are an AI assistant for Western Heat & Forge (WHF), a manufacturing company specializing in forging operations.
+The user message holds excerpts from the user's documents, each document starting with a "## <filename>" line, followed by a question.
+- Answer comprehensively using ALL relevant documents, and say which document each point comes from.
+- When several documents apply, give a complete overview rather than picking one.
+- Tables are marked [TABLE_X] ... [/TABLE_X]; reproduce them as markdown tables."""
 
 class QAEngine:
     def __init__(self):
-        self.client = client
-        self.openai_available = openai_available
         self.db_path = "documents.db"
+        self.search_mode = SEARCH_MODE
+        self.search_fallbacks = 0
+        self.last_search_fallback = None
+        self._sparse_index = None
+        self._ann_index = None
+        self._near_duplicates = None
+        self._faq_store = None
         self.init_database()
     
     def init_database(self):
@@ -35,13 +66,115 @@ class QAEngine:
         # Use the existing database structure from database.py
         pass
     
-    def store_chunks(self, filename, chunks, file_type, user_id=None):
+    @property
+    def llm(self):
+        return get_llm_provider()
+    
+    @property
+    def llm_available(self):
+        return self.llm.available()
+    
+    @property
+    def sparse_index(self):
+        """Sparse term-chunk index, created on first use"""
+        if self._sparse_index is None:
+            from .sparse_index import SparseIndex
+            self._sparse_index = SparseIndex(db_path=self.db_path)
+        return self._sparse_index
+    
+    @property
+    def ann_index(self):
+        """Embedding ANN index, created on first use"""
+        if self._ann_index is None:
+            from .ann_index import ANNIndex
+            self._ann_index = ANNIndex(db_path=self.db_path)
+        return self._ann_index
+    
+    @property
+    def embedding_pipeline(self):
+        """Cached, batched embeddings; shared with the ANN index"""
+        return self.ann_index.pipeline
+    
+    @property
+    def near_duplicates(self):
+        """MinHash/LSH near-duplicate index, created on first use"""
+        if self._near_duplicates is None or self._near_duplicates.db_path != self.db_path:
+            from .near_duplicates import NearDuplicateIndex
+            self._near_duplicates = NearDuplicateIndex(db_path=self.db_path)
+        return self._near_duplicates
+    
+    @property
+    def faq_store(self):
+        """Precomputed FAQ pairs, created on first use"""
+        if self._faq_store is None or self._faq_store.db_path != self.db_path:
+            self._faq_store = FAQStore(db_path=self.db_path)
+        return self._faq_store
+    
+    def use_sparse_search(self):
+        """Whether search_chunks should go through the sparse index"""
+        if self.search_mode != "sparse":
+            return False
+        if importlib.util.find_spec("numpy") is None:
+            log(logger, logging.WARNING, "NumPy not installed - falling back to legacy search")
+            return False
+        return True
+    
+    def use_ann_search(self):
+        """Whether search_chunks should go through the embedding ANN index"""
+        if self.search_mode != "ann":
+            return False
+        if importlib.util.find_spec("numpy") is None:
+            log(logger, logging.WARNING, "NumPy not installed - falling back to legacy search")
+            return False
+        return self.llm_available
+    
+    def active_search_mode(self):
+        """Retrieval mode search_chunks uses right now (SEARCH_MODE minus missing dependencies)"""
+        if self.use_ann_search():
+            return "ann"
+        if self.use_sparse_search():
+            return "sparse"
+        return "legacy"
+    
+    def search_status(self):
+        """Configured and active retrieval mode plus per-request legacy fallbacks, for /health"""
+        return {
+            "configured": self.search_mode,
+            "active": self.active_search_mode(),
+            "fallbacks": self.search_fallbacks,
+            "last_fallback": self.last_search_fallback,
+        }
+    
+    def use_near_duplicates(self):
+        """Whether chunks get MinHash signatures (needs NumPy)"""
+        return importlib.util.find_spec("numpy") is not None
+    
+    def on_document_deleted(self, filename):
+        """Keep the sparse, ANN and near-duplicate indexes in step with document deletes"""
+        if self.use_sparse_search():
+            self.sparse_index.remove_document(filename)
+        if self.use_ann_search():
+            self.ann_index.remove_document(filename)
+        if self.use_near_duplicates():
+            self.near_duplicates.prune()
+    
+    def on_documents_cleared(self):
+        """Keep the sparse, ANN and near-duplicate indexes in step with a full clear"""
+        if self.use_sparse_search():
+            self.sparse_index.clear()
+        if self.use_ann_search():
+            self.ann_index.clear()
+        if self.use_near_duplicates():
+            self.near_duplicates.prune()
+    
+    @traced("qa.store_chunks")
+    def store_chunks(self, filename, chunks, file_type, user_id=None, language=ENGLISH):
         """Store document chunks in database using existing structure"""
         from .database import DocumentDatabase
         
         try:
             # Use the proper database manager
-            db = DocumentDatabase()
+            db = DocumentDatabase(self.db_path)
             
             # Add document to database
             document_id = db.add_document(
@@ -49,41 +182,55 @@ class QAEngine:
                 file_path=f"/uploads/{filename}",
                 file_size=len(str(chunks)),
                 file_type=file_type,
-                user_id=user_id
+                user_id=user_id,
+                language_code=language,
+                # The upload endpoint already counted this document via store_document
+                record_upload=False
             )
             
             if document_id:
                 # Add chunks to database
                 db.add_chunks(document_id, chunks)
-                print(f"Successfully stored {len(chunks)} chunks for {filename} (document_id: {document_id})")
+                log(logger, logging.INFO, "Stored chunks", filename=filename, chunks=len(chunks), document_id=document_id)
+                
+                # Build the term-chunk matrix entries at ingest time
+                if self.use_sparse_search():
+                    self.sparse_index.add_document(document_id)
+                if self.use_ann_search():
+                    self.ann_index.add_document(document_id)
+                if self.use_near_duplicates():
+                    self.near_duplicates.add_document(document_id)
+                
+                # Likely questions are answered ahead of time in the background
+                if FAQ_PRECOMPUTE and self.llm_available:
+                    self.faq_store.schedule(document_id, self.llm)
                 return True
             else:
-                print(f"Failed to add document {filename} to database")
+                log(logger, logging.ERROR, "Failed to add document to database", filename=filename)
                 return False
                 
         except Exception as e:
-            print(f"Error storing chunks: {e}")
+            log(logger, logging.ERROR, "Error storing chunks", exc_info=True, error=str(e))
             return False
     
+    @traced("qa.get_all_chunks")
     def get_all_chunks(self, user_id=None):
         """Get all document chunks from database using existing structure"""
-        import sqlite3
-        
         try:
             # Direct database query to get all chunks for specific user
-            conn = sqlite3.connect(self.db_path)
+            conn = connect(self.db_path)
             cursor = conn.cursor()
             
             # First check if tables exist
             cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='documents'")
             if not cursor.fetchone():
-                print("Documents table does not exist")
+                log(logger, logging.WARNING, "Documents table does not exist")
                 conn.close()
                 return []
             
             cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='document_chunks'")
             if not cursor.fetchone():
-                print("Document_chunks table does not exist")
+                log(logger, logging.WARNING, "Document_chunks table does not exist")
                 conn.close()
                 return []
             
@@ -104,25 +251,25 @@ class QAEngine:
                 ''')
             
             chunks = cursor.fetchall()
-            print(f"Retrieved {len(chunks)} chunks from database for user: {user_id}")
+            log(logger, logging.DEBUG, "Retrieved chunks", chunks=len(chunks), user_id=user_id)
             conn.close()
             return chunks
         except Exception as e:
-            print(f"Error getting chunks: {e}")
-            import traceback
-            traceback.print_exc()
+            log(logger, logging.ERROR, "Error getting chunks", exc_info=True, error=str(e))
             return []
     
+    @traced("extract.pdf")
     def extract_text_from_pdf(self, file_path):
         """Extract text and tables from PDF file with enhanced processing"""
         try:
+            import fitz  # PyMuPDF
             doc = fitz.open(file_path)
             text = ""
             tables = []
             
             for page_num, page in enumerate(doc):
                 # Get text with better formatting
-                page_text = page.get_text("text")
+                page_text = self.page_text(page)
                 
                 # Add page number for reference
                 text += f"\n--- Page {page_num + 1} ---\n"
@@ -144,13 +291,25 @@ class QAEngine:
                 table_marker = f"\n\n[TABLE_{i+1}]\n{table['title']}\n{table['data']}\n[/TABLE_{i+1}]\n\n"
                 text += table_marker
             
-            print(f"Extracted {len(text)} characters and {len(tables)} tables from PDF")
+            log(logger, logging.INFO, "Extracted PDF", characters=len(text), tables=len(tables))
             return text
             
         except Exception as e:
-            print(f"Error extracting text from PDF: {e}")
+            log(logger, logging.ERROR, "Error extracting text from PDF", exc_info=True, error=str(e))
             return ""
     
+    def page_text(self, page):
+        """Plain page text, with spans in legacy Devanagari fonts decoded to Unicode"""
+        blocks = page.get_text("dict")["blocks"]
+        spans = [text_span for block in blocks for line in block.get("lines", []) for text_span in line["spans"]]
+        if not any(is_legacy_devanagari_font(text_span["font"]) for text_span in spans):
+            return page.get_text("text")
+        lines = []
+        for block in blocks:
+            for line in block.get("lines", []):
+                lines.append("".join(decode_span(text_span["text"], text_span["font"]) for text_span in line["spans"]))
+        return "\n".join(lines)
+    
     def extract_tables_from_page(self, page, page_num):
         """Extract tables from a PDF page"""
         tables = []
@@ -168,8 +327,8 @@ class QAEngine:
                         
                         for line in lines:
                             row = []
-                            for span in line["spans"]:
-                                row.append(span["text"].strip())
+                            for text_span in line["spans"]:
+                                row.append(decode_span(text_span["text"], text_span["font"]).strip())
                             if row:
                                 table_data.append(row)
                         
@@ -187,10 +346,10 @@ class QAEngine:
                                     'page': page_num
                                 }
                                 tables.append(table)
-                                print(f"Found table on page {page_num} with {len(data_rows)} rows")
+                                log(logger, logging.DEBUG, "Found table", page=page_num, rows=len(data_rows))
         
         except Exception as e:
-            print(f"Error extracting tables from page {page_num}: {e}")
+            log(logger, logging.WARNING, "Error extracting tables", page=page_num, error=str(e))
         
         return tables
     
@@ -215,9 +374,11 @@ class QAEngine:
         
         return has_numbers or first_row_cols > 2
     
+    @traced("extract.excel")
     def extract_text_from_excel(self, file_path):
         """Extract text and tables from Excel file with comprehensive processing"""
         try:
+            import pandas as pd
             # Read all sheets in the Excel file
             excel_file = pd.ExcelFile(file_path)
             text = f"EXCEL FILE: {file_path}\n"
@@ -268,7 +429,7 @@ class QAEngine:
                             table_marker += f"[/TABLE_{len(tables)}]\n\n"
                             text += table_marker
                             
-                            print(f"Processed table in sheet '{sheet_name}' with {len(df)} rows and {len(df.columns)} columns")
+                            log(logger, logging.DEBUG, "Processed sheet table", sheet=sheet_name, rows=len(df), columns=len(df.columns))
                         else:
                             # Single column data
                             text += f"Single Column Data:\n"
@@ -285,21 +446,22 @@ class QAEngine:
                     text += "\n"
                     
                 except Exception as sheet_error:
-                    print(f"Error processing sheet '{sheet_name}': {sheet_error}")
+                    log(logger, logging.WARNING, "Error processing sheet", sheet=sheet_name, error=str(sheet_error))
                     text += f"Error processing sheet '{sheet_name}': {str(sheet_error)}\n\n"
             
-            print(f"Successfully extracted {len(text)} characters and {len(tables)} tables from Excel file")
+            log(logger, logging.INFO, "Extracted Excel file", characters=len(text), tables=len(tables))
             return text
             
         except Exception as e:
-            print(f"Error extracting text from Excel file {file_path}: {e}")
-            import traceback
-            traceback.print_exc()
+            log(logger, logging.ERROR, "Error extracting text from Excel file", exc_info=True, file_path=file_path, error=str(e))
             return f"EXCEL FILE: {file_path}\nError processing Excel file: {str(e)}\nPlease ensure the file is not corrupted and is a valid Excel format."
     
+    @traced("extract.image")
     def extract_text_from_image(self, file_path):
         """Extract text from image using OCR with enhanced processing"""
         try:
+            from PIL import Image
+            import pytesseract
             image = Image.open(file_path)
             # Enhanced OCR with multiple configurations
             text = pytesseract.image_to_string(image, config='--psm 6 --oem 3')
@@ -310,12 +472,14 @@ class QAEngine:
             
             return f"IMAGE CONTENT: {text}\nSource: {file_path}"
         except Exception as e:
-            print(f"Error extracting text from image: {e}")
+            log(logger, logging.ERROR, "Error extracting text from image", error=str(e))
             return f"IMAGE FILE: {file_path} (OCR processing failed)"
 
+    @traced("extract.csv")
     def extract_text_from_csv(self, file_path):
         """Extract data from CSV file with table formatting"""
         try:
+            import pandas as pd
             df = pd.read_csv(file_path)
             text = f"CSV DATA TABLE:\n{df.to_string(index=False)}\n"
             text += f"Columns: {list(df.columns)}\n"
@@ -323,27 +487,30 @@ class QAEngine:
             text += f"Data types: {df.dtypes.to_dict()}\n"
             return text
         except Exception as e:
-            print(f"Error extracting text from CSV: {e}")
+            log(logger, logging.ERROR, "Error extracting text from CSV", error=str(e))
             return f"CSV FILE: {file_path} (processing failed)"
 
+    @traced("extract.word")
     def extract_text_from_word(self, file_path):
         """Extract text from Word documents"""
         try:
             # For now, return a placeholder - would need python-docx for full implementation
             return f"WORD DOCUMENT: {file_path}\nContent extraction requires additional processing."
         except Exception as e:
-            print(f"Error extracting text from Word document: {e}")
+            log(logger, logging.ERROR, "Error extracting text from Word document", error=str(e))
             return f"WORD FILE: {file_path} (processing failed)"
 
+    @traced("extract.powerpoint")
     def extract_text_from_powerpoint(self, file_path):
         """Extract text from PowerPoint presentations"""
         try:
             # For now, return a placeholder - would need python-pptx for full implementation
             return f"POWERPOINT PRESENTATION: {file_path}\nContent extraction requires additional processing."
         except Exception as e:
-            print(f"Error extracting text from PowerPoint: {e}")
+            log(logger, logging.ERROR, "Error extracting text from PowerPoint", error=str(e))
             return f"POWERPOINT FILE: {file_path} (processing failed)"
 
+    @traced("extract.txt")
     def extract_text_from_txt(self, file_path):
         """Extract text from plain text files"""
         try:
@@ -351,7 +518,7 @@ class QAEngine:
                 text = f.read()
             return f"TEXT DOCUMENT:\n{text}\nSource: {file_path}"
         except Exception as e:
-            print(f"Error extracting text from text file: {e}")
+            log(logger, logging.ERROR, "Error extracting text from text file", error=str(e))
             return f"TEXT FILE: {file_path} (processing failed)"
     
     def chunk_text(self, text, chunk_size=1000, overlap=200):
@@ -359,7 +526,6 @@ class QAEngine:
         chunks = []
         
         # Split by sentences first to preserve context
-        import re
         sentences = re.split(r'[.!?]+', text)
         
         current_chunk = ""
@@ -388,9 +554,10 @@ class QAEngine:
             if len(chunk) > 50:  # Minimum meaningful chunk size
                 final_chunks.append(chunk)
         
-        print(f"Created {len(final_chunks)} chunks from text")
+        log(logger, logging.DEBUG, "Created chunks", chunks=len(final_chunks))
         return final_chunks
 
+    @traced("qa.chunk_text")
     def chunk_text_enhanced(self, text, filename, file_type, chunk_size=1000, overlap=200):
         """Enhanced chunking with metadata and better structure preservation"""
         chunks = []
@@ -419,23 +586,30 @@ class QAEngine:
         
         return chunks
     
-    def search_chunks(self, question, top_k=50, user_id=None):
+    @traced("qa.search_chunks")
+    def search_chunks(self, question, top_k=50, user_id=None, use_index=True):
         """Enhanced search across all uploaded documents"""
-        question_lower = question.lower()
         relevant_chunks = []
+        is_listing = classify_intent(question) == LISTING
+        
+        # The sparse and ANN indexes score without loading every chunk into memory
+        if use_index and not is_listing and self.use_ann_search():
+            return self.index_search("ann", self.search_chunks_ann, question, top_k, user_id)
+        if use_index and not is_listing and self.use_sparse_search():
+            return self.index_search("sparse", self.search_chunks_sparse, question, top_k, user_id)
         
         # Get all chunks from database
         all_chunks = self.get_all_chunks(user_id)
-        print(f"Searching across {len(all_chunks)} chunks from database for user: {user_id}")
+        log(logger, logging.DEBUG, "Searching chunks", chunks=len(all_chunks), user_id=user_id)
         
-        # If no chunks found, return empty list
+        # If no chunks found, only the company profile can match
         if not all_chunks:
-            print("No chunks found in database")
-            return []
+            log(logger, logging.DEBUG, "No chunks found in database")
+            return [] if is_listing else self.merge_company_passages(question, [], top_k)
         
         # For document listing requests, return a sample from each document
-        if any(keyword in question_lower for keyword in ['list', 'all documents', 'uploaded', 'files', 'documents']):
-            print("Document listing request detected - optimizing search")
+        if is_listing:
+            log(logger, logging.DEBUG, "Document listing request - one chunk per document")
             # Group chunks by filename and return one chunk per document
             document_chunks = {}
             for chunk_data in all_chunks:
@@ -449,7 +623,7 @@ class QAEngine:
             
             # Return one chunk per document
             result_chunks = list(document_chunks.values())
-            print(f"Returning {len(result_chunks)} documents for listing")
+            log(logger, logging.DEBUG, "Returning documents for listing", documents=len(result_chunks))
             return result_chunks
         
         # Define important keywords for WHF operations
@@ -465,6 +639,14 @@ class QAEngine:
             'general': ['work', 'instruction', 'document', 'scope', 'master', 'copy']
         }
         
+        # Checked once so the per-word loop pays nothing when DEBUG is off
+        trace_matches = logger.isEnabledFor(logging.DEBUG)
+        
+        # Words with Devanagari vowel signs kept whole, plus transliteration
+        # keys that match the question's words written in the other script
+        question_words = tokenize(question)
+        question_keys = set(query_transliteration_terms(question))
+        
         for chunk_data in all_chunks:
             # Handle both tuple and dict formats
             if isinstance(chunk_data, dict):
@@ -476,15 +658,13 @@ class QAEngine:
             content_lower = content.lower()
             score = 0
             
-            # Simple word matching - this is what we need
-            question_words = question_lower.split()
-            
             # Check each word in the question
             for word in question_words:
                 if len(word) > 2:  # Only meaningful words
                     if word in content_lower:
                         score += 10  # High score for exact matches
-                        print(f"Found word '{word}' in {filename}")
+                        if trace_matches:
+                            hot_path(logger, "Found word", word=word, filename=filename)
             
             # Check for partial matches (for compound words like "work instruction")
             for word in question_words:
@@ -492,7 +672,12 @@ class QAEngine:
                     for content_word in content_lower.split():
                         if word in content_word or content_word in word:
                             score += 5
-                            print(f"Found partial match '{word}' in {filename}")
+                            if trace_matches:
+                                hot_path(logger, "Found partial match", word=word, filename=filename)
+            
+            # Loanwords across scripts, like hammer / हॅमर
+            if question_keys:
+                score += 5 * len(question_keys & chunk_transliteration_terms(content))
             
             # If we found any matches, add this chunk
             if score > 0:
@@ -502,10 +687,16 @@ class QAEngine:
                     'file_type': file_type,
                     'score': score
                 })
-                print(f"Added {filename} with score {score}")
+                if trace_matches:
+                    hot_path(logger, "Added chunk", filename=filename, score=score)
+        
+        # Company profile passages compete on the same scores
+        relevant_chunks.extend(search_company_passages(question))
+        relevant_chunks = self.select_variants(question, relevant_chunks)
         
         # Sort by relevance score and return top results
         relevant_chunks.sort(key=lambda x: x['score'], reverse=True)
+        relevant_chunks = self.diversify(relevant_chunks, top_k)
         
         # Return ALL relevant chunks (no limit) or top_k if specified
         if top_k and top_k > 0:
@@ -513,65 +704,129 @@ class QAEngine:
         else:
             result_chunks = relevant_chunks
         
-        print(f"Returning {len(result_chunks)} relevant chunks out of {len(all_chunks)} total chunks")
+        log(logger, logging.DEBUG, "Search done", returned=len(result_chunks), total=len(all_chunks))
         return result_chunks
     
+    def index_search(self, mode, search, question, top_k, user_id):
+        """Run an index search, retrying transient errors; only this request falls back to legacy"""
+        for attempt in range(INDEX_SEARCH_RETRIES + 1):
+            try:
+                return search(question, top_k, user_id)
+            except Exception as e:
+                if attempt < INDEX_SEARCH_RETRIES:
+                    log(logger, logging.WARNING, "Index search failed, retrying", mode=mode,
+                        attempt=attempt + 1, error=str(e))
+                    time.sleep(0.05 * 2 ** attempt)
+                    continue
+                log(logger, logging.ERROR, "Index search failed, using legacy search for this request",
+                    exc_info=True, mode=mode, error=str(e))
+                self.search_fallbacks += 1
+                self.last_search_fallback = {"mode": mode, "error": str(e), "time": datetime.now().isoformat()}
+        return self.search_chunks(question, top_k, user_id, use_index=False)
+    
+    @traced("qa.search_chunks_sparse")
+    def search_chunks_sparse(self, question, top_k=50, user_id=None):
+        """Score all chunks at once against the sparse term-chunk matrix"""
+        hits = self.sparse_index.search(question, top_k=self.candidate_count(top_k), user_id=user_id)
+        contents = self.sparse_index.fetch_chunks([hit[0] for hit in hits])
+        
+        result_chunks = []
+        for chunk_id, filename, file_type, score in hits:
+            if chunk_id not in contents:
+                continue
+            result_chunks.append({
+                'content': contents[chunk_id][0],
+                'filename': filename,
+                'file_type': file_type,
+                'score': score
+            })
+        
+        result_chunks = self.diversify(self.select_variants(question, result_chunks), top_k)
+        log(logger, logging.DEBUG, "Sparse search done", returned=len(result_chunks), indexed=self.sparse_index.num_chunks)
+        return self.merge_company_passages(question, result_chunks, top_k)
+    
+    @traced("qa.search_chunks_ann")
+    def search_chunks_ann(self, question, top_k=50, user_id=None):
+        """Nearest chunks to the question's embedding from the ANN index"""
+        hits = self.ann_index.search(question, top_k=self.candidate_count(top_k), user_id=user_id)
+        contents = self.ann_index.fetch_chunks([hit[0] for hit in hits])
+        
+        # Similarities are on a different scale from the keyword scores,
+        # so company passages are not merged in here
+        result_chunks = []
+        for chunk_id, filename, file_type, score in hits:
+            if chunk_id not in contents:
+                continue
+            result_chunks.append({
+                'content': contents[chunk_id][0],
+                'filename': filename,
+                'file_type': file_type,
+                'score': score
+            })
+        
+        result_chunks = self.diversify(self.select_variants(question, result_chunks), top_k)
+        log(logger, logging.DEBUG, "ANN search done", returned=len(result_chunks), indexed=self.ann_index.num_live)
+        return result_chunks
+    
+    def document_variants(self):
+        """filename -> (language, variant key) for every stored document"""
+        try:
+            conn = connect(self.db_path)
+            try:
+                rows = conn.execute('''
+                    SELECT filename, language, variant_key FROM documents
+                    WHERE language IS NOT NULL AND variant_key IS NOT NULL
+                ''').fetchall()
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            # Schema not initialized yet
+            return {}
+        return {filename: (language, key) for filename, language, key in rows}
+    
+    def select_variants(self, question, chunks):
+        """Keep one language version of each document, in the question's language when there is one"""
+        if not chunks:
+            return chunks
+        selected = select_language_variants(chunks, self.document_variants(), detect_language(question))
+        if len(selected) < len(chunks):
+            log(logger, logging.DEBUG, "Dropped other language versions", kept=len(selected), dropped=len(chunks) - len(selected))
+        return selected
+    
+    def candidate_count(self, top_k):
+        """Hits to request from an index so top_k survive near-duplicate removal"""
+        if NEAR_DUP_DIVERSIFY and top_k and top_k > 0:
+            return top_k * NEAR_DUP_OVERFETCH
+        return top_k
+    
+    def diversify(self, chunks, top_k=50):
+        """Drop chunks that nearly repeat a higher-ranked one, so prompt tokens go to distinct content"""
+        if not NEAR_DUP_DIVERSIFY or not self.use_near_duplicates():
+            return chunks[:top_k] if top_k and top_k > 0 else chunks
+        try:
+            return self.near_duplicates.diversify(chunks, top_k)
+        except Exception as e:
+            log(logger, logging.WARNING, "Near-duplicate filtering failed", error=str(e))
+            return chunks[:top_k] if top_k and top_k > 0 else chunks
+    
+    def merge_company_passages(self, question, chunks, top_k=50):
+        """Rank the company profile passages in with already-scored chunks"""
+        passages = search_company_passages(question)
+        if not passages:
+            return chunks
+        merged = sorted(chunks + passages, key=lambda x: x['score'], reverse=True)
+        return merged[:top_k] if top_k and top_k > 0 else merged
+    
+    @traced("qa.get_answer_from_context")
     def get_answer_from_context(self, question, context):
-        """Get answer using OpenAI if available, otherwise use rule-based responses"""
-        if self.openai_available and self.client:
+        """Get answer from the LLM provider if available, otherwise use rule-based responses"""
+        if self.llm_available:
             try:
-                # Check if context contains tables
-                has_tables = "[TABLE_" in context
-                
-                if has_tables:
-                    prompt = f"""
-You are an AI assistant for Western Heat & Forge (WHF), a manufacturing company specializing in forging operations.
-
-IMPORTANT INSTRUCTIONS:
-1. Use information from ALL documents provided in the context
-2. Be comprehensive and thorough in your response
-3. If the context contains tables (marked with [TABLE_X] and [/TABLE_X]), format them as proper tables in your response using markdown table syntax
-4. Reference specific documents when providing information
-5. Ensure you cover all relevant information from all available documents
-
-Example table format:
-| Column1 | Column2 | Column3 |
-|---------|---------|---------|
-| Data1   | Data2   | Data3   |
-| Data4   | Data5   | Data6   |
-
-Context from multiple documents:
-{context}
-
-Question: {question}
-
-Answer comprehensively using information from ALL relevant documents:"""
-                else:
-                    prompt = f"""
-You are an AI assistant for Western Heat & Forge (WHF), a manufacturing company specializing in forging operations.
-
-IMPORTANT INSTRUCTIONS:
-1. Use information from ALL documents provided in the context
-2. Be comprehensive and thorough in your response
-3. Reference specific documents when providing information
-4. Ensure you cover all relevant information from all available documents
-5. If summarizing multiple documents, provide a complete overview
-
-Context from multiple documents:
-{context}
-
-Question: {question}
-
-Answer comprehensively using information from ALL relevant documents:"""
-                
-                response = self.client.chat.completions.create(
-                    model="gpt-4o",
-                    messages=[{"role": "user", "content": prompt}],
-                    temperature=0.2
-                )
-                return response.choices[0].message.content
+                # Static instructions go in the system message so every request
+                # shares the same prefix; only context and question vary
+                return self.llm.complete(f"{context}\n\nQuestion: {question}", system=SYSTEM_PROMPT, temperature=0.2)
             except Exception as e:
-                print(f"OpenAI error: {e}")
+                log(logger, logging.ERROR, "LLM error", provider=self.llm.name, error=str(e))
                 # Fall back to rule-based responses
         
         # Rule-based responses for WHF operations
@@ -801,11 +1056,13 @@ I can provide detailed information about:
 
 Please ask a more specific question about WHF's operations."""
     
+    @traced("qa.process_file")
     async def process_file(self, file_path, filename, user_id=None):
         """Process uploaded file and extract ALL content (text, tables, images, data)"""
         try:
             file_extension = filename.split(".")[-1].lower()
-            print(f"Processing file: {filename} ({file_extension})")
+            log(logger, logging.INFO, "Processing file", filename=filename, file_type=file_extension)
+            extraction_start = time.perf_counter()
             
             # Extract content based on file type with comprehensive processing
             if file_extension == "pdf":
@@ -823,78 +1080,182 @@ Please ask a more specific question about WHF's operations."""
             elif file_extension == "txt":
                 text = self.extract_text_from_txt(file_path)
             else:
-                print(f"Unsupported file type: {file_extension}")
+                log(logger, logging.WARNING, "Unsupported file type", file_type=file_extension)
                 return False
             
             if text and text.strip():
-                print(f"Extracted {len(text)} characters from {filename}")
+                # One Unicode form for matching, and the language this
+                # version of the document is written in
+                with latency_tracker.stage("normalization"):
+                    text = normalize_text(text)
+                    language = detect_language(text, filename)
+                log(logger, logging.DEBUG, "Extracted text", filename=filename, characters=len(text), language=language)
                 
                 # Create comprehensive chunks with metadata
                 chunks = self.chunk_text_enhanced(text, filename, file_extension)
+                latency_tracker.record("extraction", time.perf_counter() - extraction_start)
                 
                 if chunks:
+                    # Embed up front, batched and off the event loop, so the
+                    # ANN index finds every vector in the cache when it
+                    # indexes the stored chunks
+                    if self.use_ann_search():
+                        try:
+                            with latency_tracker.stage("embedding"):
+                                await asyncio.to_thread(self.embedding_pipeline.embed,
+                                                        [strip_chunk_header(chunk) for chunk in chunks])
+                        except Exception as e:
+                            # Indexing embeds whatever is still missing
+                            log(logger, logging.WARNING, "Embedding stage failed", filename=filename, error=str(e))
+                    
                     # Store chunks in database with user association
-                    success = self.store_chunks(filename, chunks, file_extension, user_id)
+                    with latency_tracker.stage("db_write"):
+                        success = self.store_chunks(filename, chunks, file_extension, user_id, language)
                     
                     if success:
-                        print(f"Successfully processed {filename}: {len(chunks)} chunks stored in database")
+                        log(logger, logging.INFO, "Processed file", filename=filename, chunks=len(chunks))
                         return True
                     else:
-                        print(f"Failed to store chunks for {filename}")
+                        log(logger, logging.ERROR, "Failed to store chunks", filename=filename)
                         return False
                 else:
-                    print(f"No chunks created from {filename}")
+                    log(logger, logging.WARNING, "No chunks created", filename=filename)
                     return False
             else:
-                print(f"No content extracted from {filename}")
+                log(logger, logging.WARNING, "No content extracted", filename=filename)
                 return False
             
         except Exception as e:
-            print(f"Error processing file {filename}: {e}")
-            import traceback
-            traceback.print_exc()
+            log(logger, logging.ERROR, "Error processing file", exc_info=True, filename=filename, error=str(e))
             return False
     
+    def get_greeting_answer(self, question):
+        """Canned replies for greetings and questions about the assistant"""
+        question_lower = question.lower()
+        if any(word in question_lower for word in ["thank", "thx"]):
+            return "You're very welcome! Let me know if there's anything else I can help you with. 😊"
+        if any(word in question_lower for word in ["bye", "goodbye"]):
+            return "Goodbye! Come back any time you need help with WHF documents. 👋"
+        if any(word in question_lower for word in ["what can you do", "capabilities"]):
+            return """I'm Forgia, your AI assistant for Western Heat & Forge! Here's what I can do:
+
+🏢 **Company Information**: WHF's services, products and contact details
+📄 **Document Processing**: I read PDFs, Excel files and images you upload
+🔍 **Smart Search**: I find the relevant parts of your work instructions
+📚 **Knowledge Base**: Your documents are stored permanently"""
+        return "Hi! I'm Forgia, an AI chatbot developed by the WHF Interns team for Western Heat & Forge. Ask me about your uploaded work instructions or about WHF itself! 🤖✨"
+    
+    def get_listing_answer(self, user_id=None):
+        """List the user's documents straight from the documents table"""
+        from .database import DocumentDatabase
+        
+        documents = DocumentDatabase(self.db_path).get_documents(user_id)
+        if not documents:
+            return "You haven't uploaded any documents yet. Use the upload section to add PDFs, Excel files or images.", [], False
+        
+        filenames = [doc['filename'] for doc in documents]
+        lines = [f"{i}. {doc['filename']} ({(doc['file_type'] or 'unknown').upper()})" for i, doc in enumerate(documents, 1)]
+        answer = f"**You have {len(documents)} uploaded document(s):**\n\n" + "\n".join(lines)
+        return answer, filenames, True
+    
+    def get_company_answer(self, question):
+        """Answer company questions from COMPANY_DATA; None if nothing matches"""
+        results = search_company_data(question)
+        if not results:
+            return None
+        return "\n\n".join(results)
+    
+    def get_document_set_key(self, user_id=None):
+        """Ids of the documents visible to user_id, as a hashable key"""
+        try:
+            conn = connect(self.db_path)
+            if user_id:
+                rows = conn.execute("SELECT id FROM documents WHERE user_id = ? ORDER BY id", (user_id,)).fetchall()
+            else:
+                rows = conn.execute("SELECT id FROM documents ORDER BY id").fetchall()
+            conn.close()
+            return tuple(row[0] for row in rows)
+        except sqlite3.Error:
+            return ()
+    
+    @traced("qa.get_answer")
     async def get_answer(self, question, chat_context="", user_id=None):
+        """Route the question by intent and answer it, timing each intent"""
+        start_time = time.time()
+        intent = classify_intent(question)
+        try:
+            if intent == GREETING:
+                return self.get_greeting_answer(question), [], False
+            
+            # Concurrent identical questions in the same conversation context over
+            # the same documents share one answer
+            documents = await asyncio.to_thread(self.get_document_set_key, user_id)
+            key = (normalize_question(question), chat_context or "", documents)
+            result, intent = await ask_flights.do(
+                key, lambda: self.answer_by_intent(question, intent, chat_context, user_id)
+            )
+            return result
+        finally:
+            intent_stats.record(intent, time.time() - start_time)
+    
+    async def answer_by_intent(self, question, intent, chat_context="", user_id=None):
+        """Answer a non-greeting question; returns (result, intent actually used)"""
+        if intent == LISTING:
+            return self.get_listing_answer(user_id), intent
+        
+        if intent == COMPANY:
+            answer = self.get_company_answer(question)
+            if answer:
+                return (answer, [], False), intent
+            # Nothing in the company profile - try the documents instead
+            intent = DOCUMENT
+        
+        # A precomputed FAQ answer close enough to the question skips retrieval and the LLM
+        with span("qa.faq_lookup") as faq_span, latency_tracker.stage("faq_lookup"):
+            match = self.faq_store.match(question, user_id)
+            faq_span.set_attribute("hit", match is not None)
+        if match:
+            return (match["answer"], [match["filename"]], True), intent
+        
+        return await self.get_document_answer(question, chat_context, user_id), intent
+    
+    @traced("qa.get_document_answer")
+    async def get_document_answer(self, question, chat_context="", user_id=None):
         """Get answer with context from all uploaded documents"""
         try:
-            # Check if this is a document listing request
-            question_lower = question.lower()
-            if any(keyword in question_lower for keyword in ['list', 'all documents', 'uploaded', 'files', 'documents']):
-                # For document listing, get ALL chunks without limit
-                relevant_chunks = self.search_chunks(question, top_k=None, user_id=user_id)
-            else:
-                # For regular questions, use increased limit
+            with latency_tracker.stage("retrieval"):
                 relevant_chunks = self.search_chunks(question, top_k=100, user_id=user_id)
             
             if relevant_chunks:
-                # Combine chunks into context with better organization
-                context_parts = []
-                source_files = []
-                file_contents = {}
-                
-                # Group content by filename for better organization
-                for chunk_data in relevant_chunks:
-                    filename = chunk_data['filename']
-                    content = chunk_data['content']
+                with span("qa.context_build", chunks=len(relevant_chunks)), latency_tracker.stage("context_build"):
+                    # Combine chunks into context with better organization
+                    context_parts = []
+                    source_files = []
+                    file_contents = {}
                     
-                    if filename not in file_contents:
-                        file_contents[filename] = []
-                        source_files.append(filename)
+                    # Group content by filename for better organization
+                    for chunk_data in relevant_chunks:
+                        filename = chunk_data['filename']
+                        content = strip_chunk_header(chunk_data['content'])
                     
-                    file_contents[filename].append(content)
-                
-                # Create organized context with file headers
-                for filename, contents in file_contents.items():
-                    context_parts.append(f"\n=== DOCUMENT: {filename} ===\n")
-                    context_parts.extend(contents)
-                    context_parts.append(f"\n=== END: {filename} ===\n")
-                
-                context = "\n\n".join(context_parts)
+                        if filename not in file_contents:
+                            file_contents[filename] = []
+                            source_files.append(filename)
+                    
+                        file_contents[filename].append(content)
+                    
+                    # One heading per document instead of a header on every chunk
+                    for filename, contents in file_contents.items():
+                        context_parts.append(f"## {filename}\n" + "\n\n".join(contents))
+                    
+                    context = "\n\n".join(context_parts)
                 
                 # Use AI to generate answer from context
-                if self.openai_available and self.client:
-                    answer = self.get_answer_from_context(question, context)
+                if self.llm_available:
+                    # Blocking provider call runs in a thread so slow LLM
+                    # responses don't stall the event loop for other requests
+                    with latency_tracker.stage("llm"):
+                        answer = await asyncio.to_thread(self.get_answer_from_context, question, context)
                 else:
                     # Fallback to rule-based with context
                     answer = f"""Based on your uploaded documents, here's what I found:
@@ -914,9 +1275,7 @@ Please ask a more specific question about WHF's operations."""
                 return answer, [], False
             
         except Exception as e:
-            print(f"Error getting answer: {e}")
-            import traceback
-            traceback.print_exc()
+            log(logger, logging.ERROR, "Error getting answer", exc_info=True, error=str(e))
             return f"Sorry, I couldn't process your question right now. Error: {str(e)}. Please try again.", [], False
 
 # Create global instance
@@ -0,0 +1,159 @@
+# backend/rollups.py
+#
+# Hourly and daily analytics rollups kept in documents.db. Every event
+# (query, file upload, login) upserts one row per granularity in the same
+# transaction that stores the event, so dashboards read O(days) aggregate
+# rows instead of scanning every chat or event.
+
+import sqlite3
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+QUERY = "query"
+FILE_UPLOAD = "file_upload"
+LOGIN = "login"
+
+def create_rollup_tables(cursor: sqlite3.Cursor) -> bool:
+    """Create the rollup table; returns True when it did not exist yet"""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'analytics_rollups'")
+    existed = cursor.fetchone() is not None
+
+    # granularity is 'hour' (bucket '2025-07-29T09') or 'day' (bucket '2025-07-29');
+    # dimension holds the file type for uploads and '' otherwise
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS analytics_rollups (
+            granularity TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            user_id TEXT NOT NULL DEFAULT '',
+            event_type TEXT NOT NULL,
+            dimension TEXT NOT NULL DEFAULT '',
+            count INTEGER NOT NULL DEFAULT 0,
+            success_count INTEGER NOT NULL DEFAULT 0,
+            response_time_sum REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (granularity, bucket, user_id, event_type, dimension)
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_analytics_rollups_user
+        ON analytics_rollups (user_id, granularity, event_type)
+    ''')
+    return not existed
+
+def _buckets(timestamp) -> Dict[str, str]:
+    if isinstance(timestamp, datetime):
+        timestamp = timestamp.isoformat()
+    timestamp = str(timestamp or datetime.utcnow().isoformat()).replace(" ", "T")
+    return {"hour": timestamp[:13], "day": timestamp[:10]}
+
+def record_event(cursor: sqlite3.Cursor, event_type: str, user_id: Optional[str] = None,
+                 timestamp=None, success: bool = False, response_time: float = 0.0,
+                 dimension: str = ""):
+    """Add one event to the hourly and daily rollups (caller commits)"""
+    for granularity, bucket in _buckets(timestamp).items():
+        cursor.execute('''
+            INSERT INTO analytics_rollups
+                (granularity, bucket, user_id, event_type, dimension, count, success_count, response_time_sum)
+            VALUES (?, ?, ?, ?, ?, 1, ?, ?)
+            ON CONFLICT(granularity, bucket, user_id, event_type, dimension) DO UPDATE SET
+                count = count + 1,
+                success_count = success_count + excluded.success_count,
+                response_time_sum = response_time_sum + excluded.response_time_sum
+        ''', (granularity, bucket, user_id or "", event_type, dimension or "",
+              1 if success else 0, float(response_time or 0)))
+
+def remove_user_events(cursor: sqlite3.Cursor, user_id: str, event_type: str):
+    """Drop a user's rollups for one event type (e.g. after clearing chat history)"""
+    cursor.execute(
+        'DELETE FROM analytics_rollups WHERE user_id = ? AND event_type = ?',
+        (user_id or "", event_type)
+    )
+
+def backfill(cursor: sqlite3.Cursor):
+    """Build rollups from the existing chat_history and documents rows"""
+    cursor.execute('SELECT user_id, timestamp, has_context, response_time FROM chat_history')
+    for user_id, timestamp, has_context, response_time in cursor.fetchall():
+        record_event(cursor, QUERY, user_id, timestamp, bool(has_context), response_time or 0)
+
+    cursor.execute('SELECT user_id, upload_time, file_type FROM documents')
+    for user_id, upload_time, file_type in cursor.fetchall():
+        record_event(cursor, FILE_UPLOAD, user_id, upload_time, dimension=file_type or "unknown")
+
+def empty_stats() -> Dict[str, Any]:
+    """Dashboard stats shape with every aggregate at zero"""
+    return {
+        "total_events": 0,
+        "unique_users": 0,
+        "file_uploads": 0,
+        "queries": 0,
+        "logins": 0,
+        "daily_stats": {},
+        "hourly_activity": {},
+        "file_types": {},
+        "query_success_rate": 0,
+        "avg_response_time": 0
+    }
+
+def dashboard_stats(conn: sqlite3.Connection, days: int = 30, user_id: Optional[str] = None) -> Dict[str, Any]:
+    """Dashboard aggregates for the last `days` days, read from the rollups only"""
+    start = datetime.utcnow() - timedelta(days=days)
+    user_filter = " AND user_id = ?" if user_id is not None else ""
+    user_args = (user_id,) if user_id is not None else ()
+    stats = empty_stats()
+
+    daily = defaultdict(lambda: {"file_uploads": 0, "queries": 0, "logins": 0, "users": set()})
+    users = set()
+    file_types = Counter()
+    successes = 0
+    response_time_sum = 0.0
+
+    rows = conn.execute(f'''
+        SELECT bucket, user_id, event_type, dimension, count, success_count, response_time_sum
+        FROM analytics_rollups
+        WHERE granularity = 'day' AND bucket >= ?{user_filter}
+    ''', (start.strftime("%Y-%m-%d"),) + user_args).fetchall()
+
+    for day, row_user, event_type, dimension, count, success_count, rt_sum in rows:
+        stats["total_events"] += count
+        users.add(row_user)
+        daily[day]["users"].add(row_user)
+        if event_type == FILE_UPLOAD:
+            stats["file_uploads"] += count
+            daily[day]["file_uploads"] += count
+            file_types[dimension or "unknown"] += count
+        elif event_type == QUERY:
+            stats["queries"] += count
+            daily[day]["queries"] += count
+            successes += success_count
+            response_time_sum += rt_sum
+        elif event_type == LOGIN:
+            stats["logins"] += count
+            daily[day]["logins"] += count
+
+    stats["unique_users"] = len(users)
+    stats["daily_stats"] = {
+        day: dict(values, users=len(values["users"])) for day, values in sorted(daily.items())
+    }
+    stats["file_types"] = dict(file_types)
+    if stats["queries"]:
+        stats["query_success_rate"] = successes / stats["queries"] * 100
+        stats["avg_response_time"] = response_time_sum / stats["queries"]
+
+    hourly = conn.execute(f'''
+        SELECT bucket, SUM(count)
+        FROM analytics_rollups
+        WHERE granularity = 'hour' AND bucket >= ?{user_filter}
+        GROUP BY bucket
+    ''', (start.strftime("%Y-%m-%dT%H"),) + user_args).fetchall()
+    stats["hourly_activity"] = {bucket: count for bucket, count in hourly}
+
+    return stats
+
+def user_totals(conn: sqlite3.Connection, user_id: str, event_type: str):
+    """(count, success_count, response_time_sum) over all time for one user"""
+    row = conn.execute('''
+        SELECT COALESCE(SUM(count), 0), COALESCE(SUM(success_count), 0), COALESCE(SUM(response_time_sum), 0)
+        FROM analytics_rollups
+        WHERE user_id = ? AND granularity = 'day' AND event_type = ?
+    ''', (user_id or "", event_type)).fetchone()
+    return row
@@ -0,0 +1,65 @@
+# backend/shared_state.py
+#
+# Helpers for running the backend as several worker processes that share
+# the same SQLite files:
+#   - connect() opens connections in WAL mode with a busy timeout so readers
+#     never block the writer and concurrent writers wait instead of failing
+#   - a small `cache_versions` table holds one counter per cache; writers
+#     bump the counter and every worker compares it with the version it last
+#     loaded to know when its in-process copy is stale
+
+import sqlite3
+import threading
+
+BUSY_TIMEOUT_SECONDS = 30.0
+
+_wal_lock = threading.Lock()
+_wal_enabled = set()
+
+def connect(db_path: str, timeout: float = BUSY_TIMEOUT_SECONDS, check_same_thread: bool = True) -> sqlite3.Connection:
+    """Open a SQLite connection configured for multi-process access"""
+    conn = sqlite3.connect(db_path, timeout=timeout, check_same_thread=check_same_thread)
+    if db_path not in _wal_enabled:
+        with _wal_lock:
+            if db_path not in _wal_enabled:
+                # journal_mode is persistent, so this only needs doing once per file
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS cache_versions (
+                        name TEXT PRIMARY KEY,
+                        version INTEGER NOT NULL DEFAULT 0
+                    )
+                ''')
+                conn.commit()
+                _wal_enabled.add(db_path)
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+def bump_version(conn: sqlite3.Connection, name: str):
+    """Increment a cache counter inside the caller's transaction"""
+    conn.execute('''
+        INSERT INTO cache_versions (name, version) VALUES (?, 1)
+        ON CONFLICT(name) DO UPDATE SET version = version + 1
+    ''', (name,))
+
+def read_version(conn: sqlite3.Connection, name: str) -> int:
+    """Current value of a cache counter on an open connection"""
+    row = conn.execute('SELECT version FROM cache_versions WHERE name = ?', (name,)).fetchone()
+    return row[0] if row else 0
+
+def get_version(db_path: str, name: str) -> int:
+    """Current value of a cache counter (0 if it was never bumped)"""
+    conn = connect(db_path)
+    try:
+        return read_version(conn, name)
+    finally:
+        conn.close()
+
+def bump(db_path: str, name: str):
+    """Increment a cache counter in its own transaction"""
+    conn = connect(db_path)
+    try:
+        bump_version(conn, name)
+        conn.commit()
+    finally:
+        conn.close()
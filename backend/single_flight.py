@@ -0,0 +1,86 @@
+# backend/single_flight.py
+#
+# Request coalescing for /ask. When many operators ask the same thing at
+# the same moment (shift briefings), only the first request (the leader)
+# runs retrieval and the LLM call; requests with the same key that arrive
+# while it is in flight await the leader's result instead of starting
+# their own. The work runs as its own task, so a leader whose client
+# disconnects doesn't cancel it for the followers.
+#
+# State is per worker process and per event loop; nothing is cached once
+# the in-flight call finishes.
+
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, List
+
+try:
+    from .language import word_tokens
+except ImportError:
+    from language import word_tokens
+
+def normalize_question(question: str) -> str:
+    """Case-folded words only, so case, spacing and punctuation don't split keys.
+
+    Devanagari vowel signs stay part of their word: "दिन" and "दान" differ."""
+    return " ".join(word_tokens(question))
+
+class SingleFlight:
+    """Share one in-flight coroutine between concurrent callers with the same key"""
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Run func() unless a call with the same key is already running"""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+            self._count(leader=True)
+        else:
+            self._count(leader=False)
+        return await asyncio.shield(task)
+
+    def _finished(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Mark the exception as retrieved even if every caller went away
+        if not task.cancelled():
+            task.exception()
+
+    def _count(self, leader: bool):
+        with self._lock:
+            if leader:
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+
+    def snapshot(self):
+        """Leader/follower counts and the share of requests that were coalesced"""
+        return self.merged_snapshot([self.export_state()])
+
+    def export_state(self) -> Dict[str, int]:
+        """Raw counters, written to the shared database by worker_metrics"""
+        with self._lock:
+            return {"leaders": self.leaders, "coalesced": self.coalesced, "in_flight": len(self._inflight)}
+
+    @staticmethod
+    def merged_snapshot(states: List[Dict[str, int]]):
+        """snapshot() over the export_state() of several workers"""
+        leaders = sum(state["leaders"] for state in states)
+        coalesced = sum(state["coalesced"] for state in states)
+        total = leaders + coalesced
+        return {
+            "requests": total,
+            "executed": leaders,
+            "coalesced": coalesced,
+            "coalesced_ratio": round(coalesced / total, 4) if total else 0,
+            "in_flight": sum(state["in_flight"] for state in states),
+        }
+
+ask_flights = SingleFlight()
@@ -0,0 +1,469 @@
+# backend/sparse_index.py
+#
+# Sparse term-by-chunk matrix for fast keyword retrieval.
+#
+# The matrix is stored CSR-style with one row per vocabulary term:
+#   indptr[t]:indptr[t+1]  -> slice of `indices`/`data` for term t
+#   indices                -> column (chunk position) of each entry
+#   data                   -> term frequency of the term in that chunk
+# A question is turned into a sparse query vector over the vocabulary and
+# scored against every chunk with a single bincount, then the top results
+# are picked with argpartition. Arrays are persisted as .npy files and
+# memory-mapped on load so a new worker can serve queries immediately.
+
+import os
+import json
+import time
+import uuid
+import shutil
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+from .shared_state import connect, bump_version, get_version
+from .language import tokenize, transliteration_terms, query_transliteration_terms
+
+try:
+    import numpy as np
+    numpy_available = True
+except ImportError:
+    np = None
+    numpy_available = False
+
+INDEX_DIR = os.getenv("SPARSE_INDEX_DIR", os.path.join("data", "index"))
+
+# Same weights as the legacy scorer in QAEngine.search_chunks
+EXACT_MATCH_WEIGHT = 10.0
+PARTIAL_MATCH_WEIGHT = 5.0
+
+# cache_versions counter bumped on every save
+SPARSE_INDEX_VERSION = "sparse_index"
+
+# Stored in each segment; a segment written by another tokenizer is rebuilt
+TOKENIZER_VERSION = 2
+
+# Chunk-table helpers shared with the ANN index (backend/ann_index.py)
+
+def chunk_table_signature(db_path: str):
+    """Cheap fingerprint of the chunk table used to detect stale indexes"""
+    conn = connect(db_path)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='document_chunks'")
+        if not cursor.fetchone():
+            return [0, 0]
+        cursor.execute('''
+            SELECT COUNT(*), COALESCE(MAX(dc.id), 0)
+            FROM document_chunks dc
+            JOIN documents d ON dc.document_id = d.id
+        ''')
+        count, max_id = cursor.fetchone()
+        return [count, max_id]
+    finally:
+        conn.close()
+
+def fetch_chunk_rows(db_path: str, document_id=None):
+    """Fetch (chunk rowid, content, filename, file_type, user_id) rows"""
+    conn = connect(db_path)
+    try:
+        cursor = conn.cursor()
+        query = '''
+            SELECT dc.id, dc.content, d.filename, d.file_type, d.user_id
+            FROM document_chunks dc
+            JOIN documents d ON dc.document_id = d.id
+        '''
+        if document_id is not None:
+            cursor.execute(query + ' WHERE d.id = ? ORDER BY dc.id', (document_id,))
+        else:
+            cursor.execute(query + ' ORDER BY dc.id')
+        return cursor.fetchall()
+    finally:
+        conn.close()
+
+def fetch_chunk_contents(db_path: str, chunk_ids: List[int]):
+    """Load (content, filename, file_type) for the given chunk rowids, keyed by rowid"""
+    if not chunk_ids:
+        return {}
+    conn = connect(db_path)
+    try:
+        cursor = conn.cursor()
+        placeholders = ",".join("?" for _ in chunk_ids)
+        cursor.execute(f'''
+            SELECT dc.id, dc.content, d.filename, d.file_type
+            FROM document_chunks dc
+            JOIN documents d ON dc.document_id = d.id
+            WHERE dc.id IN ({placeholders})
+        ''', [int(chunk_id) for chunk_id in chunk_ids])
+        return {row[0]: row[1:] for row in cursor.fetchall()}
+    finally:
+        conn.close()
+
+class SparseIndex:
+    def __init__(self, db_path: str = "documents.db", index_dir: str = INDEX_DIR):
+        self.db_path = db_path
+        self.index_dir = index_dir
+        self.loaded = False
+        self.version = None
+        self._reset()
+
+    def _reset(self):
+        """Start from an empty matrix"""
+        self.vocab: Dict[str, int] = {}
+        self.terms: List[str] = []
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.zeros(0, dtype=np.int32)
+        self.data = np.zeros(0, dtype=np.float32)
+        # Per-chunk columns
+        self.chunk_ids = np.zeros(0, dtype=np.int64)
+        self.chunk_owner = np.zeros(0, dtype=np.int32)
+        self.chunk_file = np.zeros(0, dtype=np.int32)
+        # Code tables for the per-chunk columns
+        self.owners: List[Optional[str]] = []
+        self.files: List[Tuple[str, str]] = []
+        self.signature = None
+        self._partial_cache: Dict[str, List[int]] = {}
+        self._partial_cache_size = 0
+
+    @property
+    def num_chunks(self) -> int:
+        return len(self.chunk_ids)
+
+    # ------------------------------------------------------------------
+    # Database helpers
+    # ------------------------------------------------------------------
+
+    def _database_signature(self):
+        return chunk_table_signature(self.db_path)
+
+    def _fetch_rows(self, document_id=None):
+        return fetch_chunk_rows(self.db_path, document_id)
+
+    def fetch_chunks(self, chunk_ids: List[int]):
+        """Load chunk content for the given rowids, keyed by rowid"""
+        return fetch_chunk_contents(self.db_path, chunk_ids)
+
+    # ------------------------------------------------------------------
+    # Building
+    # ------------------------------------------------------------------
+
+    def _code(self, table: list, lookup: dict, value) -> int:
+        if value not in lookup:
+            lookup[value] = len(table)
+            table.append(value)
+        return lookup[value]
+
+    def _rows_to_coo(self, rows):
+        """Tokenize chunk rows into COO triples plus per-chunk columns"""
+        owner_lookup = {owner: i for i, owner in enumerate(self.owners)}
+        file_lookup = {entry: i for i, entry in enumerate(self.files)}
+        start_col = self.num_chunks
+
+        term_rows, cols, counts = [], [], []
+        chunk_ids, chunk_owner, chunk_file = [], [], []
+
+        for offset, (chunk_id, content, filename, file_type, user_id) in enumerate(rows):
+            col = start_col + offset
+            chunk_ids.append(chunk_id)
+            chunk_owner.append(self._code(self.owners, owner_lookup, user_id))
+            chunk_file.append(self._code(self.files, file_lookup, (filename, file_type)))
+
+            frequencies: Dict[int, int] = {}
+            # Words plus their transliteration keys ("~d.."/"~l.."), which
+            # only query words in the other script look up
+            for token in tokenize(content) + transliteration_terms(content):
+                term_id = self.vocab.get(token)
+                if term_id is None:
+                    term_id = len(self.terms)
+                    self.vocab[token] = term_id
+                    self.terms.append(token)
+                frequencies[term_id] = frequencies.get(term_id, 0) + 1
+
+            term_rows.extend(frequencies.keys())
+            cols.extend([col] * len(frequencies))
+            counts.extend(frequencies.values())
+
+        return (
+            np.asarray(term_rows, dtype=np.int64),
+            np.asarray(cols, dtype=np.int32),
+            np.asarray(counts, dtype=np.float32),
+            np.asarray(chunk_ids, dtype=np.int64),
+            np.asarray(chunk_owner, dtype=np.int32),
+            np.asarray(chunk_file, dtype=np.int32),
+        )
+
+    def _existing_coo(self):
+        """Expand the current CSR matrix back into COO triples"""
+        row_lengths = np.diff(self.indptr)
+        term_rows = np.repeat(np.arange(len(row_lengths), dtype=np.int64), row_lengths)
+        return term_rows, np.asarray(self.indices), np.asarray(self.data)
+
+    def _set_csr(self, term_rows, cols, data):
+        """Sort COO triples by term and store them as CSR"""
+        order = np.argsort(term_rows, kind="stable")
+        self.indices = cols[order].astype(np.int32, copy=False)
+        self.data = data[order].astype(np.float32, copy=False)
+        row_counts = np.bincount(term_rows, minlength=len(self.terms))
+        self.indptr = np.zeros(len(self.terms) + 1, dtype=np.int64)
+        np.cumsum(row_counts, out=self.indptr[1:])
+
+    def _append_rows(self, rows):
+        if not rows:
+            return
+        old_rows, old_cols, old_data = self._existing_coo()
+        new_rows, new_cols, new_data, chunk_ids, chunk_owner, chunk_file = self._rows_to_coo(rows)
+        self._set_csr(
+            np.concatenate([old_rows, new_rows]),
+            np.concatenate([old_cols, new_cols]),
+            np.concatenate([old_data, new_data]),
+        )
+        self.chunk_ids = np.concatenate([np.asarray(self.chunk_ids), chunk_ids])
+        self.chunk_owner = np.concatenate([np.asarray(self.chunk_owner), chunk_owner])
+        self.chunk_file = np.concatenate([np.asarray(self.chunk_file), chunk_file])
+
+    def _drop_chunks(self, drop_mask):
+        """Remove chunk columns flagged in drop_mask and renumber the rest"""
+        if not drop_mask.any():
+            return
+        keep_chunks = ~drop_mask
+        new_position = np.cumsum(keep_chunks) - 1
+        term_rows, cols, data = self._existing_coo()
+        keep_entries = keep_chunks[cols]
+        self._set_csr(term_rows[keep_entries], new_position[cols[keep_entries]], data[keep_entries])
+        self.chunk_ids = np.asarray(self.chunk_ids)[keep_chunks]
+        self.chunk_owner = np.asarray(self.chunk_owner)[keep_chunks]
+        self.chunk_file = np.asarray(self.chunk_file)[keep_chunks]
+
+    def build_from_database(self):
+        """Rebuild the whole matrix from the chunk table"""
+        with self._exclusive():
+            self._reset()
+            rows = self._fetch_rows()
+            self._append_rows(rows)
+            self.signature = self._database_signature()
+            self.loaded = True
+            self.save()
+        print(f"Built sparse index: {len(self.terms)} terms x {self.num_chunks} chunks, {len(self.indices)} entries")
+
+    def add_document(self, document_id: int):
+        """Index the chunks of a freshly stored document"""
+        self.ensure_loaded()
+        rows = self._fetch_rows(document_id)
+        if not rows:
+            return
+        with self._exclusive():
+            # Re-uploads replace the previous version of the same filename
+            self._remove_filename(rows[0][2])
+            self._append_rows(rows)
+            self.signature = self._database_signature()
+            self.save()
+
+    def _remove_filename(self, filename: str):
+        file_codes = [i for i, (name, _) in enumerate(self.files) if name == filename]
+        if file_codes and self.num_chunks:
+            self._drop_chunks(np.isin(np.asarray(self.chunk_file), file_codes))
+
+    def remove_document(self, filename: str):
+        """Drop every chunk that belongs to filename"""
+        self.ensure_loaded()
+        with self._exclusive():
+            self._remove_filename(filename)
+            self.signature = self._database_signature()
+            self.save()
+
+    def clear(self):
+        """Forget every indexed chunk"""
+        with self._exclusive():
+            self._reset()
+            self.signature = self._database_signature()
+            self.loaded = True
+            self.save()
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+    #
+    # Each save writes a new segment directory and then atomically swaps the
+    # CURRENT pointer file, so workers that still have the previous segment
+    # memory-mapped keep reading a consistent copy. Saves bump a counter in
+    # the cache_versions table; every worker compares it before searching
+    # and reloads when another process changed the index.
+
+    _ARRAYS = ("indptr", "indices", "data", "chunk_ids", "chunk_owner", "chunk_file")
+    STALE_SEGMENT_SECONDS = 300
+
+    @contextmanager
+    def _exclusive(self):
+        """Serialize index writers across processes with a SQLite write lock"""
+        conn = connect(self.db_path)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            # Another worker may have saved since we last loaded
+            if get_version(self.db_path, SPARSE_INDEX_VERSION) != self.version:
+                self.loaded = False
+                if not self.load():
+                    self._reset()
+            yield
+            bump_version(conn, SPARSE_INDEX_VERSION)
+            conn.commit()
+            self.version = get_version(self.db_path, SPARSE_INDEX_VERSION)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def save(self):
+        """Write the index as a new segment of .npy arrays plus a JSON sidecar"""
+        os.makedirs(self.index_dir, exist_ok=True)
+        segment = f"seg-{uuid.uuid4().hex}"
+        segment_dir = os.path.join(self.index_dir, segment)
+        os.makedirs(segment_dir)
+
+        for name in self._ARRAYS:
+            np.save(os.path.join(segment_dir, f"{name}.npy"), np.asarray(getattr(self, name)))
+        with open(os.path.join(segment_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "terms": self.terms,
+                "owners": self.owners,
+                "files": self.files,
+                "signature": self.signature,
+                "tokenizer": TOKENIZER_VERSION,
+            }, f, ensure_ascii=False)
+
+        pointer_tmp = os.path.join(self.index_dir, f"CURRENT.{os.getpid()}.tmp")
+        with open(pointer_tmp, "w", encoding="utf-8") as f:
+            f.write(segment)
+        os.replace(pointer_tmp, os.path.join(self.index_dir, "CURRENT"))
+        self._remove_stale_segments(segment)
+
+    def _remove_stale_segments(self, current: str):
+        now = time.time()
+        for name in os.listdir(self.index_dir):
+            path = os.path.join(self.index_dir, name)
+            if name.startswith("seg-") and name != current:
+                if now - os.path.getmtime(path) > self.STALE_SEGMENT_SECONDS:
+                    shutil.rmtree(path, ignore_errors=True)
+
+    def load(self) -> bool:
+        """Memory-map the current segment; returns False if none is usable"""
+        pointer_path = os.path.join(self.index_dir, "CURRENT")
+        if not os.path.exists(pointer_path):
+            return False
+        try:
+            version = get_version(self.db_path, SPARSE_INDEX_VERSION)
+            with open(pointer_path, "r", encoding="utf-8") as f:
+                segment_dir = os.path.join(self.index_dir, f.read().strip())
+            with open(os.path.join(segment_dir, "meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("tokenizer") != TOKENIZER_VERSION:
+                return False
+            arrays = {
+                name: np.load(os.path.join(segment_dir, f"{name}.npy"), mmap_mode="r")
+                for name in self._ARRAYS
+            }
+        except Exception as e:
+            print(f"Error loading sparse index: {e}")
+            return False
+
+        self._reset()
+        self.terms = meta["terms"]
+        self.vocab = {term: i for i, term in enumerate(self.terms)}
+        self.owners = meta["owners"]
+        self.files = [tuple(entry) for entry in meta["files"]]
+        self.signature = meta.get("signature")
+        for name, array in arrays.items():
+            setattr(self, name, array)
+        self.version = version
+        self.loaded = True
+        return True
+
+    def ensure_loaded(self):
+        """Load from disk, reloading if another worker saved a newer index and
+        rebuilding if the chunk table changed underneath us"""
+        if self.loaded and get_version(self.db_path, SPARSE_INDEX_VERSION) == self.version:
+            return
+        if not self.load() or self.signature != self._database_signature():
+            self.build_from_database()
+
+    # ------------------------------------------------------------------
+    # Querying
+    # ------------------------------------------------------------------
+
+    def _partial_matches(self, word: str) -> List[int]:
+        """Vocabulary terms that contain word or are contained in it"""
+        if self._partial_cache_size != len(self.terms):
+            self._partial_cache = {}
+            self._partial_cache_size = len(self.terms)
+        if word not in self._partial_cache:
+            self._partial_cache[word] = [
+                term_id for term_id, term in enumerate(self.terms)
+                if word in term or term in word
+            ]
+        return self._partial_cache[word]
+
+    def query_vector(self, question: str):
+        """Map a question to (term ids, tf weights, presence weights)"""
+        weights: Dict[int, List[float]] = {}
+        for word in tokenize(question):
+            term_id = self.vocab.get(word)
+            if term_id is not None:
+                weight = weights.setdefault(term_id, [0.0, 0.0])
+                weight[1] += EXACT_MATCH_WEIGHT
+            # Longer words also score partial matches on related terms,
+            # like "instruction" against "instructions"
+            if len(word) > 4:
+                for candidate_id in self._partial_matches(word):
+                    weight = weights.setdefault(candidate_id, [0.0, 0.0])
+                    weight[0] += PARTIAL_MATCH_WEIGHT
+        # English words find their Devanagari loanword spellings and back
+        for key in query_transliteration_terms(question):
+            term_id = self.vocab.get(key)
+            if term_id is not None:
+                weight = weights.setdefault(term_id, [0.0, 0.0])
+                weight[1] += PARTIAL_MATCH_WEIGHT
+
+        term_ids = np.fromiter(weights.keys(), dtype=np.int64, count=len(weights))
+        tf_weights = np.fromiter((w[0] for w in weights.values()), dtype=np.float32, count=len(weights))
+        presence_weights = np.fromiter((w[1] for w in weights.values()), dtype=np.float32, count=len(weights))
+        return term_ids, tf_weights, presence_weights
+
+    def score(self, question: str, user_id: Optional[str] = None):
+        """Dense score vector over all chunks for a question"""
+        term_ids, tf_weights, presence_weights = self.query_vector(question)
+        if len(term_ids) == 0 or self.num_chunks == 0:
+            return np.zeros(self.num_chunks, dtype=np.float64)
+
+        # Gather the posting lists of every query term in one shot
+        starts = np.asarray(self.indptr[term_ids])
+        lengths = np.asarray(self.indptr[term_ids + 1]) - starts
+        total = int(lengths.sum())
+        offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        positions = np.arange(total, dtype=np.int64) + offsets
+
+        cols = np.asarray(self.indices[positions])
+        frequencies = np.asarray(self.data[positions])
+        weights = np.repeat(tf_weights, lengths) * frequencies + np.repeat(presence_weights, lengths)
+        scores = np.bincount(cols, weights=weights, minlength=self.num_chunks)
+
+        if user_id is not None:
+            if user_id in self.owners:
+                scores[np.asarray(self.chunk_owner) != self.owners.index(user_id)] = 0
+            else:
+                scores[:] = 0
+        return scores
+
+    def search(self, question: str, top_k: Optional[int] = 50, user_id: Optional[str] = None):
+        """Return [(chunk rowid, filename, file_type, score)] best first"""
+        self.ensure_loaded()
+        scores = self.score(question, user_id)
+        matched = np.flatnonzero(scores > 0)
+        if top_k and top_k > 0 and len(matched) > top_k:
+            best = np.argpartition(scores[matched], -top_k)[-top_k:]
+            matched = matched[best]
+        # Sort the (small) candidate set; ties keep chunk order like the legacy scorer
+        matched = np.sort(matched)
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+
+        results = []
+        for col in matched:
+            filename, file_type = self.files[int(self.chunk_file[col])]
+            results.append((int(self.chunk_ids[col]), filename, file_type, float(scores[col])))
+        return results
@@ -0,0 +1,180 @@
+# backend/tracing.py
+#
+# Minimal tracing layer for the QA hot path. Spans are context managers
+# (or the @traced decorator) that nest through a context variable. When a
+# root span ends, the whole trace is appended to TRACE_FILE as one line of
+# OTLP/JSON (an ExportTraceServiceRequest), which the OpenTelemetry
+# Collector's file receiver and most trace viewers can read directly.
+#
+# Tracing is off unless TRACE_FILE is set; spans then cost one context
+# variable lookup. TRACE_SAMPLE_RATE decides per trace (at the root span)
+# whether it is recorded.
+
+import contextvars
+import functools
+import inspect
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+TRACE_FILE = os.getenv("TRACE_FILE", "")
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "whf-chatbot-backend")
+
+# OTLP status codes
+STATUS_UNSET = 0
+STATUS_ERROR = 2
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns",
+                 "attributes", "status", "message", "sampled")
+
+    def __init__(self, name: str, parent: Optional["Span"], sampled: bool):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else "%032x" % random.getrandbits(128)
+        self.span_id = "%016x" % random.getrandbits(64)
+        self.parent_id = parent.span_id if parent else ""
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes: Dict[str, Any] = {}
+        self.status = STATUS_UNSET
+        self.message = ""
+        self.sampled = sampled
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_otlp_attribute(key, value) for key, value in self.attributes.items()],
+            "status": {"code": self.status, "message": self.message} if self.status else {},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+class _NoopSpan:
+    """Returned when tracing is off so callers can always set attributes"""
+    sampled = False
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+NOOP_SPAN = _NoopSpan()
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+class FileSpanExporter:
+    """Collects the spans of each trace and appends finished traces to a file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._pending: Dict[str, List[Span]] = {}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def on_end(self, span: Span):
+        with self._lock:
+            spans = self._pending.setdefault(span.trace_id, [])
+            spans.append(span)
+            if span.parent_id:
+                return
+            # Root span finished: the trace is complete
+            del self._pending[span.trace_id]
+        self.export(spans)
+
+    def export(self, spans: List[Span]):
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": [
+                    _otlp_attribute("service.name", SERVICE_NAME),
+                    _otlp_attribute("process.pid", os.getpid()),
+                ]},
+                "scopeSpans": [{
+                    "scope": {"name": "backend.tracing"},
+                    "spans": [span.to_otlp() for span in spans],
+                }],
+            }]
+        }
+        line = json.dumps(payload, separators=(",", ":")) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+_exporter: Optional[FileSpanExporter] = FileSpanExporter(TRACE_FILE) if TRACE_FILE else None
+
+def configure(trace_file: Optional[str], sample_rate: float = 1.0):
+    """Turn tracing on (writing to trace_file) or off (None) at runtime"""
+    global _exporter, TRACE_SAMPLE_RATE
+    _exporter = FileSpanExporter(trace_file) if trace_file else None
+    TRACE_SAMPLE_RATE = sample_rate
+
+def tracing_enabled() -> bool:
+    return _exporter is not None
+
+@contextmanager
+def span(name: str, **attributes):
+    """Time a block as a child of the current span (or start a new trace)"""
+    exporter = _exporter
+    if exporter is None:
+        yield NOOP_SPAN
+        return
+
+    parent = _current_span.get()
+    sampled = parent.sampled if parent else random.random() < TRACE_SAMPLE_RATE
+    current = Span(name, parent, sampled)
+    current.attributes.update(attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.status = STATUS_ERROR
+        current.message = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end_ns = time.time_ns()
+        if sampled:
+            exporter.on_end(current)
+
+def traced(name: Optional[str] = None):
+    """Decorator form of span(); works for plain and async functions"""
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
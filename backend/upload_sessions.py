@@ -0,0 +1,404 @@
+# backend/upload_sessions.py
+#
+# Resumable uploads for large files. A client opens a session (filename,
+# total size, optionally the file's SHA-256), then appends the file in parts
+# of any size up to UPLOAD_PART_MAX_BYTES, each sent at the byte offset the
+# session has reached. Part bodies are streamed straight to a .part file on
+# disk and into a running SHA-256, so nothing holds the whole file in memory.
+# If the connection drops, GET the session for its offset and continue from
+# there: the offset only advances once a part has been fully written, and
+# anything written past it is truncated by the next append. Completing the
+# session checks size and hash, renames the .part file to the upload's own
+# extension and hands that path to the caller for extraction; once the
+# caller has ingested it, finish() marks the session completed and deletes
+# the file.
+#
+# Session rows live in documents.db so any worker process can take the next
+# part. Before writing, a part claims the session under BEGIN IMMEDIATE; a
+# second part sent while the first is still being written gets 409 instead
+# of writing over it. The claim lapses after UPLOAD_PART_TIMEOUT_SECONDS,
+# and its holder stops writing by then, so a dead client can't block the
+# session. Completion takes the same claim (for UPLOAD_COMPLETE_TIMEOUT_SECONDS,
+# which covers extraction), so a second or retried completion gets 409
+# instead of ingesting the file again. File writes, fsync and hashing run in
+# worker threads, off the event loop. The running hash is kept per process; a worker that did not
+# write the previous part rebuilds it by reading the .part file once.
+
+import asyncio
+import hashlib
+import os
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional, Tuple
+
+try:
+    from .shared_state import connect
+except ImportError:
+    from shared_state import connect
+
+UPLOAD_SESSION_DIR = os.getenv("UPLOAD_SESSION_DIR", os.path.join("data", "upload_sessions"))
+UPLOAD_PART_SIZE = int(os.getenv("UPLOAD_PART_SIZE", str(8 * 1024 * 1024)))
+UPLOAD_PART_MAX_BYTES = int(os.getenv("UPLOAD_PART_MAX_BYTES", str(64 * 1024 * 1024)))
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+# Sessions not touched for this long are deleted with their partial file
+UPLOAD_SESSION_TTL_SECONDS = float(os.getenv("UPLOAD_SESSION_TTL_SECONDS", str(24 * 3600)))
+# A part still being written after this long is cut off and may be re-sent
+UPLOAD_PART_TIMEOUT_SECONDS = float(os.getenv("UPLOAD_PART_TIMEOUT_SECONDS", "600"))
+# A completion (verification plus extraction) may be retried after this long
+UPLOAD_COMPLETE_TIMEOUT_SECONDS = float(os.getenv("UPLOAD_COMPLETE_TIMEOUT_SECONDS", "3600"))
+
+READ_BLOCK = 1024 * 1024
+
+# upload_sessions.writer: a part's claim token, COMPLETING + token while the
+# upload is verified and ingested, COMPLETED for good afterwards
+COMPLETING = "completing:"
+COMPLETED = "completed"
+
+class UploadError(Exception):
+    """Rejected upload request; status_code is the HTTP status to answer with"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+def create_upload_tables(cursor):
+    """Create the upload session table (caller commits)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS upload_sessions (
+            id TEXT PRIMARY KEY,
+            user_id TEXT,
+            filename TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            received INTEGER NOT NULL DEFAULT 0,
+            sha256 TEXT,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            writer TEXT,
+            writer_expires_at REAL
+        )
+    ''')
+    # Sessions table from before parts claimed the session
+    cursor.execute("PRAGMA table_info(upload_sessions)")
+    columns = {column[1] for column in cursor.fetchall()}
+    for column, kind in (("writer", "TEXT"), ("writer_expires_at", "REAL")):
+        if column not in columns:
+            cursor.execute(f"ALTER TABLE upload_sessions ADD COLUMN {column} {kind}")
+
+class UploadSessionManager:
+    """Upload sessions in SQLite, part data in UPLOAD_SESSION_DIR"""
+
+    def __init__(self, db_path: str = "documents.db", directory: str = UPLOAD_SESSION_DIR):
+        self.db_path = db_path
+        self.directory = directory
+        self._ready = False
+        # upload id -> (offset, sha256 of the bytes before offset)
+        self._hashers: Dict[str, Any] = {}
+        self._hashers_lock = threading.Lock()
+
+    def _connect(self):
+        conn = connect(self.db_path)
+        if not self._ready:
+            create_upload_tables(conn.cursor())
+            conn.commit()
+            os.makedirs(self.directory, exist_ok=True)
+            self._ready = True
+        return conn
+
+    def part_path(self, upload_id: str) -> str:
+        return os.path.join(self.directory, f"{upload_id}.part")
+
+    def file_path(self, upload_id: str, filename: str) -> str:
+        """Where a completed upload sits, with its extension for the extractors"""
+        return os.path.join(self.directory, upload_id + os.path.splitext(filename)[1].lower())
+
+    def _row(self, conn, upload_id: str, user_id: Optional[str]) -> Dict[str, Any]:
+        row = conn.execute('''
+            SELECT id, user_id, filename, size, received, sha256, created_at, updated_at, writer, writer_expires_at
+            FROM upload_sessions WHERE id = ?
+        ''', (upload_id,)).fetchone()
+        if not row or row[1] != user_id:
+            raise UploadError(404, "Upload session not found")
+        keys = ("upload_id", "user_id", "filename", "size", "received", "sha256", "created_at", "updated_at",
+                "writer", "writer_expires_at")
+        return dict(zip(keys, row))
+
+    def _describe(self, session: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "upload_id": session["upload_id"],
+            "filename": session["filename"],
+            "size": session["size"],
+            "offset": session["received"],
+            "part_size": UPLOAD_PART_SIZE,
+            "completed": session["writer"] == COMPLETED,
+            "expires_at": session["updated_at"] + UPLOAD_SESSION_TTL_SECONDS,
+        }
+
+    def create(self, filename: str, size: int, user_id: Optional[str], sha256: Optional[str] = None) -> Dict[str, Any]:
+        """Open a session and its empty part file"""
+        if size <= 0:
+            raise UploadError(400, "File size must be positive")
+        if size > UPLOAD_MAX_BYTES:
+            raise UploadError(413, f"File is larger than {UPLOAD_MAX_BYTES} bytes")
+        if sha256 is not None and (len(sha256) != 64 or any(c not in "0123456789abcdef" for c in sha256.lower())):
+            raise UploadError(400, "sha256 must be 64 hex digits")
+        self.purge_expired()
+        now = time.time()
+        session = {"upload_id": uuid.uuid4().hex, "user_id": user_id, "filename": filename, "size": size,
+                   "received": 0, "sha256": sha256.lower() if sha256 else None, "created_at": now, "updated_at": now,
+                   "writer": None, "writer_expires_at": None}
+        conn = self._connect()
+        try:
+            open(self.part_path(session["upload_id"]), "wb").close()
+            conn.execute('''
+                INSERT INTO upload_sessions (id, user_id, filename, size, received, sha256, created_at, updated_at)
+                VALUES (?, ?, ?, ?, 0, ?, ?, ?)
+            ''', (session["upload_id"], user_id, filename, size, session["sha256"], now, now))
+            conn.commit()
+        finally:
+            conn.close()
+        return self._describe(session)
+
+    def status(self, upload_id: str, user_id: Optional[str]) -> Dict[str, Any]:
+        conn = self._connect()
+        try:
+            return self._describe(self._row(conn, upload_id, user_id))
+        finally:
+            conn.close()
+
+    def _hasher_at(self, upload_id: str, offset: int, path: Optional[str] = None, cached: bool = True):
+        """SHA-256 of the first offset bytes, from memory (if cached) or re-read from disk"""
+        if cached:
+            with self._hashers_lock:
+                entry = self._hashers.get(upload_id)
+            if entry and entry[0] == offset:
+                return entry[1].copy()
+        hasher = hashlib.sha256()
+        remaining = offset
+        with open(path or self.part_path(upload_id), "rb") as f:
+            while remaining:
+                block = f.read(min(READ_BLOCK, remaining))
+                if not block:
+                    raise UploadError(409, "Partial upload data is missing; start a new upload")
+                hasher.update(block)
+                remaining -= len(block)
+        return hasher
+
+    @staticmethod
+    def _check_free(session: Dict[str, Any], now: float):
+        """409 unless nobody holds a live claim on the session"""
+        writer = session["writer"]
+        if writer == COMPLETED:
+            raise UploadError(409, "Upload was already completed")
+        if writer and session["writer_expires_at"] > now:
+            if writer.startswith(COMPLETING):
+                raise UploadError(409, "Upload is already being completed")
+            raise UploadError(409, "Another part is being written to this upload")
+
+    def _claim(self, upload_id: str, user_id: Optional[str], offset: Optional[int],
+               completing: bool = False) -> Tuple[Dict[str, Any], str, float]:
+        """Reserve the session for one part at offset, or for completion; returns the session, claim token and deadline"""
+        now = time.time()
+        token = (COMPLETING if completing else "") + uuid.uuid4().hex
+        deadline = now + (UPLOAD_COMPLETE_TIMEOUT_SECONDS if completing else UPLOAD_PART_TIMEOUT_SECONDS)
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            session = self._row(conn, upload_id, user_id)
+            self._check_free(session, now)
+            if completing and session["received"] != session["size"]:
+                raise UploadError(409, f"Received {session['received']} of {session['size']} bytes")
+            if not completing and offset != session["received"]:
+                raise UploadError(409, f"Expected offset {session['received']}")
+            conn.execute('''
+                UPDATE upload_sessions SET writer = ?, writer_expires_at = ?, updated_at = ? WHERE id = ?
+            ''', (token, deadline, now, upload_id))
+            conn.commit()
+        finally:
+            # Closing without commit rolls back a refused claim
+            conn.close()
+        return session, token, deadline
+
+    def _release(self, upload_id: str, token: str, received: Optional[int] = None) -> bool:
+        """Drop a claim, advancing the offset to received if given; False if the claim was lost"""
+        conn = self._connect()
+        try:
+            if received is None:
+                cursor = conn.execute('''
+                    UPDATE upload_sessions SET writer = NULL, writer_expires_at = NULL WHERE id = ? AND writer = ?
+                ''', (upload_id, token))
+            else:
+                cursor = conn.execute('''
+                    UPDATE upload_sessions SET received = ?, updated_at = ?, writer = NULL, writer_expires_at = NULL
+                    WHERE id = ? AND writer = ?
+                ''', (received, time.time(), upload_id, token))
+            conn.commit()
+            return cursor.rowcount == 1
+        finally:
+            conn.close()
+
+    def _open_at(self, upload_id: str, offset: int):
+        try:
+            f = open(self.part_path(upload_id), "r+b")
+        except FileNotFoundError:
+            raise UploadError(409, "Partial upload data is missing; start a new upload")
+        # Drop whatever an interrupted part left behind
+        f.seek(offset)
+        f.truncate()
+        return f
+
+    @staticmethod
+    def _write(f, hasher, data, sync: bool = False):
+        f.write(data)
+        hasher.update(data)
+        if sync:
+            f.flush()
+            os.fsync(f.fileno())
+
+    async def append(self, upload_id: str, user_id: Optional[str], offset: int, stream) -> Dict[str, Any]:
+        """Write one part from an async byte stream at offset; returns the new status"""
+        session, token, deadline = await asyncio.to_thread(self._claim, upload_id, user_id, offset)
+        try:
+            hasher = await asyncio.to_thread(self._hasher_at, upload_id, offset)
+            f = await asyncio.to_thread(self._open_at, upload_id, offset)
+            try:
+                written = 0
+                buffer = bytearray()
+                async for block in stream:
+                    if not block:
+                        continue
+                    written += len(block)
+                    if written > UPLOAD_PART_MAX_BYTES:
+                        raise UploadError(413, f"Parts are limited to {UPLOAD_PART_MAX_BYTES} bytes")
+                    if offset + written > session["size"]:
+                        raise UploadError(400, "Part extends past the declared file size")
+                    buffer += block
+                    if len(buffer) >= READ_BLOCK:
+                        self._check_deadline(deadline)
+                        data, buffer = buffer, bytearray()
+                        await asyncio.to_thread(self._write, f, hasher, data)
+                if not written:
+                    raise UploadError(400, "Empty part")
+                self._check_deadline(deadline)
+                await asyncio.to_thread(self._write, f, hasher, buffer, True)
+            finally:
+                f.close()
+        except BaseException:
+            await asyncio.to_thread(self._release, upload_id, token)
+            raise
+
+        received = offset + written
+        if not await asyncio.to_thread(self._release, upload_id, token, received):
+            raise UploadError(409, "Upload session was aborted or taken over while this part was written")
+        with self._hashers_lock:
+            self._hashers[upload_id] = (received, hasher)
+        return await asyncio.to_thread(self.status, upload_id, user_id)
+
+    @staticmethod
+    def _check_deadline(deadline: float):
+        # Once the claim has lapsed another part may own the file
+        if time.time() >= deadline:
+            raise UploadError(408, f"Part took longer than {UPLOAD_PART_TIMEOUT_SECONDS:g}s; resume from the current offset")
+
+    def complete(self, upload_id: str, user_id: Optional[str]) -> Dict[str, Any]:
+        """Claim and verify a fully received upload.
+
+        Returns its filename, size, sha256, file path and the completion claim,
+        which the caller passes to finish() after ingesting the file or to
+        reopen() if that failed."""
+        session, claim, _ = self._claim(upload_id, user_id, None, completing=True)
+        try:
+            part_path = self.part_path(upload_id)
+            path = self.file_path(upload_id, session["filename"])
+            # A completion retried after reopen() finds the file already renamed
+            source = part_path if os.path.exists(part_path) else path
+            if not os.path.exists(source) or os.path.getsize(source) < session["size"]:
+                raise UploadError(409, "Partial upload data is missing; start a new upload")
+            # Without a declared hash, report the digest of what is actually on disk
+            digest = self._hasher_at(upload_id, session["size"], source, cached=bool(session["sha256"])).hexdigest()
+            if session["sha256"] and digest != session["sha256"]:
+                # The data is wrong somewhere; start over rather than keep it
+                self._delete(upload_id, session["filename"])
+                raise UploadError(422, "SHA-256 of the uploaded data does not match")
+            if source == part_path:
+                with open(part_path, "r+b") as f:
+                    f.truncate(session["size"])
+                os.replace(part_path, path)
+        except BaseException:
+            self._release(upload_id, claim)
+            raise
+        return {"filename": session["filename"], "size": session["size"], "sha256": digest, "path": path,
+                "claim": claim}
+
+    def finish(self, upload_id: str, filename: str, claim: str):
+        """Mark a claimed completion as done and delete the ingested file.
+
+        The row stays until it expires so a retried completion gets 409; if the
+        session was deleted meanwhile there is nothing left to mark."""
+        conn = self._connect()
+        try:
+            conn.execute('''
+                UPDATE upload_sessions SET writer = ?, writer_expires_at = NULL, updated_at = ?
+                WHERE id = ? AND writer = ?
+            ''', (COMPLETED, time.time(), upload_id, claim))
+            conn.commit()
+        finally:
+            conn.close()
+        self._discard(upload_id, filename)
+
+    def reopen(self, upload_id: str, claim: str):
+        """Give up a completion claim (ingest failed) so the completion can be retried"""
+        self._release(upload_id, claim)
+
+    def abort(self, upload_id: str, user_id: Optional[str]):
+        """Delete a session and its data, unless it is being completed right now"""
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            session = self._row(conn, upload_id, user_id)
+            # A part being written notices the deletion when it commits; an ingest would not
+            writer = session["writer"]
+            if writer and writer.startswith(COMPLETING) and session["writer_expires_at"] > time.time():
+                raise UploadError(409, "Upload is being completed")
+            conn.execute('DELETE FROM upload_sessions WHERE id = ?', (upload_id,))
+            conn.commit()
+        finally:
+            conn.close()
+        self._discard(upload_id, session["filename"])
+
+    def _delete(self, upload_id: str, filename: str):
+        conn = self._connect()
+        try:
+            conn.execute('DELETE FROM upload_sessions WHERE id = ?', (upload_id,))
+            conn.commit()
+        finally:
+            conn.close()
+        self._discard(upload_id, filename)
+
+    def _discard(self, upload_id: str, filename: str):
+        with self._hashers_lock:
+            self._hashers.pop(upload_id, None)
+        for path in (self.part_path(upload_id), self.file_path(upload_id, filename)):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def purge_expired(self) -> int:
+        """Delete sessions idle for longer than UPLOAD_SESSION_TTL_SECONDS"""
+        cutoff = time.time() - UPLOAD_SESSION_TTL_SECONDS
+        conn = self._connect()
+        try:
+            expired = conn.execute(
+                'SELECT id, filename FROM upload_sessions WHERE updated_at < ?', (cutoff,)).fetchall()
+            if expired:
+                conn.executemany('DELETE FROM upload_sessions WHERE id = ?', [(upload_id,) for upload_id, _ in expired])
+                conn.commit()
+        finally:
+            conn.close()
+        for upload_id, filename in expired:
+            self._discard(upload_id, filename)
+        return len(expired)
+
+upload_sessions = UploadSessionManager()
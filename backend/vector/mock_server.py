@@ -0,0 +1,204 @@
+# backend/vector/mock_server.py
+#
+# In-process stand-in for Weaviate, for benchmarking imports and queries
+# without Docker. It serves the part of the v1 REST/GraphQL API that
+# weaviate_client.py and weaviate-client 3.x use: readiness, meta, schema,
+# single and batch object creation, nodes status and Get/nearText queries.
+# nearText ranks objects by word overlap with the concepts - enough to
+# exercise the code paths, not a vector index.
+#
+# --latency-ms adds a fixed delay to every request, --object-ms a delay per
+# object created and --query-ms a delay per query. They stand in for network
+# round-trips and vectorization so that batching and concurrent queries show
+# up in the numbers.
+#
+#     python -m backend.vector.mock_server --port 8080 --latency-ms 2
+
+import argparse
+import heapq
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+_TOKEN_RE = re.compile(r"\w+")
+_GET_RE = re.compile(r"Get\s*\{\s*(\w+)\s*\((.*)\)\s*\{([^{}]*)\}", re.S)
+_LIMIT_RE = re.compile(r"limit:\s*(\d+)")
+_CONCEPTS_RE = re.compile(r"concepts:\s*(\[.*?\])\s*\}", re.S)
+
+class MockHTTPServer(ThreadingHTTPServer):
+    """ThreadingHTTPServer with a listen backlog deep enough for concurrent benchmark clients"""
+    # socketserver's default of 5 makes bursts of connections fail with resets
+    request_queue_size = 128
+    daemon_threads = True
+
+class MockWeaviate:
+    """Objects and schema held in memory, plus request counters"""
+
+    def __init__(self, latency_ms=0.0, object_ms=0.0, query_ms=0.0):
+        self.latency_ms = latency_ms
+        self.object_ms = object_ms
+        self.query_ms = query_ms
+        self.lock = threading.Lock()
+        self.classes = {}
+        self.objects = {}
+        self.stats = {"requests": 0, "objects_created": 0, "batches": 0, "queries": 0}
+        self.server = None
+        self.thread = None
+
+    # ---- storage ----
+
+    def create_class(self, class_obj):
+        with self.lock:
+            if class_obj["class"] in self.classes:
+                return False
+            self.classes[class_obj["class"]] = class_obj
+            self.objects.setdefault(class_obj["class"], {})
+            return True
+
+    def put_objects(self, objects):
+        if self.object_ms:
+            time.sleep(self.object_ms * len(objects) / 1000)
+        results = []
+        with self.lock:
+            for obj in objects:
+                object_id = obj.get("id") or str(uuid.uuid4())
+                properties = obj.get("properties", {})
+                tokens = frozenset(_TOKEN_RE.findall(" ".join(str(v) for v in properties.values()).lower()))
+                self.objects.setdefault(obj["class"], {})[object_id] = (properties, tokens)
+                self.stats["objects_created"] += 1
+                results.append({"id": object_id, "class": obj["class"], "properties": properties,
+                                "result": {}})
+        return results
+
+    def near_text(self, class_name, concepts, fields, limit):
+        if self.query_ms:
+            time.sleep(self.query_ms / 1000)
+        query = frozenset(_TOKEN_RE.findall(" ".join(concepts).lower()))
+        with self.lock:
+            stored = list(self.objects.get(class_name, {}).values())
+        scored = heapq.nlargest(limit, stored, key=lambda item: len(query & item[1]))
+        return [{field: properties.get(field) for field in fields} for properties, _ in scored]
+
+    def graphql(self, document):
+        match = _GET_RE.search(document)
+        if not match:
+            return {"errors": [{"message": "mock supports only Get queries"}]}
+        class_name, arguments, fields = match.groups()
+        limit = _LIMIT_RE.search(arguments)
+        concepts = _CONCEPTS_RE.search(arguments)
+        hits = self.near_text(class_name, json.loads(concepts.group(1)) if concepts else [],
+                              fields.split(), int(limit.group(1)) if limit else 100)
+        return {"data": {"Get": {class_name: hits}}}
+
+    # ---- HTTP ----
+
+    def handler_class(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Keep-alive plus Nagle would add delayed-ACK stalls to every reply
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def reply(self, status, body=None):
+                payload = b"" if body is None else json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def read_json(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                return json.loads(self.rfile.read(length) or b"{}")
+
+            def begin(self):
+                with mock.lock:
+                    mock.stats["requests"] += 1
+                if mock.latency_ms:
+                    time.sleep(mock.latency_ms / 1000)
+                return urlparse(self.path).path.rstrip("/")
+
+            def do_GET(self):
+                path = self.begin()
+                if path in ("/v1/.well-known/ready", "/v1/.well-known/live"):
+                    self.reply(200)
+                elif path == "/v1/.well-known/openid-configuration":
+                    self.reply(404)
+                elif path == "/v1/meta":
+                    self.reply(200, {"hostname": "mock", "version": "1.22.0", "modules": {}})
+                elif path == "/v1/nodes":
+                    self.reply(200, {"nodes": [{"name": "mock", "status": "HEALTHY", "version": "1.22.0"}]})
+                elif path == "/v1/schema":
+                    with mock.lock:
+                        self.reply(200, {"classes": list(mock.classes.values())})
+                elif path.startswith("/v1/schema/"):
+                    class_obj = mock.classes.get(path.split("/")[3])
+                    if class_obj:
+                        self.reply(200, class_obj)
+                    else:
+                        self.reply(404)
+                else:
+                    self.reply(404, {"error": [{"message": f"mock: no route GET {path}"}]})
+
+            def do_POST(self):
+                path = self.begin()
+                body = self.read_json()
+                if path == "/v1/schema":
+                    if mock.create_class(body):
+                        self.reply(200, body)
+                    else:
+                        self.reply(422, {"error": [{"message": f"class {body['class']} already exists"}]})
+                elif path == "/v1/objects":
+                    self.reply(200, mock.put_objects([body])[0])
+                elif path == "/v1/batch/objects":
+                    with mock.lock:
+                        mock.stats["batches"] += 1
+                    self.reply(200, mock.put_objects(body.get("objects", [])))
+                elif path == "/v1/graphql":
+                    with mock.lock:
+                        mock.stats["queries"] += 1
+                    self.reply(200, mock.graphql(body.get("query", "")))
+                else:
+                    self.reply(404, {"error": [{"message": f"mock: no route POST {path}"}]})
+
+        return Handler
+
+    def start(self, host="127.0.0.1", port=0):
+        """Serve on a background thread; returns the base URL"""
+        self.server = MockHTTPServer((host, port), self.handler_class())
+        self.thread = threading.Thread(target=self.server.serve_forever, name="mock-weaviate", daemon=True)
+        self.thread.start()
+        return f"http://{host}:{self.server.server_address[1]}"
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+def main():
+    parser = argparse.ArgumentParser(description="In-process Weaviate stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--object-ms", type=float, default=0)
+    parser.add_argument("--query-ms", type=float, default=0)
+    args = parser.parse_args()
+
+    mock = MockWeaviate(args.latency_ms, args.object_ms, args.query_ms)
+    print(f"Mock Weaviate listening on {mock.start(args.host, args.port)}")
+    try:
+        mock.thread.join()
+    except KeyboardInterrupt:
+        mock.stop()
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,76 @@
+# backend/vector/weaviate_client.py
+#
+# Weaviate access for the CompanyData class. Chunks are imported through
+# the client's batch API - dynamically sized batches sent by several worker
+# threads - instead of one HTTP round-trip per object, and semantic_search
+# has an async twin that posts the same GraphQL query over a pooled httpx
+# connection so concurrent requests reuse keep-alive sockets.
+#
+# The server is WEAVIATE_URL (default http://localhost:8080). For local
+# benchmarks without Docker, backend/vector/mock_server.py serves the small
+# part of the REST/GraphQL API used here.
+
+import asyncio
+import json
+import logging
 import os
+import threading
 from dotenv import load_dotenv
 import weaviate
+from weaviate.util import generate_uuid5
+
+try:
+    from ..logs import get_logger, log
+except ImportError:
+    from logs import get_logger, log
 
 load_dotenv()
 
-# Connect to Weaviate using the older API that's compatible
-client = weaviate.Client(
-    url="http://localhost:8080",
-    additional_headers={
-        "X-OpenAI-Api-Key": os.getenv("OPENAI_API_KEY")
-    }
-)
+WEAVIATE_URL = os.getenv("WEAVIATE_URL", "http://localhost:8080").rstrip("/")
+CLASS_NAME = "CompanyData"
+
+# Starting batch size; with dynamic sizing the client grows or shrinks it
+# from how long each batch takes to create
+WEAVIATE_BATCH_SIZE = int(os.getenv("WEAVIATE_BATCH_SIZE", "100"))
+WEAVIATE_BATCH_DYNAMIC = os.getenv("WEAVIATE_BATCH_DYNAMIC", "true").lower() == "true"
+WEAVIATE_BATCH_WORKERS = int(os.getenv("WEAVIATE_BATCH_WORKERS", "4"))
+# Keep-alive connections held by the async query client
+WEAVIATE_MAX_CONNECTIONS = int(os.getenv("WEAVIATE_MAX_CONNECTIONS", "20"))
+WEAVIATE_TIMEOUT = float(os.getenv("WEAVIATE_TIMEOUT", "30"))
+
+logger = get_logger("weaviate")
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+# client.batch is shared state on the client, so one import at a time
+_batch_lock = threading.Lock()
+
+_async_client = None
+_async_client_key = None
+
+def _headers():
+    api_key = os.getenv("OPENAI_API_KEY")
+    return {"X-OpenAI-Api-Key": api_key} if api_key else {}
+
+def get_client():
+    """Weaviate client for this process, connected on first use"""
+    global _client, _client_pid
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            _client = weaviate.Client(
+                url=WEAVIATE_URL,
+                additional_headers=_headers(),
+                timeout_config=(5, WEAVIATE_TIMEOUT)
+            )
+            _client_pid = os.getpid()
+        return _client
 
 def create_schema():
-    class_name = "CompanyData"
-    if not client.schema.exists(class_name):
+    client = get_client()
+    if not client.schema.exists(CLASS_NAME):
         class_obj = {
-            "class": class_name,
+            "class": CLASS_NAME,
             "properties": [
                 {"name": "content", "dataType": ["text"]},
                 {"name": "source", "dataType": ["text"]},
@@ -26,20 +80,97 @@ def create_schema():
         }
         client.schema.create_class(class_obj)
 
+def chunk_uuid(filename, index, chunk):
+    """Deterministic id, so re-importing a file overwrites instead of duplicating"""
+    return generate_uuid5({"filename": filename, "index": index, "content": chunk}, CLASS_NAME)
+
+def _collect_errors(results, errors):
+    """Batch callback: keep the per-object errors Weaviate reports"""
+    for result in results or []:
+        object_errors = result.get("result", {}).get("errors")
+        if object_errors:
+            errors.append({"id": result.get("id"), "errors": object_errors.get("error", object_errors)})
+
 def insert_document_chunks(chunks, filename):
-    for chunk in chunks:
-        client.data_object.create(
-            data_object={
-                "content": chunk,
-                "source": "upload",
-                "filename": filename
-            },
-            class_name="CompanyData"
+    """Import chunks with the batch API; returns the number stored"""
+    client = get_client()
+    errors = []
+    with _batch_lock:
+        # The previous import's `with` shut the executor down; configure
+        # flushes through it when the worker count changes
+        client.batch.start()
+        client.batch.configure(
+            batch_size=WEAVIATE_BATCH_SIZE,
+            dynamic=WEAVIATE_BATCH_DYNAMIC,
+            num_workers=WEAVIATE_BATCH_WORKERS,
+            timeout_retries=3,
+            connection_error_retries=3,
+            callback=lambda results: _collect_errors(results, errors)
         )
+        with client.batch as batch:
+            for index, chunk in enumerate(chunks):
+                batch.add_data_object(
+                    data_object={
+                        "content": chunk,
+                        "source": "upload",
+                        "filename": filename
+                    },
+                    class_name=CLASS_NAME,
+                    uuid=chunk_uuid(filename, index, chunk)
+                )
+
+    if errors:
+        log(logger, logging.ERROR, "Weaviate batch import errors", filename=filename,
+            failed=len(errors), first_error=str(errors[0]["errors"])[:200])
+    log(logger, logging.INFO, "Imported chunks into Weaviate", filename=filename,
+        chunks=len(chunks), failed=len(errors))
+    return len(chunks) - len(errors)
+
+def _hits(result):
+    if result.get("errors"):
+        raise RuntimeError(f"Weaviate query failed: {result['errors']}")
+    return [{"content": obj["content"], "filename": obj["filename"]} for obj in result["data"]["Get"][CLASS_NAME]]
 
 def semantic_search(query, top_k=5):
-    result = client.query.get("CompanyData", ["content", "filename"]).with_near_text({
+    result = get_client().query.get(CLASS_NAME, ["content", "filename"]).with_near_text({
         "concepts": [query]
     }).with_limit(top_k).do()
-    
-    return [{"content": obj["content"], "filename": obj["filename"]} for obj in result["data"]["Get"]["CompanyData"]]
+
+    return _hits(result)
+
+# ---- async query path ----
+
+def near_text_query(query, top_k=5):
+    """The GraphQL document semantic_search sends, built without a client"""
+    return f"{{Get{{{CLASS_NAME}(limit: {int(top_k)} nearText: {{concepts: [{json.dumps(query)}]}}){{content filename}}}}}}"
+
+def get_async_client():
+    """httpx.AsyncClient shared by every query on the running event loop"""
+    global _async_client, _async_client_key
+    import httpx
+
+    # An AsyncClient's connections belong to the loop that opened them
+    key = (os.getpid(), id(asyncio.get_running_loop()))
+    if _async_client is None or _async_client_key != key:
+        _async_client = httpx.AsyncClient(
+            base_url=WEAVIATE_URL,
+            headers=_headers(),
+            timeout=WEAVIATE_TIMEOUT,
+            limits=httpx.Limits(max_connections=WEAVIATE_MAX_CONNECTIONS,
+                                max_keepalive_connections=WEAVIATE_MAX_CONNECTIONS)
+        )
+        _async_client_key = key
+    return _async_client
+
+async def async_semantic_search(query, top_k=5):
+    """semantic_search without blocking the event loop"""
+    response = await get_async_client().post("/v1/graphql", json={"query": near_text_query(query, top_k)})
+    response.raise_for_status()
+    return _hits(response.json())
+
+async def close_async_client():
+    global _async_client, _async_client_key
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+        _async_client_key = None
@@ -0,0 +1,129 @@
+# backend/worker_metrics.py
+#
+# In-process counters (latency histograms, intent counts, /ask coalescing,
+# FAQ hits) shared between worker processes. Every METRICS_FLUSH_SECONDS a
+# background thread in each worker writes the cumulative state of every
+# registered source as one JSON row per (worker, source) into the
+# worker_metrics table of documents.db, replacing its previous row. report()
+# flushes the calling worker first and returns the rows of every worker seen
+# within METRICS_RETENTION_SECONDS; the endpoints merge them, so a report
+# covers the whole server no matter which worker answers.
+#
+# Workers are identified by pid plus a random suffix, so a restarted worker
+# that reuses a pid doesn't overwrite the counts of the one before it.
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List
+
+try:
+    from .shared_state import connect
+    from .logs import get_logger, log
+except ImportError:
+    from shared_state import connect
+    from logs import get_logger, log
+
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+# Rows of workers that stopped flushing longer ago than this are dropped
+METRICS_RETENTION_SECONDS = float(os.getenv("METRICS_RETENTION_SECONDS", str(24 * 3600)))
+
+logger = get_logger("metrics")
+
+def create_metrics_table(cursor):
+    """Create the per-worker metrics table (caller commits)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS worker_metrics (
+            worker_id TEXT NOT NULL,
+            source TEXT NOT NULL,
+            pid INTEGER NOT NULL,
+            state TEXT NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (worker_id, source)
+        )
+    ''')
+
+class WorkerMetrics:
+    """Periodic flush of registered sources and a merged read across workers"""
+
+    def __init__(self, db_path: str = "documents.db"):
+        self.db_path = db_path
+        self._sources: Dict[str, Callable[[], Any]] = {}
+        self._ready = False
+        self._worker_id = None
+        self._worker_pid = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def worker_id(self) -> str:
+        # A forked worker must not keep its parent's id
+        if self._worker_pid != os.getpid():
+            self._worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+            self._worker_pid = os.getpid()
+        return self._worker_id
+
+    def register(self, source: str, export: Callable[[], Any]):
+        """export() returns the JSON-able cumulative state of this worker"""
+        self._sources[source] = export
+
+    def _connect(self):
+        conn = connect(self.db_path)
+        if not self._ready:
+            create_metrics_table(conn.cursor())
+            conn.commit()
+            self._ready = True
+        return conn
+
+    def flush(self):
+        """Write this worker's current state of every source"""
+        now = time.time()
+        rows = [(self.worker_id, source, os.getpid(), json.dumps(export()), now)
+                for source, export in self._sources.items()]
+        with self._lock:
+            conn = self._connect()
+            try:
+                conn.executemany('''
+                    INSERT OR REPLACE INTO worker_metrics (worker_id, source, pid, state, updated_at)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', rows)
+                conn.execute('DELETE FROM worker_metrics WHERE updated_at < ?', (now - METRICS_RETENTION_SECONDS,))
+                conn.commit()
+            finally:
+                conn.close()
+
+    def report(self, sources: List[str]) -> Dict[str, Any]:
+        """{"workers": [pid, ...], source: [state of every worker, ...]}, this worker freshly flushed"""
+        self.flush()
+        conn = self._connect()
+        try:
+            rows = conn.execute('SELECT pid, source, state FROM worker_metrics WHERE updated_at >= ?',
+                                (time.time() - METRICS_RETENTION_SECONDS,)).fetchall()
+        finally:
+            conn.close()
+        report: Dict[str, Any] = {source: [] for source in sources}
+        report["workers"] = sorted({pid for pid, _, _ in rows})
+        for _, source, state in rows:
+            if source in report and source != "workers":
+                report[source].append(json.loads(state))
+        return report
+
+    def start(self):
+        """Start this worker's flush thread (once per process)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="worker-metrics", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(METRICS_FLUSH_SECONDS)
+            try:
+                self.flush()
+            except Exception as e:
+                log(logger, logging.WARNING, "Metrics flush failed", error=str(e))
+
+worker_metrics = WorkerMetrics()
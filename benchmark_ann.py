@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+ANN Index Benchmark
+===================
+Recall vs. queries/sec for the IVF index in backend/ann_index.py on a
+synthetic clustered corpus (100k unit vectors by default), against exact
+brute-force search.
+
+The corpus is inserted in --batches uploads, the same way documents arrive,
+so the numbers include segment merges and k-means retraining. One batch is
+then deleted (tombstoned) before querying. For each nprobe the benchmark
+reports recall@k against the exact top-k over the live vectors, plus
+queries/sec and p50/p99 latency.
+
+Usage:
+    python benchmark_ann.py [--vectors 100000] [--dim 256] [--queries 200] [--top-k 10]
+                            [--nprobe 1,2,4,8,16,32,64] [--batches 20] [--output FILE]
+"""
+
+import os
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import argparse
+import json
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append('.')
+
+import numpy as np
+
+from backend.ann_index import ANNIndex, normalize
+
+class VectorOnlyProvider:
+    """The index only needs an embedding model name when vectors are passed in"""
+    embedding_model = "synthetic"
+
+def make_corpus(count, dim, clusters, seed=3):
+    rng = np.random.default_rng(seed)
+    centers = normalize(rng.standard_normal((clusters, dim)))
+    labels = rng.integers(0, clusters, count)
+    # Noise of norm ~0.7 around each center: clusters overlap like topics do
+    return normalize(centers[labels] + 0.7 * rng.standard_normal((count, dim)) / np.sqrt(dim))
+
+def make_queries(corpus, count, seed=5):
+    rng = np.random.default_rng(seed)
+    picks = corpus[rng.choice(len(corpus), count, replace=False)]
+    return normalize(picks + 0.3 * rng.standard_normal(picks.shape) / np.sqrt(corpus.shape[1]))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--nprobe", default="1,2,4,8,16,32,64")
+    parser.add_argument("--batches", type=int, default=20)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    print(f"Generating {args.vectors} x {args.dim} vectors ...")
+    corpus = make_corpus(args.vectors, args.dim, args.clusters)
+    queries = make_queries(corpus, args.queries)
+    report = {"config": vars(args)}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index = ANNIndex(db_path=os.path.join(tmp, "bench.db"), index_dir=os.path.join(tmp, "ann"),
+                         provider=VectorOnlyProvider())
+        batch_size = -(-args.vectors // args.batches)
+        start = time.perf_counter()
+        for batch, offset in enumerate(range(0, args.vectors, batch_size)):
+            rows = [(chunk_id, f"doc-{batch}.txt", "txt", "bench-user")
+                    for chunk_id in range(offset, min(offset + batch_size, args.vectors))]
+            index.insert(rows, corpus[offset:offset + len(rows)])
+        insert_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        index.remove_document("doc-0.txt")
+        delete_seconds = time.perf_counter() - start
+        nlist = len(index.centroids)
+        print(f"Inserted in {args.batches} batches: {insert_seconds:.1f}s ({args.vectors / insert_seconds:,.0f} vectors/s), "
+              f"{nlist} lists, {len(index.segments)} segment(s); delete of one batch {delete_seconds * 1000:.0f} ms")
+        report["insert"] = {"seconds": round(insert_seconds, 2), "vectors_per_sec": round(args.vectors / insert_seconds),
+                            "lists": nlist, "segments": len(index.segments),
+                            "delete_ms": round(delete_seconds * 1000, 1)}
+
+        # Exact top-k over the live vectors
+        live = np.ones(args.vectors, dtype=bool)
+        live[:batch_size] = False
+        live_ids = np.flatnonzero(live)
+        live_corpus = corpus[live_ids]
+        truth = []
+        start = time.perf_counter()
+        for query in queries:
+            scores = live_corpus @ query
+            truth.append(set(live_ids[np.argpartition(-scores, args.top_k)[:args.top_k]].tolist()))
+        exact_qps = len(queries) / (time.perf_counter() - start)
+
+        print(f"\n{'nprobe':>8} {'recall@' + str(args.top_k):>10} {'q/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+        print(f"{'exact':>8} {1.0:>10.3f} {exact_qps:>9.1f}")
+        report["exact_qps"] = round(exact_qps, 1)
+        report["nprobe"] = []
+        for nprobe in [int(value) for value in args.nprobe.split(",")]:
+            latencies, hits = [], 0
+            for query, expected in zip(queries, truth):
+                start = time.perf_counter()
+                results = index.search_vector(query, top_k=args.top_k, user_id="bench-user",
+                                              nprobe=nprobe, min_similarity=-1.0)
+                latencies.append(time.perf_counter() - start)
+                hits += len(expected & {chunk_id for chunk_id, _, _, _ in results})
+            latencies.sort()
+            row = {
+                "nprobe": nprobe,
+                "recall": round(hits / (len(queries) * args.top_k), 4),
+                "qps": round(len(queries) / sum(latencies), 1),
+                "p50_ms": round(statistics.median(latencies) * 1000, 2),
+                "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2),
+            }
+            report["nprobe"].append(row)
+            print(f"{nprobe:>8} {row['recall']:>10.3f} {row['qps']:>9.1f} {row['p50_ms']:>8} {row['p99_ms']:>8}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+
+if __name__ == "__main__":
+    main()
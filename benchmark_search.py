@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Search Benchmark
+================
+Compares the legacy word-matching scorer in QAEngine.search_chunks with the
+sparse term-chunk matrix on a synthetic corpus (100k chunks by default).
+
+Usage:
+    python benchmark_search.py [--chunks 100000] [--queries 20] [--legacy-queries 3]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append('.')
+
+from backend.database import DocumentDatabase
+from backend.qa_engine import QAEngine
+from backend.sparse_index import SparseIndex
+
+DOMAIN_WORDS = [
+    "hammer", "forging", "billet", "furnace", "heating", "temperature", "die", "press",
+    "trim", "coining", "induction", "inspection", "safety", "gloves", "helmet", "operator",
+    "instruction", "procedure", "calibration", "traceability", "heat", "code", "supplier",
+    "punching", "route", "card", "cutting", "band", "saw", "setting", "tool", "quality",
+]
+
+QUESTIONS = [
+    "what is the first step for 2T hammer operation",
+    "billet heating temperature for induction furnace",
+    "safety gloves and helmet requirements",
+    "trim press operating procedure",
+    "calibration of heating furnaces",
+    "die setting instruction for tool room",
+    "heat code traceability for supplier billets",
+    "coining inspection quality check",
+]
+
+def build_corpus(db_path, num_chunks, words_per_chunk=150, chunks_per_doc=50, seed=7):
+    """Fill a fresh SQLite database with synthetic WI-like chunks"""
+    rng = random.Random(seed)
+    filler = [f"w{i:05d}" for i in range(20000)]
+    DocumentDatabase(db_path)._connect().close()
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    for doc_index in range(0, num_chunks, chunks_per_doc):
+        filename = f"synthetic-WI-{doc_index // chunks_per_doc:05d}.pdf"
+        cursor.execute('''
+            INSERT INTO documents (filename, file_path, file_size, file_type, user_id)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (filename, f"/uploads/{filename}", 0, "pdf", "bench-user"))
+        document_id = cursor.lastrowid
+        rows = []
+        for chunk_index in range(min(chunks_per_doc, num_chunks - doc_index)):
+            words = [
+                rng.choice(DOMAIN_WORDS) if rng.random() < 0.15 else rng.choice(filler)
+                for _ in range(words_per_chunk)
+            ]
+            content = f"FILE: {filename}\nTYPE: pdf\nSECTION:\n" + " ".join(words)
+            rows.append((document_id, chunk_index, content, len(content)))
+        cursor.executemany('''
+            INSERT INTO document_chunks (document_id, chunk_id, content, chunk_size)
+            VALUES (?, ?, ?, ?)
+        ''', rows)
+
+    conn.commit()
+    conn.close()
+
+def time_queries(search, questions):
+    timings = []
+    for question in questions:
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            search(question)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def summarize(name, timings):
+    timings = sorted(timings)
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(f"{name:<22} n={len(timings):<4} mean={statistics.mean(timings) * 1000:9.1f} ms  "
+          f"p50={statistics.median(timings) * 1000:9.1f} ms  p95={p95 * 1000:9.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--legacy-queries", type=int, default=3)
+    parser.add_argument("--top-k", type=int, default=100)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="whf_bench_")
+    db_path = os.path.join(work_dir, "documents.db")
+    index_dir = os.path.join(work_dir, "index")
+
+    print(f"🏗️  Building synthetic corpus of {args.chunks} chunks in {work_dir}")
+    start = time.perf_counter()
+    build_corpus(db_path, args.chunks)
+    print(f"   corpus ready in {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    index = SparseIndex(db_path=db_path, index_dir=index_dir)
+    with contextlib.redirect_stdout(io.StringIO()):
+        index.build_from_database()
+    print(f"   sparse index built in {time.perf_counter() - start:.1f}s "
+          f"({len(index.terms)} terms, {len(index.indices)} non-zeros)")
+
+    start = time.perf_counter()
+    reloaded = SparseIndex(db_path=db_path, index_dir=index_dir)
+    reloaded.load()
+    print(f"   memory-mapped reload in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    engine = QAEngine()
+    engine.db_path = db_path
+    engine._sparse_index = reloaded
+
+    questions = [QUESTIONS[i % len(QUESTIONS)] for i in range(args.queries)]
+
+    print("\n📊 Results")
+    engine.search_mode = "legacy"
+    summarize("legacy search_chunks", time_queries(
+        lambda q: engine.search_chunks(q, top_k=args.top_k, user_id="bench-user"),
+        questions[:args.legacy_queries]
+    ))
+    engine.search_mode = "sparse"
+    summarize("sparse search_chunks", time_queries(
+        lambda q: engine.search_chunks(q, top_k=args.top_k, user_id="bench-user"),
+        questions
+    ))
+    summarize("sparse scoring only", time_queries(
+        lambda q: reloaded.search(q, top_k=args.top_k, user_id="bench-user"),
+        questions
+    ))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Retrieval / Ingestion Benchmark Suite
+=====================================
+Reproducible numbers to compare across commits, with the LLM stubbed out:
+
+  - ingest: every PDF in data/uploads through QAEngine.process_file into a
+    scratch database (pages/sec, chunks, peak RSS)
+  - quality: recall@k of the retrieved files against a small labeled set of
+    questions about the work instructions, legacy and sparse search
+  - scale: synthetic corpora (1k -> 100k chunks by default) with query
+    p50/p99, sparse index build time and peak RSS
+  - answer: end-to-end QAEngine.get_answer latency with the fake LLM
+    provider set to answer instantly
+
+Results are written as JSON (default bench_results/<commit>-<time>.json);
+pass --compare to print the change against an earlier run.
+
+Usage:
+    python benchmark_suite.py [--uploads data/uploads] [--sizes 1000,10000,100000]
+                              [--queries 20] [--top-k 10] [--legacy-max-chunks 10000]
+                              [--skip-uploads] [--output FILE] [--compare OLD.json]
+"""
+
+import os
+
+# Keep QAEngine quiet and make sure nothing reaches OpenAI: the fake
+# provider answers instantly, so answer latency is all ours
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ["OPENAI_API_KEY"] = ""
+os.environ["LLM_PROVIDER"] = "fake"
+os.environ["FAKE_LLM_LATENCY_MS"] = "0"
+os.environ["FAKE_LLM_TOKENS_PER_SECOND"] = "0"
+os.environ["FAKE_LLM_FAILURE_RATE"] = "0"
+# Ingest numbers shouldn't include background FAQ generation
+os.environ["FAQ_PRECOMPUTE"] = "false"
+
+import argparse
+import asyncio
+import contextlib
+import glob
+import io
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.append('.')
+
+from backend.database import DocumentDatabase
+from backend.qa_engine import QAEngine
+from backend.sparse_index import SparseIndex
+from benchmark_search import build_corpus, QUESTIONS as SYNTHETIC_QUESTIONS
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Questions about the WIs in data/uploads, labeled with the WI codes (file
+# name fragments) a good retriever should return in its top-k files
+LABELED_QUESTIONS = [
+    ("What are the steps for operating the trim press?", ["WI-PR-08"]),
+    ("How do I operate the 2T and 3T hammer?", ["WI-PR-06"]),
+    ("Work instruction for the 1T close die belt drop hammer", ["WI-PR-07"]),
+    ("What is the procedure for coining?", ["WI-PR-05"]),
+    ("How is the induction billet heater started?", ["WI-PR-11", "WI-PR-15", "WI-PR-17", "WI-PR-27"]),
+    ("Show the flow chart for billet heating", ["WI-PR-12"]),
+    ("How does the continuous pusher type furnace work?", ["WI-PR-13"]),
+    ("How are heating furnaces calibrated?", ["WI-PR-20"]),
+    ("How is identification and traceability maintained?", ["WI-PR-19"]),
+    ("Explain the heat code system for CDF", ["WI-PR-04"]),
+    ("What is the tool and die setting procedure?", ["WI-PR-25"]),
+    ("Operating instructions for the 8T hammer", ["WI-PR-26"]),
+    ("IBH 450KVA operation", ["WI-PR-15"]),
+    ("IBH 350KVA operation", ["WI-PR-17"]),
+    ("Press operation work instruction", ["WI-PR-16"]),
+    ("How to use cutting machines and band saws", ["WI-PR-02"]),
+    ("Heat treatment process for CDF", ["IWP-HT-02"]),
+    ("Heating of special purpose steel forgings", ["WI-PR-14"]),
+]
+
+def quiet():
+    return contextlib.redirect_stdout(io.StringIO())
+
+def percentile(values, percent):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, int(round(percent / 100 * len(values) + 0.5)) - 1))
+    return values[index]
+
+def latency_summary(timings):
+    return {
+        "n": len(timings),
+        "p50_ms": round(statistics.median(timings) * 1000, 2) if timings else 0,
+        "p99_ms": round(percentile(timings, 99) * 1000, 2),
+        "mean_ms": round(statistics.mean(timings) * 1000, 2) if timings else 0,
+    }
+
+def max_rss_mb():
+    """Peak resident set size of this process so far in MB (None on Windows)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def make_engine(db_path, index_dir, mode):
+    engine = QAEngine()
+    engine.db_path = db_path
+    engine.search_mode = mode
+    engine._sparse_index = SparseIndex(db_path=db_path, index_dir=index_dir)
+    return engine
+
+def time_search(engine, questions, top_k, user_id=None):
+    timings = []
+    for question in questions:
+        start = time.perf_counter()
+        with quiet():
+            engine.search_chunks(question, top_k=top_k, user_id=user_id)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def recall_at_k(engine, top_k):
+    """Mean share of labeled WI codes found among the top-k distinct files"""
+    per_question = []
+    for question, expected in LABELED_QUESTIONS:
+        with quiet():
+            chunks = engine.search_chunks(question, top_k=200)
+        files = []
+        for chunk in chunks:
+            if chunk["filename"] not in files:
+                files.append(chunk["filename"])
+        top_files = files[:top_k]
+        found = sum(1 for code in expected if any(code in filename for filename in top_files))
+        per_question.append(found / len(expected))
+    return round(statistics.mean(per_question), 3)
+
+def bench_uploads(uploads_dir, work_dir, top_k, queries):
+    """Ingest the real PDFs, then measure recall and search latency on them"""
+    import fitz
+
+    pdfs = sorted(glob.glob(os.path.join(uploads_dir, "*.pdf")))
+    if not pdfs:
+        print(f"⚠️  No PDFs found in {uploads_dir}")
+        return None
+
+    db_path = os.path.join(work_dir, "uploads.db")
+    index_dir = os.path.join(work_dir, "uploads_index")
+    DocumentDatabase(db_path)._connect().close()
+    engine = make_engine(db_path, index_dir, "legacy")
+
+    pages = 0
+    for path in pdfs:
+        with fitz.open(path) as doc:
+            pages += doc.page_count
+
+    result = {"files": len(pdfs), "pages": pages}
+    print(f"📄 Ingesting {len(pdfs)} PDFs ({pages} pages) from {uploads_dir}")
+    start = time.perf_counter()
+    failed = 0
+    for path in pdfs:
+        with quiet():
+            if not asyncio.run(engine.process_file(path, os.path.basename(path))):
+                failed += 1
+    elapsed = time.perf_counter() - start
+    result["max_rss_mb_after_ingest"] = max_rss_mb()
+
+    conn = DocumentDatabase(db_path)._connect()
+    result["chunks"] = conn.execute("SELECT COUNT(*) FROM document_chunks").fetchone()[0]
+    conn.close()
+    result.update({
+        "failed_files": failed,
+        "ingest_seconds": round(elapsed, 2),
+        "pages_per_second": round(pages / elapsed, 2) if elapsed else 0,
+    })
+    print(f"   {result['pages_per_second']} pages/s, {result['chunks']} chunks")
+
+    questions = [q for q, _ in LABELED_QUESTIONS][:queries]
+    for mode in ("legacy", "sparse"):
+        engine.search_mode = mode
+        if mode == "sparse":
+            start = time.perf_counter()
+            with quiet():
+                engine.sparse_index.build_from_database()
+            result["sparse_build_seconds"] = round(time.perf_counter() - start, 3)
+        result[f"{mode}_recall_at_{top_k}"] = recall_at_k(engine, top_k)
+        result[f"{mode}_search"] = latency_summary(time_search(engine, questions, 100))
+        print(f"   {mode:<6} recall@{top_k}={result[f'{mode}_recall_at_{top_k}']}  "
+              f"p50={result[f'{mode}_search']['p50_ms']} ms  p99={result[f'{mode}_search']['p99_ms']} ms")
+
+    # End-to-end answer latency with the instant fake LLM
+    timings = []
+    for question in questions:
+        start = time.perf_counter()
+        with quiet():
+            asyncio.run(engine.get_answer(question))
+        timings.append(time.perf_counter() - start)
+    result["answer_stub_llm"] = latency_summary(timings)
+    result["max_rss_mb"] = max_rss_mb()
+    return result
+
+def bench_synthetic(size, work_dir, queries, legacy_max_chunks):
+    """Build a synthetic corpus of `size` chunks and time both search paths"""
+    db_path = os.path.join(work_dir, f"synthetic-{size}.db")
+    index_dir = os.path.join(work_dir, f"synthetic-{size}-index")
+    print(f"🏗️  Synthetic corpus: {size} chunks")
+
+    result = {"chunks": size}
+    start = time.perf_counter()
+    build_corpus(db_path, size)
+    result["corpus_build_seconds"] = round(time.perf_counter() - start, 2)
+
+    engine = make_engine(db_path, index_dir, "sparse")
+    start = time.perf_counter()
+    with quiet():
+        engine.sparse_index.build_from_database()
+    result["sparse_build_seconds"] = round(time.perf_counter() - start, 3)
+    result["sparse_terms"] = len(engine.sparse_index.terms)
+
+    questions = [SYNTHETIC_QUESTIONS[i % len(SYNTHETIC_QUESTIONS)] for i in range(queries)]
+    result["sparse_search"] = latency_summary(time_search(engine, questions, 100, "bench-user"))
+
+    if size <= legacy_max_chunks:
+        engine.search_mode = "legacy"
+        result["legacy_search"] = latency_summary(
+            time_search(engine, questions[:max(3, queries // 4)], 100, "bench-user")
+        )
+    # ru_maxrss only grows, so run sizes in increasing order to read it per corpus
+    result["max_rss_mb"] = max_rss_mb()
+
+    line = f"   sparse p50={result['sparse_search']['p50_ms']} ms p99={result['sparse_search']['p99_ms']} ms"
+    if "legacy_search" in result:
+        line += f" | legacy p50={result['legacy_search']['p50_ms']} ms"
+    print(line + f" | peak RSS {result['max_rss_mb']} MB")
+    return result
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+def compare(old, new, path=""):
+    """Print numeric fields that changed between two result files"""
+    for key, value in new.items():
+        old_value = old.get(key) if isinstance(old, dict) else None
+        label = f"{path}.{key}" if path else key
+        if isinstance(value, dict) and isinstance(old_value, dict):
+            compare(old_value, value, label)
+        elif isinstance(value, list) and isinstance(old_value, list):
+            for index, (old_item, new_item) in enumerate(zip(old_value, value)):
+                if isinstance(new_item, dict):
+                    compare(old_item, new_item, f"{label}[{new_item.get('chunks', index)}]")
+        elif isinstance(value, (int, float)) and isinstance(old_value, (int, float)) and value != old_value:
+            change = f" ({(value - old_value) / old_value * 100:+.1f}%)" if old_value else ""
+            print(f"   {label:<48} {old_value:>12} -> {value:<12}{change}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uploads", default=os.path.join("data", "uploads"))
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--legacy-max-chunks", type=int, default=10000)
+    parser.add_argument("--skip-uploads", action="store_true")
+    parser.add_argument("--output")
+    parser.add_argument("--compare")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    work_dir = tempfile.mkdtemp(prefix="whf_suite_")
+    results = {
+        "commit": commit,
+        "timestamp": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": vars(args),
+        "uploads": None,
+        "synthetic": [],
+    }
+
+    if not args.skip_uploads:
+        results["uploads"] = bench_uploads(args.uploads, work_dir, args.top_k, args.queries)
+
+    for size in [int(size) for size in args.sizes.split(",") if size.strip()]:
+        results["synthetic"].append(bench_synthetic(size, work_dir, args.queries, args.legacy_max_chunks))
+
+    output = args.output or os.path.join(
+        "bench_results", f"{commit}-{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}.json"
+    )
+    if os.path.dirname(output):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\n💾 Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        print(f"\n📊 Changes since {previous.get('commit')} ({args.compare}):")
+        compare(previous, results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Weaviate Benchmark
+==================
+Measures chunk import and semantic query throughput through
+backend/vector/weaviate_client.py against the in-process mock server
+(backend/vector/mock_server.py), so no Docker or OpenAI key is needed.
+
+Import compares one data_object.create per chunk (the old path) with the
+batch API at 1 and --workers workers. Queries compare sequential
+semantic_search calls with async_semantic_search at --concurrency
+requests in flight over one pooled connection set.
+
+The mock adds --latency-ms to every request, --object-ms per object
+created and --query-ms per query. These stand in for the network
+round-trip and for vectorization.
+Pass --url to run against a real Weaviate instead of the mock.
+
+Usage:
+    python benchmark_weaviate.py [--chunks 2000] [--queries 200] [--workers 4]
+                                 [--concurrency 16] [--latency-ms 2] [--object-ms 0.05]
+                                 [--query-ms 20]
+                                 [--url http://localhost:8080] [--output FILE]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.append('.')
+
+from backend.vector.mock_server import MockWeaviate
+
+WORDS = [
+    "hammer", "forging", "billet", "furnace", "heating", "temperature", "die", "press",
+    "trim", "inspection", "safety", "operator", "procedure", "calibration", "quality",
+    "valve", "flange", "cladding", "coating", "machining", "hydrostatic", "testing",
+]
+
+def make_chunks(count, seed=7):
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(120)) for _ in range(count)]
+
+def make_queries(count, seed=11):
+    rng = random.Random(seed)
+    return [" ".join(rng.sample(WORDS, 3)) for _ in range(count)]
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency-ms", type=float, default=2)
+    parser.add_argument("--object-ms", type=float, default=0.05)
+    parser.add_argument("--query-ms", type=float, default=20)
+    parser.add_argument("--url", help="real Weaviate instead of the mock")
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    mock = None
+    if args.url:
+        os.environ["WEAVIATE_URL"] = args.url
+    else:
+        mock = MockWeaviate(args.latency_ms, args.object_ms, args.query_ms)
+        os.environ["WEAVIATE_URL"] = mock.start()
+    print(f"Weaviate at {os.environ['WEAVIATE_URL']}" + (" (mock)" if mock else ""))
+
+    # Reads WEAVIATE_URL at import
+    from backend.vector import weaviate_client as wc
+
+    wc.create_schema()
+    chunks = make_chunks(args.chunks)
+    client = wc.get_client()
+    report = {"config": vars(args), "import": {}, "query": {}}
+
+    def per_object():
+        for index, chunk in enumerate(chunks):
+            client.data_object.create(
+                data_object={"content": chunk, "source": "upload", "filename": "bench-single.txt"},
+                class_name=wc.CLASS_NAME,
+                uuid=wc.chunk_uuid("bench-single.txt", index, chunk)
+            )
+
+    runs = [("per-object create", per_object)]
+    for workers in sorted({1, args.workers}):
+        def batched(workers=workers):
+            wc.WEAVIATE_BATCH_WORKERS = workers
+            stored = wc.insert_document_chunks(chunks, f"bench-batch-{workers}.txt")
+            assert stored == len(chunks), f"only {stored} of {len(chunks)} chunks stored"
+        runs.append((f"batch, {workers} worker(s)", batched))
+
+    print(f"\nImporting {len(chunks)} chunks")
+    for name, run in runs:
+        seconds = timed(run)
+        report["import"][name] = {"seconds": round(seconds, 3), "chunks_per_sec": round(len(chunks) / seconds, 1)}
+        print(f"  {name:<22} {seconds:8.2f}s {len(chunks) / seconds:10.1f} chunks/s")
+
+    queries = make_queries(args.queries)
+
+    def sequential():
+        for query in queries:
+            wc.semantic_search(query, top_k=5)
+
+    async def concurrent():
+        limit = asyncio.Semaphore(args.concurrency)
+
+        async def one(query):
+            async with limit:
+                return await wc.async_semantic_search(query, top_k=5)
+
+        results = await asyncio.gather(*(one(query) for query in queries))
+        await wc.close_async_client()
+        return results
+
+    print(f"\nRunning {len(queries)} queries")
+    for name, run in [("sync, sequential", sequential),
+                      (f"async, {args.concurrency} in flight", lambda: asyncio.run(concurrent()))]:
+        seconds = timed(run)
+        report["query"][name] = {"seconds": round(seconds, 3), "qps": round(len(queries) / seconds, 1)}
+        print(f"  {name:<22} {seconds:8.2f}s {len(queries) / seconds:10.1f} q/s")
+
+    if mock:
+        report["mock_stats"] = dict(mock.stats)
+        print(f"\nMock server: {mock.stats}")
+        mock.stop()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Backend HTTP access shared by the Streamlit apps.
+
+One requests.Session per server process keeps connections to the backend
+alive and retries connection failures and 502/503/504 responses with
+backoff (idempotent methods only). Reads that every rerun repeats go through
+cached_get: responses are cached per endpoint and access token for the
+endpoint's TTL, and invalidate() drops an endpoint for this browser session
+after a write (upload, delete, ask) so the next rerun fetches fresh data.
+"""
+
+import os
+import time
+
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8000").rstrip("/")
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))
+
+# Seconds a cached GET is served before the backend is asked again
+CACHE_TTLS = {
+    "/health": 15,
+    "/documents": 120,
+    "/chat/sessions": 120,
+    "/analytics/stats": 60,
+    "/analytics/latency": 30,
+}
+DEFAULT_CACHE_TTL = 60
+
+class BackendError(Exception):
+    """Non-200 answer to a cached GET (raised so it is never cached)"""
+
+    def __init__(self, response):
+        super().__init__(f"{response.status_code}: {response.text[:200]}")
+        self.status_code = response.status_code
+
+@st.cache_resource
+def get_session():
+    """Keep-alive session shared by all reruns and browser sessions"""
+    retry = Retry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset({"GET", "HEAD", "OPTIONS", "DELETE"}),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def send(method, endpoint, token=None, timeout=120, **kwargs):
+    """One request over the shared session; Authorization is per call, never stored on it"""
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    return get_session().request(method, f"{BACKEND_URL}{endpoint}", headers=headers, timeout=timeout, **kwargs)
+
+def _path(endpoint):
+    return endpoint.split("?", 1)[0]
+
+def _generation(endpoint):
+    return st.session_state.get("api_cache_generations", {}).get(_path(endpoint), 0)
+
+def invalidate(*endpoints):
+    """Make the next cached_get of these endpoints go to the backend"""
+    generations = st.session_state.setdefault("api_cache_generations", {})
+    for endpoint in endpoints:
+        generations[_path(endpoint)] = generations.get(_path(endpoint), 0) + 1
+
+@st.cache_data(ttl=max(CACHE_TTLS.values()), max_entries=512, show_spinner=False)
+def _get_json(endpoint, token, generation, window, timeout):
+    # generation and window only key the cache: a bump or a new TTL window is a miss
+    response = send("GET", endpoint, token, timeout=timeout)
+    if response.status_code != 200:
+        raise BackendError(response)
+    return response.json()
+
+def cached_get(endpoint, token=None, timeout=30):
+    """Parsed JSON of a GET, cached per endpoint and token for its TTL"""
+    ttl = CACHE_TTLS.get(_path(endpoint), DEFAULT_CACHE_TTL)
+    return _get_json(endpoint, token, _generation(endpoint), int(time.time() // ttl), timeout)
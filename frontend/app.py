@@ -1,5 +1,4 @@
 import streamlit as st
-import requests
 import time
 from datetime import datetime
 import speech_recognition as sr
@@ -9,6 +8,8 @@ import numpy as np
 import tempfile
 import os
 
+from api_client import BackendError, cached_get, invalidate, send
+
 # Import avatar functionality
 try:
     from avatar import show_avatar, update_avatar_state
@@ -63,7 +64,8 @@ def speech_to_text(audio_file):
 def get_ai_assistant_response(prompt):
     """Get AI assistant response with voice-like characteristics"""
     try:
-        response = requests.post("http://localhost:8000/ask/", json={"question": prompt})
+        response = send("POST", "/ask/", json={"question": prompt})
+        invalidate("/analytics/stats", "/analytics/latency")
         if response.status_code == 200:
             answer = response.json()['answer']
             
@@ -436,7 +438,7 @@ with st.sidebar:
         with st.spinner("Uploading files..."):
             for uploaded_file in uploaded_files:
                 try:
-                    res = requests.post("http://localhost:8000/upload/", files={"file": uploaded_file})
+                    res = send("POST", "/upload/", files={"file": uploaded_file})
                     if res.status_code == 200:
                         st.success(f"✅ {uploaded_file.name}")
                     else:
@@ -445,28 +447,28 @@ with st.sidebar:
                     st.error(f"❌ {uploaded_file.name}: {str(e)}")
             
             # Refresh the page to show updated documents
+            invalidate("/documents", "/health")
             st.rerun()
     
     # Show uploaded files from database
     try:
-        documents_response = requests.get("http://localhost:8000/documents")
-        if documents_response.status_code == 200:
-            documents = documents_response.json()["documents"]
-            if documents:
-                st.markdown("---")
-                st.subheader("📚 Stored Documents")
-                for doc in documents:
-                    st.write(f"📄 {doc['filename']} ({doc['file_size']} bytes)")
-                    st.caption(f"Uploaded: {doc['upload_time']}")
-                
-                # Clear all documents button
-                if st.button("🗑️ Clear All Documents"):
-                    clear_response = requests.delete("http://localhost:8000/documents")
-                    if clear_response.status_code == 200:
-                        st.success("All documents cleared!")
-                        st.rerun()
-                    else:
-                        st.error("Failed to clear documents")
+        documents = cached_get("/documents")["documents"]
+        if documents:
+            st.markdown("---")
+            st.subheader("📚 Stored Documents")
+            for doc in documents:
+                st.write(f"📄 {doc['filename']} ({doc['file_size']} bytes)")
+                st.caption(f"Uploaded: {doc['upload_time']}")
+            
+            # Clear all documents button
+            if st.button("🗑️ Clear All Documents"):
+                clear_response = send("DELETE", "/documents")
+                if clear_response.status_code == 200:
+                    st.success("All documents cleared!")
+                    invalidate("/documents", "/health")
+                    st.rerun()
+                else:
+                    st.error("Failed to clear documents")
     except:
         st.info("📚 No documents stored yet")
     
@@ -474,18 +476,16 @@ with st.sidebar:
     st.markdown("---")
     st.subheader("🔧 Backend Status")
     try:
-        health_response = requests.get("http://localhost:8000/health")
-        if health_response.status_code == 200:
-            health_data = health_response.json()
-            st.success(f"✅ Backend Online")
-            st.info(f"📄 Documents: {health_data.get('documents_count', 0)}")
-            if 'chunks_count' in health_data:
-                st.info(f"📝 Chunks: {health_data['chunks_count']}")
-            if 'qa_available' in health_data:
-                qa_status = "✅ Available" if health_data['qa_available'] else "❌ Not Available"
-                st.info(f"🤖 AI Engine: {qa_status}")
-        else:
-            st.error("❌ Backend Error")
+        health_data = cached_get("/health")
+        st.success(f"✅ Backend Online")
+        st.info(f"📄 Documents: {health_data.get('documents_count', 0)}")
+        if 'chunks_count' in health_data:
+            st.info(f"📝 Chunks: {health_data['chunks_count']}")
+        if 'qa_available' in health_data:
+            qa_status = "✅ Available" if health_data['qa_available'] else "❌ Not Available"
+            st.info(f"🤖 AI Engine: {qa_status}")
+    except BackendError:
+        st.error("❌ Backend Error")
     except:
         st.error("❌ Backend Offline")
     
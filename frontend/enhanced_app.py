@@ -7,6 +7,8 @@ import json
 import base64
 import tempfile
 
+from api_client import BackendError, cached_get, invalidate, send
+
 # Page configuration
 st.set_page_config(
     page_title="WESTERN HEAT & FORGE AI Assistant & Knowledge Hub",
@@ -24,10 +26,12 @@ def initialize_session_state():
         "current_chat_id": None,
         "user": None,
         "auth_token": None,
+        "refresh_token": None,
         "chat_history": [],
         "uploaded_files": [],
         "current_page": "login",
-        "sessions_loaded": False
+        "sessions_loaded": False,
+        "saved_chats": {}
     }
     
     for key, default_value in defaults.items():
@@ -41,9 +45,10 @@ initialize_session_state()
 def check_backend_connection():
     """Check if backend is accessible with proper error handling"""
     try:
-        response = requests.get("http://localhost:8000/health", timeout=5)
-        return response.status_code == 200
-    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.RequestException):
+        # Cached for a few seconds so reruns don't each ping the backend
+        cached_get("/health", timeout=5)
+        return True
+    except (BackendError, requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.RequestException):
         return False
     except Exception:
         return False
@@ -150,22 +155,36 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # API request helper with comprehensive error handling
+def send_request(method, endpoint, data=None, files=None):
+    """Send one request with the current access token"""
+    token = st.session_state.auth_token
+    if method == "POST":
+        if files:
+            return send("POST", endpoint, token, files=files)
+        return send("POST", endpoint, token, json=data)
+    elif method in ("GET", "DELETE"):
+        return send(method, endpoint, token)
+
+def refresh_access_token():
+    """Swap the stored refresh token for a new token pair"""
+    response = send("POST", "/auth/refresh", json={"refresh_token": st.session_state.refresh_token}, timeout=30)
+    if response.status_code != 200:
+        st.session_state.refresh_token = None
+        return False
+    data = response.json()
+    st.session_state.auth_token = data.get("access_token")
+    st.session_state.refresh_token = data.get("refresh_token")
+    return True
+
 def api_request(method, endpoint, data=None, files=None):
     """Make authenticated API request with comprehensive error handling"""
-    headers = {}
-    if st.session_state.auth_token:
-        headers["Authorization"] = f"Bearer {st.session_state.auth_token}"
-    
     try:
-        if method == "GET":
-            response = requests.get(f"http://localhost:8000{endpoint}", headers=headers, timeout=120)
-        elif method == "POST":
-            if files:
-                response = requests.post(f"http://localhost:8000{endpoint}", headers=headers, files=files, timeout=120)
-            else:
-                response = requests.post(f"http://localhost:8000{endpoint}", headers=headers, json=data, timeout=120)
-        elif method == "DELETE":
-            response = requests.delete(f"http://localhost:8000{endpoint}", headers=headers, timeout=120)
+        response = send_request(method, endpoint, data, files)
+        
+        # Access tokens are short-lived; refresh once and retry
+        if (response.status_code == 401 and st.session_state.refresh_token
+                and not endpoint.startswith("/auth/") and refresh_access_token()):
+            response = send_request(method, endpoint, data, files)
         
         return response
     except requests.exceptions.ConnectionError:
@@ -181,6 +200,30 @@ def api_request(method, endpoint, data=None, files=None):
         st.error(f"❌ Unexpected error: {e}")
         return None
 
+def cached_api_get(endpoint):
+    """GET through the shared response cache; parsed JSON, or None on failure"""
+    try:
+        try:
+            return cached_get(endpoint, st.session_state.auth_token)
+        except BackendError as e:
+            if e.status_code == 401 and st.session_state.refresh_token and refresh_access_token():
+                return cached_get(endpoint, st.session_state.auth_token)
+            raise
+    except BackendError:
+        return None
+    except requests.exceptions.ConnectionError:
+        st.error("❌ Cannot connect to backend server. Please ensure the backend is running.")
+        return None
+    except requests.exceptions.Timeout:
+        st.error("⏰ Request timed out. The server is taking too long to respond.")
+        return None
+    except requests.exceptions.RequestException as e:
+        st.error(f"🌐 Network error: {e}")
+        return None
+    except Exception as e:
+        st.error(f"❌ Unexpected error: {e}")
+        return None
+
 # Authentication functions with proper error handling
 def login_user(email, password):
     """Login user with proper error handling"""
@@ -190,6 +233,7 @@ def login_user(email, password):
         if response and response.status_code == 200:
             data = response.json()
             st.session_state.auth_token = data.get("access_token")
+            st.session_state.refresh_token = data.get("refresh_token")
             st.session_state.user = data.get("user")
             return True
         elif response and response.status_code == 401:
@@ -204,7 +248,11 @@ def login_user(email, password):
 
 def logout_user():
     """Logout user and clear session"""
+    if st.session_state.auth_token:
+        # Best effort: revoke the tokens on the server
+        api_request("POST", "/auth/logout", data={"refresh_token": st.session_state.refresh_token})
     st.session_state.auth_token = None
+    st.session_state.refresh_token = None
     st.session_state.user = None
     st.session_state.messages = []
     st.session_state.chat_sessions = {}
@@ -301,9 +349,9 @@ def load_chat_sessions_from_db():
         return
     
     try:
-        response = api_request("GET", "/chat/sessions")
-        if response and response.status_code == 200:
-            sessions_data = response.json().get("sessions", [])
+        result = cached_api_get("/chat/sessions")
+        if result is not None:
+            sessions_data = result.get("sessions", [])
             
             # Convert database format to session state format
             for session in sessions_data:
@@ -314,17 +362,26 @@ def load_chat_sessions_from_db():
                     "last_updated": session["last_updated"],
                     "title": session["title"]
                 }
+                st.session_state.saved_chats[session_id] = chat_fingerprint(session["title"], session["messages"])
             
             st.session_state.sessions_loaded = True
             print(f"Loaded {len(sessions_data)} chat sessions from database")
     except Exception as e:
         print(f"Error loading chat sessions: {e}")
 
+def chat_fingerprint(title, messages):
+    return json.dumps([title, messages], sort_keys=True)
+
 def save_chat_session_to_db(chat_id, title, messages):
     """Save chat session to database"""
     if not st.session_state.auth_token:
         return
     
+    # Switching back and forth between chats shouldn't re-post unchanged ones
+    fingerprint = chat_fingerprint(title, messages)
+    if st.session_state.saved_chats.get(chat_id) == fingerprint:
+        return
+    
     try:
         session_data = {
             "session_id": chat_id,
@@ -334,6 +391,8 @@ def save_chat_session_to_db(chat_id, title, messages):
         
         response = api_request("POST", "/chat/sessions", data=session_data)
         if response and response.status_code == 200:
+            st.session_state.saved_chats[chat_id] = fingerprint
+            invalidate("/chat/sessions")
             print(f"Saved chat session {chat_id} to database")
         else:
             print(f"Failed to save chat session {chat_id}")
@@ -348,6 +407,8 @@ def delete_chat_session_from_db(chat_id):
     try:
         response = api_request("DELETE", f"/chat/sessions/{chat_id}")
         if response and response.status_code == 200:
+            st.session_state.saved_chats.pop(chat_id, None)
+            invalidate("/chat/sessions")
             print(f"Deleted chat session {chat_id} from database")
         else:
             print(f"Failed to delete chat session {chat_id}")
@@ -415,6 +476,7 @@ with st.sidebar:
                         except Exception as e:
                             st.error(f"❌ Upload error for {uploaded_file.name}: {e}")
                 
+                invalidate("/documents", "/health")
                 st.success(f"🎉 All {len(new_files)} files processed! You can now ask questions about any content.")
         
         # Enhanced Document Management Section
@@ -422,9 +484,9 @@ with st.sidebar:
         
         # Load and display previously uploaded files from backend
         try:
-            response = api_request("GET", "/documents")
-            if response and response.status_code == 200:
-                documents_data = response.json().get("documents", [])
+            result = cached_api_get("/documents")
+            if result is not None:
+                documents_data = result.get("documents", [])
                 
                 if documents_data:
                     st.markdown("**🗂️ Previously Uploaded Files:**")
@@ -479,6 +541,7 @@ with st.sidebar:
                                     # Delete file from backend
                                     delete_response = api_request("DELETE", f"/documents/{filename}")
                                     if delete_response and delete_response.status_code == 200:
+                                        invalidate("/documents", "/health")
                                         st.success(f"✅ {filename} deleted successfully!")
                                         # Refresh the page to update the list
                                         time.sleep(1)
@@ -492,6 +555,7 @@ with st.sidebar:
                     if st.button("🗑️ Clear All Documents", type="secondary", use_container_width=True):
                         clear_response = api_request("DELETE", "/documents")
                         if clear_response and clear_response.status_code == 200:
+                            invalidate("/documents", "/health")
                             st.success("✅ All documents cleared successfully!")
                             time.sleep(1)
                             st.rerun()
@@ -758,6 +822,7 @@ if prompt := st.chat_input("Type your question here... (e.g., 'What is the 2nd s
         try:
             # Make API request
             response = api_request("POST", "/ask", data={"question": prompt})
+            invalidate("/analytics/stats", "/analytics/latency")
             
             if response and response.status_code == 200:
                 data = response.json()
@@ -1,11 +1,11 @@
 import streamlit as st
-import requests
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
 import json
-import numpy as np
+
+from api_client import BackendError, cached_get, invalidate
 
 # Page configuration
 st.set_page_config(
@@ -74,8 +74,16 @@ with st.sidebar:
     # Date range selector
     days = st.slider("Time Period (Days)", 1, 90, 30)
     
+    # Site-wide numbers are only served to admins
+    user = st.session_state.get("user") or {}
+    if user.get("role") == "admin":
+        scope = st.radio("Scope", ["user", "all"], format_func=lambda value: "My activity" if value == "user" else "All users")
+    else:
+        scope = "user"
+    
     # Refresh button
     if st.button("🔄 Refresh Data"):
+        invalidate("/analytics/stats", "/analytics/latency")
         st.rerun()
     
     st.markdown("---")
@@ -87,21 +95,28 @@ with st.sidebar:
     st.markdown("- **Success Rate**: % with context found")
 
 # Function to fetch analytics data
-def fetch_analytics_data(days=30):
+def fetch_analytics_data(days=30, scope="user"):
     try:
-        response = requests.get(f"http://localhost:8000/analytics/stats?days={days}")
-        if response.status_code == 200:
-            return response.json()
-        else:
-            st.error(f"Failed to fetch analytics: {response.status_code}")
-            return None
+        # Aggregates come precomputed from the backend's hourly/daily rollups
+        stats = cached_get(f"/analytics/stats?days={days}&scope={scope}", st.session_state.get("auth_token"))
+        return stats.get("dashboard")
+    except BackendError as e:
+        st.error(f"Failed to fetch analytics: {e.status_code}")
+        return None
     except Exception as e:
         st.error(f"Error connecting to analytics API: {e}")
         return None
 
+def fetch_latency_data():
+    """p50/p95/p99 per endpoint and stage from the backend's histograms"""
+    try:
+        return cached_get("/analytics/latency", st.session_state.get("auth_token"))
+    except Exception:
+        return None
+
 # Fetch data
 with st.spinner("📊 Loading analytics data..."):
-    data = fetch_analytics_data(days)
+    data = fetch_analytics_data(days, scope)
 
 if data:
     # Main metrics row
@@ -242,23 +257,19 @@ if data:
     # User activity heatmap
     st.markdown("### User Activity Heatmap")
     
-    # Generate sample heatmap data (replace with real data)
-    dates = pd.date_range(start=datetime.now() - timedelta(days=days), end=datetime.now(), freq='D')
+    # Hourly event counts from the rollups; hours without events are zero
+    hourly_activity = data.get('hourly_activity', {})
+    dates = pd.date_range(start=datetime.utcnow() - timedelta(days=days), end=datetime.utcnow(), freq='D')
     hours = list(range(24))
     
-    # Sample data - replace with real user activity data
     heatmap_data = []
     for date in dates:
         for hour in hours:
-            # Simulate activity based on time of day
-            if 9 <= hour <= 17:  # Business hours
-                activity = np.random.randint(5, 20)
-            else:
-                activity = np.random.randint(0, 5)
+            bucket = f"{date.strftime('%Y-%m-%d')}T{hour:02d}"
             heatmap_data.append({
                 'Date': date.strftime('%Y-%m-%d'),
                 'Hour': hour,
-                'Activity': activity
+                'Activity': hourly_activity.get(bucket, 0)
             })
     
     df_heatmap = pd.DataFrame(heatmap_data)
@@ -274,6 +285,27 @@ if data:
     fig_heatmap.update_layout(height=400)
     st.plotly_chart(fig_heatmap, use_container_width=True)
     
+    # Latency percentiles
+    latency = fetch_latency_data()
+    if latency and latency.get('latency'):
+        st.markdown("### ⏱️ Latency Percentiles")
+        
+        latency_rows = []
+        for endpoint, stages in latency['latency'].items():
+            for stage, summary in stages.items():
+                latency_rows.append({
+                    'Endpoint': endpoint,
+                    'Stage': stage,
+                    'Requests': summary['count'],
+                    'p50 (ms)': summary['p50_ms'],
+                    'p95 (ms)': summary['p95_ms'],
+                    'p99 (ms)': summary['p99_ms'],
+                    'Max (ms)': summary['max_ms']
+                })
+        
+        st.dataframe(pd.DataFrame(latency_rows), use_container_width=True)
+        st.caption(f"Merged over {len(latency.get('workers', []))} worker process(es)")
+    
     # Recent activity table
     st.markdown("### Recent Activity")
     
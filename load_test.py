@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Load Test
+=========
+Drives a running backend with concurrent authenticated users and reports
+throughput and tail latency for /ask and /upload. Start the backend with
+the fake LLM provider so the numbers measure our own stack rather than
+OpenAI:
+
+    LLM_PROVIDER=fake FAKE_LLM_LATENCY_MS=800 FAKE_LLM_TOKENS_PER_SECOND=60 \\
+    FAKE_LLM_FAILURE_RATE=0.02 python -m uvicorn backend.main:app --port 8000
+
+Each virtual user registers (or logs in as) loadtest-<n>@example.com and
+then loops until --duration runs out, sending an upload with probability
+--upload-ratio, an export-and-email request (/export/email) with
+probability --email-ratio and a question otherwise. For the email flow run
+smtp_sink.py and start the backend with EMAIL_TRANSPORT=smtp (or =file).
+Each upload also queues one background FAQ generation, which the fake
+provider answers with pairs built from the file. Add FAQ_PRECOMPUTE=false to
+leave that work out of the numbers.
+The server's own per-stage histograms (/analytics/latency) are included in
+the JSON output.
+
+Usage:
+    python load_test.py [--base-url http://localhost:8000] [--users 20]
+                        [--duration 60] [--upload-ratio 0.1] [--email-ratio 0]
+                        [--think-time 0] [--output FILE]
+"""
+
+import argparse
+import json
+import math
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+QUESTIONS = [
+    "What is the first step for 2T hammer operation?",
+    "Billet heating temperature for the induction furnace",
+    "What safety equipment must operators wear?",
+    "Trim press operating procedure",
+    "How are heating furnaces calibrated?",
+    "Die setting instruction for the tool room",
+    "Heat code traceability for supplier billets",
+    "Heat treatment process for CDF",
+]
+
+UPLOAD_WORDS = [
+    "hammer", "forging", "billet", "furnace", "heating", "temperature", "die", "press",
+    "trim", "inspection", "safety", "operator", "procedure", "calibration", "quality",
+]
+
+class VirtualUser:
+    """One authenticated client with its own connection pool"""
+
+    def __init__(self, base_url, index, password, timeout):
+        self.base_url = base_url.rstrip("/")
+        self.email = f"loadtest-{index}@example.com"
+        self.password = password
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.uploads = 0
+
+    def login(self):
+        self.session.post(f"{self.base_url}/auth/register", json={
+            "email": self.email, "password": self.password, "name": self.email.split("@")[0]
+        }, timeout=self.timeout)
+        response = self.session.post(f"{self.base_url}/auth/login", json={
+            "email": self.email, "password": self.password
+        }, timeout=self.timeout)
+        response.raise_for_status()
+        self.session.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+
+    def ask(self):
+        return self.session.post(f"{self.base_url}/ask", json={"question": random.choice(QUESTIONS)},
+                                 timeout=self.timeout)
+
+    def email_export(self):
+        return self.session.post(f"{self.base_url}/export/email", json={
+            "question": random.choice(QUESTIONS),
+            "answer": " ".join(random.choice(UPLOAD_WORDS) for _ in range(200)),
+            "source_files": ["load-test.pdf"],
+            "to_email": self.email
+        }, timeout=self.timeout)
+
+    def upload(self):
+        self.uploads += 1
+        text = " ".join(random.choice(UPLOAD_WORDS) for _ in range(400))
+        filename = f"{self.email.split('@')[0]}-{self.uploads}.txt"
+        return self.session.post(f"{self.base_url}/upload",
+                                 files={"file": (filename, text.encode(), "text/plain")},
+                                 timeout=self.timeout)
+
+class Results:
+    """Thread-safe collection of (endpoint, ok, seconds) samples"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.errors = {}
+
+    def add(self, endpoint, ok, seconds, error=None):
+        with self.lock:
+            self.samples.setdefault(endpoint, []).append((ok, seconds))
+            if error:
+                key = f"{endpoint}: {error}"
+                self.errors[key] = self.errors.get(key, 0) + 1
+
+def percentile(sorted_values, percent):
+    if not sorted_values:
+        return 0.0
+    index = max(0, int(math.ceil(len(sorted_values) * percent / 100)) - 1)
+    return sorted_values[index]
+
+def summarize(samples, elapsed):
+    latencies = sorted(seconds for _, seconds in samples)
+    failures = sum(1 for ok, _ in samples if not ok)
+    return {
+        "requests": len(samples),
+        "errors": failures,
+        "error_rate": round(failures / len(samples), 4) if samples else 0,
+        "throughput_rps": round(len(samples) / elapsed, 2) if elapsed else 0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "max_ms": round(latencies[-1] * 1000, 1) if latencies else 0,
+    }
+
+def run_user(user, deadline, upload_ratio, email_ratio, think_time, results):
+    actions = {"/upload": user.upload, "/export/email": user.email_export, "/ask": user.ask}
+    while time.time() < deadline:
+        draw = random.random()
+        endpoint = "/upload" if draw < upload_ratio else "/export/email" if draw < upload_ratio + email_ratio else "/ask"
+        start = time.perf_counter()
+        try:
+            response = actions[endpoint]()
+            ok = response.status_code in (200, 202)
+            if ok and endpoint == "/ask" and response.json().get("answer", "").startswith("Sorry,"):
+                ok = False
+            error = None if ok else f"HTTP {response.status_code}"
+            if response.status_code == 401:
+                user.login()
+        except requests.RequestException as e:
+            ok, error = False, type(e).__name__
+        results.add(endpoint, ok, time.perf_counter() - start, error)
+        if think_time:
+            time.sleep(random.expovariate(1 / think_time))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=60, help="seconds")
+    parser.add_argument("--upload-ratio", type=float, default=0.1)
+    parser.add_argument("--email-ratio", type=float, default=0)
+    parser.add_argument("--think-time", type=float, default=0, help="mean seconds between requests per user")
+    parser.add_argument("--password", default="loadtest-password")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    users = [VirtualUser(args.base_url, i, args.password, args.timeout) for i in range(args.users)]
+    print(f"Logging in {len(users)} users at {args.base_url} ...")
+    try:
+        with ThreadPoolExecutor(max_workers=min(len(users), 16)) as pool:
+            list(pool.map(lambda user: user.login(), users))
+    except requests.RequestException as e:
+        print(f"Login failed: {e}")
+        sys.exit(1)
+
+    results = Results()
+    print(f"Running for {args.duration:.0f}s ...")
+    start = time.time()
+    deadline = start + args.duration
+    threads = [threading.Thread(target=run_user, args=(user, deadline, args.upload_ratio, args.email_ratio, args.think_time, results))
+               for user in users]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+
+    all_samples = [sample for samples in results.samples.values() for sample in samples]
+    report = {
+        "config": vars(args),
+        "elapsed_seconds": round(elapsed, 2),
+        "overall": summarize(all_samples, elapsed),
+        "endpoints": {endpoint: summarize(samples, elapsed) for endpoint, samples in sorted(results.samples.items())},
+        "errors": results.errors,
+    }
+    try:
+        report["server_latency"] = users[0].session.get(f"{args.base_url}/analytics/latency", timeout=args.timeout).json()
+    except (requests.RequestException, ValueError):
+        report["server_latency"] = None
+
+    print(f"\n{'endpoint':<14} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for endpoint, row in list(report["endpoints"].items()) + [("all", report["overall"])]:
+        print(f"{endpoint:<14} {row['requests']:>9} {row['errors']:>7} {row['throughput_rps']:>8} "
+              f"{row['p50_ms']:>9} {row['p95_ms']:>9} {row['p99_ms']:>9} {row['max_ms']:>9}")
+    for error, count in sorted(results.errors.items(), key=lambda item: -item[1]):
+        print(f"  {count:>5} x {error}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Precompute FAQ Answers
+======================
+Generates the likely question/answer pairs for documents that were
+ingested before FAQ precomputation existed (new uploads are handled in the
+background by the backend). Documents whose content hash already has pairs
+are skipped unless --force is given.
+
+Generations that failed (provider error, unusable reply) are retried by the
+backend after FAQ_RETRY_SECONDS; --failed retries all of them right away.
+
+Usage:
+    python precompute_faqs.py [--db documents.db] [--user USER_ID] [--force | --failed]
+"""
+
+import argparse
+import sqlite3
+import sys
+
+sys.path.append('.')
+
+from backend.database import DocumentDatabase
+from backend.faq_cache import FAQStore
+from backend.llm_provider import get_llm_provider
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default="documents.db")
+    parser.add_argument("--user", help="only this user's documents")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--force", action="store_true", help="regenerate even if pairs exist")
+    group.add_argument("--failed", action="store_true", help="only retry documents whose generation failed")
+    args = parser.parse_args()
+
+    provider = get_llm_provider()
+    if not provider.available():
+        print(f"LLM provider '{provider.name}' is not available; set OPENAI_API_KEY or LLM_PROVIDER")
+        sys.exit(1)
+
+    # Opening a connection applies the schema (content_hash column, FAQ tables)
+    DocumentDatabase(args.db)._connect().close()
+    store = FAQStore(db_path=args.db)
+    conn = sqlite3.connect(args.db)
+    if args.failed:
+        documents = store.failed_documents(user_id=args.user)
+    elif args.user:
+        documents = conn.execute("SELECT id, filename FROM documents WHERE user_id = ? ORDER BY id", (args.user,)).fetchall()
+    else:
+        documents = conn.execute("SELECT id, filename FROM documents ORDER BY id").fetchall()
+    conn.close()
+
+    total = 0
+    for document_id, filename in documents:
+        pairs = store.generate(document_id, provider, force=args.force or args.failed)
+        total += pairs
+        print(f"{pairs:3d} pairs  {filename}" if pairs else f"  - no new pairs  {filename}")
+
+    print(f"\n{total} pairs generated for {len(documents)} documents")
+
+if __name__ == "__main__":
+    main()
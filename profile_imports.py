@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Import-Time Profiler
+====================
+Runs `python -X importtime -c "import backend.main"` in fresh interpreters,
+summarizes where the cold-start time goes, and fails when the import
+regresses past the budget:
+
+  - the median cumulative import time of the target must stay under
+    --budget-ms
+  - none of the lazily-loaded heavy libraries (parsers, exporters, database
+    drivers) may be imported just by importing the API module
+
+Usage:
+    python profile_imports.py [--module backend.main] [--runs 5] [--budget-ms 600] [--top 15]
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+# Libraries that must only load on first use
+LAZY_MODULES = [
+    "openai", "fitz", "pandas", "PIL", "pytesseract", "numpy",
+    "bcrypt", "jwt", "cryptography", "reportlab", "sendgrid", "pymongo",
+]
+
+def run_importtime(module):
+    """Return [(self_us, cumulative_us, depth, name)] for one cold import"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        print(result.stderr[-2000:])
+        raise SystemExit(f"❌ Importing {module} failed")
+
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((int(self_us), int(cumulative_us), depth, name.strip()))
+    return rows
+
+def summarize(rows, module, top):
+    """Print the slowest top-level packages by self time"""
+    by_package = defaultdict(int)
+    for self_us, _, _, name in rows:
+        by_package[name.split(".")[0]] += self_us
+
+    print(f"\nTop {top} packages by self time while importing {module}:")
+    for package, self_us in sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:top]:
+        print(f"  {package:<28} {self_us / 1000:8.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="backend.main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=600.0)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    print(f"⏱️  Profiling cold import of {args.module} ({args.runs} runs)")
+    totals = []
+    rows = []
+    for _ in range(args.runs):
+        rows = run_importtime(args.module)
+        target = [row for row in rows if row[3] == args.module]
+        totals.append(target[-1][1] / 1000 if target else 0.0)
+
+    median_ms = statistics.median(totals)
+    print(f"   cumulative import time: median {median_ms:.1f} ms "
+          f"(min {min(totals):.1f}, max {max(totals):.1f})")
+    summarize(rows, args.module, args.top)
+
+    imported = {row[3].split(".")[0] for row in rows}
+    eager = [name for name in LAZY_MODULES if name in imported]
+
+    failures = []
+    if median_ms > args.budget_ms:
+        failures.append(f"import time {median_ms:.1f} ms exceeds budget of {args.budget_ms:.0f} ms")
+    if eager:
+        failures.append(f"heavy modules imported eagerly: {', '.join(eager)}")
+
+    if failures:
+        for failure in failures:
+            print(f"❌ {failure}")
+        sys.exit(1)
+    print(f"\n✅ Within budget ({args.budget_ms:.0f} ms, no eager heavy imports)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Local SMTP Sink
+===============
+A minimal SMTP server that accepts every message and writes it to a
+directory as an .eml file, so the export-and-email flow can be exercised
+and load tested without a real mail provider. Point the backend at it with:
+
+    EMAIL_TRANSPORT=smtp EMAIL_SMTP_HOST=localhost EMAIL_SMTP_PORT=1025
+
+--delay-ms and --failure-rate make it behave like a slow or flaky provider
+so the outbox's batching, retries and backoff can be observed.
+
+Usage:
+    python smtp_sink.py [--port 1025] [--dir data/smtp_sink] [--delay-ms 0] [--failure-rate 0]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import time
+import uuid
+
+class SinkSession:
+    def __init__(self, args, stats):
+        self.args = args
+        self.stats = stats
+
+    async def handle(self, reader, writer):
+        async def reply(line):
+            writer.write(line.encode() + b"\r\n")
+            await writer.drain()
+
+        await reply("220 whf-smtp-sink ready")
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command = line.decode("utf-8", "replace").strip()
+                verb = command[:4].upper()
+                if verb in ("EHLO", "HELO"):
+                    await reply("250 whf-smtp-sink")
+                elif verb in ("MAIL", "RCPT", "RSET", "NOOP"):
+                    await reply("250 OK")
+                elif verb == "DATA":
+                    await reply("354 End data with <CR><LF>.<CR><LF>")
+                    lines = []
+                    while True:
+                        data_line = await reader.readline()
+                        if not data_line or data_line in (b".\r\n", b".\n"):
+                            break
+                        # Undo dot-stuffing
+                        lines.append(data_line[1:] if data_line.startswith(b"..") else data_line)
+                    await self.deliver(b"".join(lines), reply)
+                elif verb == "QUIT":
+                    await reply("221 Bye")
+                    break
+                else:
+                    await reply("502 Command not implemented")
+        finally:
+            writer.close()
+
+    async def deliver(self, message, reply):
+        if self.args.delay_ms:
+            await asyncio.sleep(self.args.delay_ms / 1000)
+        if random.random() < self.args.failure_rate:
+            self.stats["rejected"] += 1
+            await reply("451 Simulated temporary failure")
+            return
+        path = os.path.join(self.args.dir, f"{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}.eml")
+        with open(path, "wb") as f:
+            f.write(message)
+        self.stats["accepted"] += 1
+        await reply("250 Message accepted")
+
+async def report(stats):
+    last = dict(stats)
+    while True:
+        await asyncio.sleep(10)
+        if stats != last:
+            print(f"accepted={stats['accepted']} rejected={stats['rejected']}")
+            last = dict(stats)
+
+async def serve(args):
+    os.makedirs(args.dir, exist_ok=True)
+    stats = {"accepted": 0, "rejected": 0}
+    session = SinkSession(args, stats)
+    server = await asyncio.start_server(session.handle, args.host, args.port)
+    print(f"SMTP sink listening on {args.host}:{args.port}, writing to {args.dir}")
+    asyncio.ensure_future(report(stats))
+    async with server:
+        await server.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1025)
+    parser.add_argument("--dir", default=os.path.join("data", "smtp_sink"))
+    parser.add_argument("--delay-ms", type=float, default=0)
+    parser.add_argument("--failure-rate", type=float, default=0)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,32 @@
 #!/usr/bin/env python3
 """
 Start script for the Company AI Chatbot Backend
+
+Usage:
+    python start_backend.py                 # single process with auto-reload (development)
+    python start_backend.py --workers auto  # one worker per CPU core (production)
+    python start_backend.py --workers 4
 """
+import argparse
+import multiprocessing
 import uvicorn
 import os
 import sys
 
+def resolve_workers(value):
+    """Turn the --workers option into a process count"""
+    if value == "auto":
+        return max(1, multiprocessing.cpu_count())
+    return max(1, int(value))
+
 def main():
+    parser = argparse.ArgumentParser(description="Start the WHF AI Chatbot backend")
+    parser.add_argument("--workers", default=os.getenv("WEB_CONCURRENCY", "1"),
+                        help="number of worker processes, or 'auto' to use the CPU count")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+    workers = resolve_workers(args.workers)
+
     print("🚀 Starting Company AI Chatbot Backend...")
     print("📁 Working directory:", os.getcwd())
     
@@ -25,15 +45,19 @@ def main():
         sys.exit(1)
     
     print("✅ Environment variables loaded successfully")
-    print("🌐 Starting server on http://localhost:8000")
-    print("📖 API docs will be available at http://localhost:8000/docs")
+    print(f"🌐 Starting server on http://localhost:{args.port}")
+    print(f"📖 API docs will be available at http://localhost:{args.port}/docs")
+    if workers > 1:
+        # --reload only works with a single process
+        print(f"⚙️  Running {workers} worker processes (auto-reload disabled)")
     
     try:
         uvicorn.run(
             "backend.main:app",
             host="0.0.0.0",
-            port=8000,
-            reload=True,
+            port=args.port,
+            reload=workers == 1,
+            workers=workers,
             log_level="info"
         )
     except KeyboardInterrupt:
@@ -43,4 +67,4 @@ def main():
         sys.exit(1)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
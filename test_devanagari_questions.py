@@ -0,0 +1,32 @@
+"""
+Hindi and Marathi questions must keep their words whole when they are
+normalized: different questions must not share a coalescing key.
+
+    python -m pytest -q test_devanagari_questions.py
+    python test_devanagari_questions.py
+"""
+
+from backend.single_flight import normalize_question
+from backend.intent_router import classify_intent, GREETING, DOCUMENT
+
+def test_coalescing_keys_keep_vowel_signs():
+    assert normalize_question("दिन कितने हैं?") == "दिन कितने हैं"
+    assert normalize_question("दिन कितने हैं?") != normalize_question("दान कितने हैं?")
+    assert normalize_question("डाय को कितना गरम करना है?") != normalize_question("डाय को कितना ठंडा करना है?")
+
+def test_coalescing_keys_ignore_case_spacing_and_punctuation():
+    assert normalize_question("What is  the BILLET temperature?") == normalize_question("what is the billet temperature")
+    # Devanagari digits and invisible joiners don't split keys either
+    assert normalize_question("स्टेप ३ क्या है") == normalize_question("स्टेप 3 क्या है?")
+    assert normalize_question("क्‍या") == normalize_question("क्या")
+
+def test_intents_use_the_same_normalization():
+    assert classify_intent("Hello there!") == GREETING
+    assert classify_intent("What's your name?") == GREETING
+    assert classify_intent("What is WI-PR-06 step 3 at the company?") == DOCUMENT
+
+if __name__ == "__main__":
+    test_coalescing_keys_keep_vowel_signs()
+    test_coalescing_keys_ignore_case_spacing_and_punctuation()
+    test_intents_use_the_same_normalization()
+    print("✅ Devanagari questions keep distinct keys")
@@ -0,0 +1,54 @@
+"""
+Precomputed FAQ answers must only be served for the question they answer.
+Hindi questions that differ in one word (heat vs cool the die, coining vs
+trimming) must not match each other's pairs; an English rewording must.
+
+Runs against a fresh documents.db in a temporary directory:
+    python -m pytest -q test_faq_matching.py
+    python test_faq_matching.py
+"""
+
+import json
+import os
+import tempfile
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from backend.database import DocumentDatabase
+from backend.faq_cache import FAQStore
+
+PAIRS = [
+    {"question": "डाय को कितना गरम करना है?", "answer": "डाय को 250 °C तक गरम करें।"},
+    {"question": "कॉईनिंग के लिए तापमान कितना होना चाहिए?", "answer": "कॉईनिंग 850 °C पर करें।"},
+    {"question": "हैमर चलाने से पहले क्या चेक करना चाहिए?", "answer": "हैमर का ऑयल प्रेशर चेक करें।"},
+    {"question": "What is the billet temperature?", "answer": "Heat the billet to 1200 °C."},
+]
+
+class PairsProvider:
+    def complete(self, prompt, system=None, temperature=0.2, max_tokens=None):
+        return json.dumps(PAIRS, ensure_ascii=False)
+
+def test_near_miss_questions_do_not_match():
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "documents.db")
+        db = DocumentDatabase(db_path)
+        document_id = db.add_document("WI-FORGE.txt", "WI-FORGE.txt", 100, "txt", "faq-test-user")
+        db.add_chunks(document_id, ["Forging work instruction."])
+        store = FAQStore(db_path)
+        assert store.generate(document_id, PairsProvider()) == len(PAIRS)
+
+        # Near misses: one content word differs
+        for question in ("डाय को कितना ठंडा करना है?",
+                         "ट्रिमिंग के लिए तापमान कितना होना चाहिए?",
+                         "प्रेस चलाने से पहले क्या चेक करना चाहिए?"):
+            assert store.match(question, "faq-test-user") is None, question
+
+        # Same question, different wording
+        match = store.match("डाय कितना गरम करना है", "faq-test-user")
+        assert match and match["answer"] == PAIRS[0]["answer"]
+        match = store.match("what temperature should the billet be?", "faq-test-user")
+        assert match and match["answer"] == PAIRS[3]["answer"]
+
+if __name__ == "__main__":
+    test_near_miss_questions_do_not_match()
+    print("✅ FAQ pairs only match their own questions")
@@ -0,0 +1,80 @@
+"""
+A resumable upload is completed (and so ingested) exactly once: a concurrent
+or retried completion gets 409, a failed ingest can be retried, and the
+session can't be deleted out from under an ingest in progress.
+
+Runs against a fresh database and session directory in a temporary directory:
+    python -m pytest -q test_resumable_upload.py
+    python test_resumable_upload.py
+"""
+
+import asyncio
+import os
+import tempfile
+import threading
+
+from backend.upload_sessions import UploadSessionManager, UploadError
+
+DATA = b"Step 1: preheat the die to 250 C before loading the billet.\n" * 2000
+
+async def _body(data):
+    for i in range(0, len(data), 65536):
+        yield data[i:i + 65536]
+
+def _uploaded(tmp):
+    manager = UploadSessionManager(os.path.join(tmp, "documents.db"), os.path.join(tmp, "sessions"))
+    upload_id = manager.create("steps.txt", len(DATA), "upload-test-user")["upload_id"]
+    asyncio.run(manager.append(upload_id, "upload-test-user", 0, _body(DATA)))
+    return manager, upload_id
+
+def _status_of(call):
+    try:
+        call()
+        return 200
+    except UploadError as e:
+        return e.status_code
+
+def test_concurrent_complete_claims_once():
+    with tempfile.TemporaryDirectory() as tmp:
+        manager, upload_id = _uploaded(tmp)
+        barrier = threading.Barrier(2)
+        results = []
+
+        def complete():
+            barrier.wait()
+            try:
+                results.append(manager.complete(upload_id, "upload-test-user"))
+            except UploadError as e:
+                results.append(e.status_code)
+
+        threads = [threading.Thread(target=complete) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        winners = [result for result in results if isinstance(result, dict)]
+        assert len(winners) == 1 and results.count(409) == 1, results
+
+        # The session can't be deleted or appended to while it is ingested
+        assert _status_of(lambda: manager.abort(upload_id, "upload-test-user")) == 409
+
+        manager.finish(upload_id, winners[0]["filename"], winners[0]["claim"])
+        assert manager.status(upload_id, "upload-test-user")["completed"]
+        assert not os.path.exists(winners[0]["path"])
+        # A client retrying a slow completion is told it already happened
+        assert _status_of(lambda: manager.complete(upload_id, "upload-test-user")) == 409
+
+def test_failed_ingest_can_be_retried():
+    with tempfile.TemporaryDirectory() as tmp:
+        manager, upload_id = _uploaded(tmp)
+        first = manager.complete(upload_id, "upload-test-user")
+        manager.reopen(upload_id, first["claim"])
+        retry = manager.complete(upload_id, "upload-test-user")
+        assert retry["path"] == first["path"] and retry["sha256"] == first["sha256"]
+        with open(retry["path"], "rb") as f:
+            assert f.read() == DATA
+
+if __name__ == "__main__":
+    test_concurrent_complete_claims_once()
+    test_failed_ingest_can_be_retried()
+    print("✅ Resumable uploads complete once")
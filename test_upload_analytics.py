@@ -0,0 +1,49 @@
+"""
+One upload must count once in the analytics rollups, and /analytics/stats must
+only show site-wide numbers to admins.
+
+Runs against a fresh documents.db in a temporary directory:
+    python -m pytest -q test_upload_analytics.py
+    python test_upload_analytics.py
+"""
+
+import os
+import tempfile
+
+os.environ.setdefault("LLM_PROVIDER", "fake")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("FAQ_PRECOMPUTE", "false")
+
+from fastapi.testclient import TestClient
+
+from backend.main import app
+from backend.auth import get_current_user, get_current_user_role, UserRole
+
+def test_upload_counted_once():
+    previous = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            app.dependency_overrides[get_current_user] = lambda: "analytics-test-user"
+            app.dependency_overrides[get_current_user_role] = lambda: UserRole.STANDARD
+            client = TestClient(app)
+
+            content = b"Step 1: heat the billet in the furnace to forging temperature.\n" * 20
+            response = client.post("/upload", files={"file": ("upload-count.txt", content, "text/plain")})
+            assert response.status_code == 200, response.text
+
+            stats = client.get("/analytics/stats?days=1").json()
+            assert stats["scope"] == "user"
+            assert stats["total_documents"] == 1
+            assert stats["dashboard"]["file_uploads"] == 1
+            assert stats["dashboard"]["file_types"] == {"txt": 1}
+
+            # Standard users don't get site-wide numbers
+            assert client.get("/analytics/stats?scope=all").status_code == 403
+        finally:
+            app.dependency_overrides.clear()
+            os.chdir(previous)
+
+if __name__ == "__main__":
+    test_upload_counted_once()
+    print("✅ One upload counted once")